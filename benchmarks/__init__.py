@@ -0,0 +1,19 @@
+import importlib.util
+import pathlib
+import sys
+
+script_path = pathlib.Path(__file__).resolve().parents[1] / "crossplatform-arbot.py"
+
+
+def load_arbot():
+    # Loaded by path like tests/conftest.py does, and under the same module name.
+    if "arbot" in sys.modules:
+        return sys.modules["arbot"]
+    spec = importlib.util.spec_from_file_location("arbot", script_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["arbot"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+arbot = load_arbot()
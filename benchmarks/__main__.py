@@ -0,0 +1,43 @@
+import json
+import sys
+
+from benchmarks.micro import micro_benchmarks
+from benchmarks.suite import compare_benchmark_results, run_benchmark_suite, run_benchmark_sweep, \
+    write_benchmark_results
+
+usage = f"""usage: python -m benchmarks suite <out.json> [sweep]
+       python -m benchmarks compare <baseline.json> <current.json>
+       python -m benchmarks <name> [key=value ...]
+
+names: {", ".join(micro_benchmarks)}
+values are JSON where they parse as JSON; @path passes the file's bytes."""
+
+
+def parse_argument(argument):
+    key, _, value = argument.partition("=")
+    if value.startswith("@"):
+        with open(value[1:], "rb") as f:
+            return key, f.read()
+    try:
+        return key, json.loads(value)
+    except ValueError:
+        return key, value
+
+
+def main(argv):
+    if len(argv) >= 2 and argv[0] == "suite":
+        results = run_benchmark_sweep() if argv[2:3] == ["sweep"] else run_benchmark_suite()
+        print(json.dumps(results, indent=2))
+        write_benchmark_results(results, argv[1])
+    elif len(argv) == 3 and argv[0] == "compare":
+        print(json.dumps(compare_benchmark_results(argv[1], argv[2]), indent=2))
+    elif argv and argv[0] in micro_benchmarks:
+        print(json.dumps(micro_benchmarks[argv[0]](**dict(map(parse_argument, argv[1:]))), indent=2))
+    else:
+        print(usage)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
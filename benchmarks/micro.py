@@ -0,0 +1,531 @@
+import asyncio
+import functools
+import json
+import math
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from decimal import Decimal, ROUND_CEILING, ROUND_FLOOR
+
+import numpy as np
+
+from benchmarks import arbot
+from benchmarks.synthetic import make_alltickers_payload, make_synthetic_market, make_synthetic_venue_tickers
+
+
+def benchmark_price_matrix(n_pairs=500, rounds=100, seed=0):
+    mapping, payloads = make_synthetic_venue_tickers(n_pairs, seed=seed)
+    price_matrix = arbot.PriceMatrix(mapping, mapping=mapping)
+    for venue, payload in payloads.items():
+        price_matrix.update(venue, payload)
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        price_matrix.update("Binance", payloads["Binance"])
+    update_seconds = (time.perf_counter() - start) / rounds
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        opportunities = price_matrix.top_k(min_edge=0)
+    rank_seconds = (time.perf_counter() - start) / rounds
+
+    return {
+        "pairs": n_pairs,
+        "venues": len(price_matrix.venues),
+        "update_seconds": update_seconds,
+        "rank_seconds": rank_seconds,
+        "opportunities": len(opportunities),
+    }
+
+
+def benchmark_cycle_detector(n_bases=60, venues=("Kucoin", "OKX"), max_length=4, touched_fraction=0.01, seed=0):
+    prices, _ = make_synthetic_market(n_bases, seed=seed)
+    rng = random.Random(seed)
+    detector = arbot.LogRateCycleDetector(max_length=max_length, mapping={})
+    rows = [(x['symbol'], float(x['buy']), float(x['sell'])) for x in prices['data']['ticker']]
+    for venue in venues:
+        for pair, bid, ask in rows:
+            jitter = rng.uniform(0.998, 1.002)
+            detector.update_pair(venue, pair, bid * jitter, ask * jitter, [])
+
+    start = time.perf_counter()
+    exhaustive = arbot.enumerate_log_rate_cycles(detector)
+    exhaustive_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    full = detector.detect()
+    full_seconds = time.perf_counter() - start
+
+    touched = []
+    for pair, bid, ask in rng.sample(rows, max(1, int(len(rows) * touched_fraction))):
+        jitter = rng.uniform(0.99, 1.01)
+        detector.update_pair(venues[0], pair, bid * jitter, ask * jitter, touched)
+    start = time.perf_counter()
+    incremental = detector.detect(touched)
+    incremental_seconds = time.perf_counter() - start
+
+    best_exhaustive = math.exp(-exhaustive[0][0]) - 1 if exhaustive else 0
+    return {
+        "nodes": len(detector.nodes),
+        "edges": len(detector.edge_legs),
+        "exhaustive_cycles": len(exhaustive),
+        "exhaustive_seconds": exhaustive_seconds,
+        "detected_cycles": len(full),
+        "detect_seconds": full_seconds,
+        "best_matches": bool(full) == bool(exhaustive) and
+                        (not full or abs(full[0]['profit_loss'] - best_exhaustive) < 1e-12),
+        "touched_edges": len(touched),
+        "incremental_cycles": len(incremental),
+        "incremental_seconds": incremental_seconds,
+    }
+
+
+def benchmark_ticker_decoding(payload=None, watched=300, rounds=20, seed=0):
+    # Parse time and peak allocation per allTickers body, from the current
+    # json-then-dict path through each available raw-bytes decoder. payload
+    # can be a recorded body from record_ticker_payload_fixture.
+    payload = payload or make_alltickers_payload(seed=seed)
+    symbols = [x['symbol'] for x in json.loads(payload)['data']['ticker']]
+    rng = random.Random(seed)
+    snapshot = arbot.TickerSnapshot(rng.sample(symbols, min(watched, len(symbols))))
+
+    decoders = {"json_dict": lambda: snapshot.update(json.loads(payload))}
+    available = {"json": True, "orjson": arbot.orjson is not None, "msgspec": arbot.msgspec is not None, "scan": True}
+    for decoder, installed in available.items():
+        if installed:
+            decoders[decoder] = functools.partial(snapshot.load_payload, payload, decoder)
+
+    decoders["json_dict"]()
+    expected_bids = np.array(snapshot.bids)
+    results = {"bytes": len(payload), "rows": len(symbols), "watched": len(snapshot.symbol_index)}
+    for name, decode in decoders.items():
+        decode()
+        matches = bool(np.array_equal(np.array(snapshot.bids), expected_bids, equal_nan=True))
+        start = time.perf_counter()
+        for _ in range(rounds):
+            decode()
+        seconds = (time.perf_counter() - start) / rounds
+        tracemalloc.start()
+        decode()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results[name] = {"seconds": seconds, "peak_bytes": peak, "matches": matches}
+    return results
+
+
+def benchmark_sharded_detection(n_bases=3400, workers_list=(1, 2, 4, 8), ticks=20, seed=0):
+    # Full re-scores per tick, so the numbers show raw scoring throughput
+    # rather than the incremental path's sparse-update savings.
+    prices, structured_pairs = make_synthetic_market(n_bases, seed=seed)
+    snapshot = arbot.TickerSnapshot(x['symbol'] for x in prices['data']['ticker'])
+    arbot.index_triangular_pairs(structured_pairs, snapshot)
+    snapshot.update(prices)
+
+    surface_engine = arbot.SurfaceRateEngine(structured_pairs, snapshot)
+    start = time.perf_counter()
+    for _ in range(ticks):
+        surface_engine.invalidate()
+        expected = surface_engine.top_k(snapshot, min_rate=arbot.profit_threshold)
+    in_process_seconds = (time.perf_counter() - start) / ticks
+    results = [{"workers": 0, "tick_seconds": in_process_seconds,
+                "triangles_per_second": len(structured_pairs) / in_process_seconds, "matches": True}]
+
+    for workers in workers_list:
+        detector = arbot.ShardedSurfaceDetector(structured_pairs, snapshot, workers=workers)
+        try:
+            detector.top_k(snapshot)
+            start = time.perf_counter()
+            for _ in range(ticks):
+                top = detector.top_k(snapshot)
+            tick_seconds = (time.perf_counter() - start) / ticks
+        finally:
+            detector.close()
+        results.append({
+            "workers": workers,
+            "tick_seconds": tick_seconds,
+            "triangles_per_second": len(structured_pairs) / tick_seconds,
+            "matches": sorted(arb['profit_loss_perc'] for arb in top) ==
+                       sorted(arb['profit_loss_perc'] for arb in expected),
+        })
+    return results
+
+
+def benchmark_latency_metrics(spans=100000):
+    # Per-span cost of instrumentation, enabled and switched off.
+    results = {}
+    for enabled in (True, False):
+        metrics = arbot.LatencyMetrics(enabled=enabled)
+        start = time.perf_counter()
+        for _ in range(spans):
+            started = time.perf_counter_ns()
+            metrics.observe("stage", started)
+        results["enabled_ns" if enabled else "disabled_ns"] = (time.perf_counter() - start) / spans * 1e9
+
+    start = time.perf_counter()
+    for _ in range(spans):
+        time.perf_counter_ns()
+    results["baseline_ns"] = (time.perf_counter() - start) / spans * 1e9
+    return results
+
+
+def benchmark_event_log(records=100000, batch=1000, path=None):
+    # Caller-side cost of one event against a print() to /dev/null. log_ns
+    # drains every `batch` records as the writer thread does; backlog_log_ns
+    # holds all of them, as when the writer falls behind, and full_log_ns is
+    # the drop path once the ring is full. The flush encodes and writes the
+    # backlog to a real file, a temporary one by default.
+    with tempfile.TemporaryDirectory() as directory:
+        results = {}
+        log = arbot.EventLog(path=path or os.path.join(directory, "events.jsonl"), capacity=records,
+                             backups=0, echo=False)
+        seconds = 0.0
+        for first in range(0, records, batch):
+            start = time.perf_counter()
+            for i in range(first, min(first + batch, records)):
+                log.log("info", "execute", "order_placed", venue="OKX", symbol="BTC-USDT", order_id=i, size=0.01,
+                        price=65000.0)
+            seconds += time.perf_counter() - start
+            log.drain()
+        results["log_ns"] = seconds / records * 1e9
+
+        start = time.perf_counter()
+        for i in range(records):
+            log.log("info", "execute", "order_placed", venue="OKX", symbol="BTC-USDT", order_id=i, size=0.01,
+                    price=65000.0)
+        results["backlog_log_ns"] = (time.perf_counter() - start) / records * 1e9
+
+        start = time.perf_counter()
+        for i in range(records):
+            log.log("info", "execute", "order_placed", venue="OKX", symbol="BTC-USDT", order_id=i, size=0.01,
+                    price=65000.0)
+        results["full_log_ns"] = (time.perf_counter() - start) / records * 1e9
+        results["dropped"] = log.dropped
+
+        start = time.perf_counter()
+        log.flush()
+        results["flush_records_per_second"] = records / (time.perf_counter() - start)
+        results["flush_bytes"] = log.file.tell()
+        log.close()
+
+    # print_flush_ns is what a console or line-buffered pipe costs: one write per line.
+    with open(os.devnull, 'w') as devnull:
+        for key, flush in (("print_ns", False), ("print_flush_ns", True)):
+            start = time.perf_counter()
+            for i in range(records):
+                print(f"Executed buy order on OKX for BTC-USDT: {i}", file=devnull, flush=flush)
+            results[key] = (time.perf_counter() - start) / records * 1e9
+    return results
+
+
+def benchmark_ticker_snapshot(n_bases=400, rounds=3, seed=0):
+    prices, structured_pairs = make_synthetic_market(n_bases, seed=seed)
+    snapshot = arbot.TickerSnapshot(x['symbol'] for x in prices['data']['ticker'])
+    arbot.index_triangular_pairs(structured_pairs, snapshot)
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for t_pair in structured_pairs:
+            arbot.get_price_for_t_pair(t_pair, prices)
+    scan_seconds = (time.perf_counter() - start) / rounds
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        snapshot.update(prices)
+        for t_pair in structured_pairs:
+            arbot.get_price_for_t_pair(t_pair, snapshot)
+    indexed_seconds = (time.perf_counter() - start) / rounds
+
+    return {
+        "symbols": len(prices['data']['ticker']),
+        "triangles": len(structured_pairs),
+        "scan_seconds": scan_seconds,
+        "indexed_seconds": indexed_seconds,
+        "speedup": scan_seconds / indexed_seconds if indexed_seconds else 0,
+    }
+
+
+def benchmark_structure_triangular_pairs(n_pairs=2000, nested_pairs=150, seed=0):
+    prices, _ = make_synthetic_market(n_pairs // 3, seed=seed)
+    coin_list = [x['symbol'] for x in prices['data']['ticker']][:n_pairs]
+
+    start = time.perf_counter()
+    structured_pairs = arbot.structure_triangular_pairs(coin_list)
+    graph_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    nested = arbot.structure_triangular_pairs_nested(coin_list[:nested_pairs])
+    nested_seconds = time.perf_counter() - start
+
+    return {
+        "pairs": len(coin_list),
+        "triangles": len(structured_pairs),
+        "graph_seconds": graph_seconds,
+        "nested_pairs": nested_pairs,
+        "nested_seconds": nested_seconds,
+        "nested_matches": nested == arbot.structure_triangular_pairs(coin_list[:nested_pairs]),
+    }
+
+
+def benchmark_trade_size_solver(levels_list=(50, 500), books=200, seed=0):
+    # Merged breakpoint pass against a dense grid of depth walks over the same
+    # three books; the grid's best input is the reference the solver must reach.
+    rng = random.Random(seed)
+    results = []
+    for levels in levels_list:
+        cases = []
+        for i in range(books):
+            # USDT -> BTC -> ETH -> USDT with a leg-3 premium that decays into the book.
+            edge = rng.uniform(0.001, 0.01)
+            cases.append([
+                (arbot.SortedOrderBook.from_levels(arbot.make_synthetic_orderbook(60000.0, levels, tick=1.0, seed=seed + 3 * i)),
+                 'buy', arbot.kucoin_fee_rate),
+                (arbot.SortedOrderBook.from_levels(arbot.make_synthetic_orderbook(0.05, levels, tick=0.00001, seed=seed + 3 * i + 1)),
+                 'buy', arbot.binance_fee_rate),
+                (arbot.SortedOrderBook.from_levels(arbot.make_synthetic_orderbook(3000.0 * (1 + edge), levels, tick=0.05,
+                                                                      seed=seed + 3 * i + 2)),
+                 'sell', arbot.okx_fee_rate)
+            ])
+
+        start = time.perf_counter()
+        solutions = [arbot.solve_trade_size(legs) for legs in cases]
+        solver_seconds = (time.perf_counter() - start) / books
+
+        grid_points = 200
+        worst_gap = 0.0
+        start = time.perf_counter()
+        for legs, solution in zip(cases, solutions):
+            capacity = legs[0][0].side('buy').fill_notional(float('inf'))[1]
+            best = 0.0
+            for j in range(1, grid_points + 1):
+                acquired = amount_in = capacity * j / grid_points
+                for orderbook, direction, fee_rate in legs:
+                    acquired = arbot.walk_depth(orderbook, direction, acquired, fee_rate)[1]
+                best = max(best, acquired - amount_in)
+            worst_gap = max(worst_gap, best - solution["profit"])
+        grid_seconds = (time.perf_counter() - start) / books
+
+        results.append({
+            "levels": levels,
+            "solver_seconds": solver_seconds,
+            "grid_seconds": grid_seconds,
+            "grid_points": grid_points,
+            "mean_breakpoints": sum(solution["breakpoints"] for solution in solutions) / books,
+            "profitable": sum(solution["profit"] > 0 for solution in solutions),
+            "worst_profit_gap": worst_gap,
+            "speedup": grid_seconds / solver_seconds if solver_seconds else 0,
+        })
+    return results
+
+
+def benchmark_sorted_orderbook(levels_list=(50, 500), queries=2000, seed=0):
+    rng = random.Random(seed)
+    results = []
+    for levels in levels_list:
+        orderbook = arbot.make_synthetic_orderbook(100.0, levels, seed=seed)
+        amounts = [rng.uniform(0.01, levels * 2.5) for _ in range(queries)]
+
+        start = time.perf_counter()
+        for amount in amounts:
+            arbot.simulate_fills(orderbook, 'buy', amount)
+        levels_seconds = (time.perf_counter() - start) / queries
+
+        start = time.perf_counter()
+        book = arbot.SortedOrderBook.from_levels(orderbook)
+        load_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for amount in amounts:
+            arbot.simulate_fills(book, 'buy', amount)
+        sorted_seconds = (time.perf_counter() - start) / queries
+
+        start = time.perf_counter()
+        for i in range(queries):
+            book.asks.upsert(100.0 + 0.01 * rng.randint(1, levels), rng.choice((0.0, 1.0)))
+            book.asks.fill(1.0)
+        update_seconds = (time.perf_counter() - start) / queries
+
+        results.append({
+            "levels": levels,
+            "levels_fill_seconds": levels_seconds,
+            "sorted_load_seconds": load_seconds,
+            "sorted_fill_seconds": sorted_seconds,
+            "sorted_update_and_fill_seconds": update_seconds,
+            "speedup": levels_seconds / sorted_seconds if sorted_seconds else 0,
+        })
+    return results
+
+
+def benchmark_event_loop_lag(calls=10, call_seconds=0.02):
+    def blocking_call():
+        time.sleep(call_seconds)
+
+    async def measure(via_executor):
+        monitor = arbot.EventLoopLagMonitor(interval=0.005)
+        task = asyncio.create_task(monitor.run())
+        await asyncio.sleep(0.02)
+        start = time.perf_counter()
+        if via_executor:
+            await asyncio.gather(*(arbot.run_blocking(blocking_call) for _ in range(calls)))
+        else:
+            for _ in range(calls):
+                blocking_call()
+                await asyncio.sleep(0)
+        elapsed = time.perf_counter() - start
+        await asyncio.sleep(0.02)
+        task.cancel()
+        return dict(monitor.summary(), elapsed=elapsed)
+
+    return {
+        "blocking": asyncio.run(measure(False)),
+        "executor": asyncio.run(measure(True)),
+    }
+
+
+def benchmark_order_quantization(orders=100000, seed=0):
+    # Per-order cost of snapping size and price, and how many of the same
+    # orders the old str(float) payloads would have sent off the venue grid.
+    rng = random.Random(seed)
+    instrument = arbot.Instrument("Test", "T", "0.01", "0.00001", "0.00001", 10)
+    orders_ = [(rng.choice(('buy', 'sell')), rng.uniform(0.001, 2), rng.uniform(20000, 80000))
+               for _ in range(orders)]
+
+    start = time.perf_counter()
+    for side, size, price in orders_:
+        instrument.order_fields(side, size, price)
+    quantizer_seconds = (time.perf_counter() - start) / orders
+
+    tick, lot = Decimal("0.01"), Decimal("0.00001")
+    start = time.perf_counter()
+    for side, size, price in orders_:
+        str(Decimal(repr(size)).quantize(lot, rounding=ROUND_FLOOR))
+        str(Decimal(repr(price)).quantize(tick, rounding=ROUND_CEILING if side == 'sell' else ROUND_FLOOR))
+    decimal_seconds = (time.perf_counter() - start) / orders
+
+    off_grid = sum(bool(Decimal(str(size)) % lot or Decimal(str(price)) % tick) for side, size, price in orders_)
+
+    tracemalloc.start()
+    for side, size, price in orders_[:1000]:
+        instrument.order_fields(side, size, price)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "orders": orders,
+        "quantizer_seconds": quantizer_seconds,
+        "decimal_seconds": decimal_seconds,
+        "quantizer_peak_bytes_per_1000": peak,
+        "raw_off_grid_fraction": off_grid / orders,
+    }
+
+
+def compare_surface_engine(structured_pairs, prices_json):
+    snapshot = arbot.TickerSnapshot(t_pair[pair] for t_pair in structured_pairs
+                              for pair in ('pair_a', 'pair_b', 'pair_c'))
+    arbot.index_triangular_pairs(structured_pairs, snapshot)
+    snapshot.update(prices_json)
+    surface_engine = arbot.SurfaceRateEngine(structured_pairs, snapshot)
+    perc = surface_engine.compute(snapshot)
+
+    mismatches = []
+    for i, t_pair in enumerate(structured_pairs):
+        expected = arbot.cal_triangular_arb_surface_rate(t_pair, arbot.get_price_for_t_pair(t_pair, prices_json))
+        if perc[i, 0] > 0:
+            actual = surface_engine.surface_dict(2 * i)
+        elif perc[i, 1] > 0:
+            actual = surface_engine.surface_dict(2 * i + 1)
+        else:
+            actual = {}
+        if actual != expected:
+            mismatches.append((t_pair['combined'], expected, actual))
+    return mismatches
+
+
+def benchmark_incremental_surface(n_bases=3400, changed_per_tick=20, ticks=20, min_rate=arbot.profit_threshold, seed=0):
+    prices, structured_pairs = make_synthetic_market(n_bases, seed=seed)
+    rng = random.Random(seed)
+    snapshot = arbot.TickerSnapshot(x['symbol'] for x in prices['data']['ticker'])
+    arbot.index_triangular_pairs(structured_pairs, snapshot)
+    snapshot.update(prices)
+    surface_engine = arbot.SurfaceRateEngine(structured_pairs, snapshot)
+    surface_engine.top_k(snapshot, min_rate=min_rate)
+
+    full_seconds = incremental_seconds = 0.0
+    mismatches = 0
+    evaluated = []
+    for _ in range(ticks):
+        for x in rng.sample(prices['data']['ticker'], changed_per_tick):
+            move = rng.uniform(0.995, 1.005)
+            x['buy'] = repr(float(x['buy']) * move)
+            x['sell'] = repr(float(x['sell']) * move)
+        snapshot.update(prices)
+
+        start = time.perf_counter()
+        top = surface_engine.top_k(snapshot, min_rate=min_rate)
+        incremental_seconds += time.perf_counter() - start
+        evaluated.append(surface_engine.evaluated)
+
+        start = time.perf_counter()
+        surface_engine.invalidate()
+        full_top = surface_engine.top_k(snapshot, min_rate=min_rate)
+        full_seconds += time.perf_counter() - start
+        mismatches += top != full_top
+
+    return {
+        "triangles": len(structured_pairs),
+        "changed_per_tick": changed_per_tick,
+        "evaluated_per_tick": sum(evaluated) / ticks,
+        "full_seconds": full_seconds / ticks,
+        "incremental_seconds": incremental_seconds / ticks,
+        "mismatches": mismatches,
+    }
+
+
+def benchmark_surface_engine(n_bases=3400, rounds=3, seed=0):
+    prices, structured_pairs = make_synthetic_market(n_bases, seed=seed)
+    snapshot = arbot.TickerSnapshot(x['symbol'] for x in prices['data']['ticker'])
+    arbot.index_triangular_pairs(structured_pairs, snapshot)
+    snapshot.update(prices)
+    surface_engine = arbot.SurfaceRateEngine(structured_pairs, snapshot)
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        scalar_hits = 0
+        for t_pair in structured_pairs:
+            if arbot.cal_triangular_arb_surface_rate(t_pair, arbot.get_price_for_t_pair(t_pair, snapshot)):
+                scalar_hits += 1
+    scalar_seconds = (time.perf_counter() - start) / rounds
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        surface_engine.invalidate()
+        top = surface_engine.top_k(snapshot)
+    vector_seconds = (time.perf_counter() - start) / rounds
+
+    return {
+        "triangles": len(structured_pairs),
+        "profitable": scalar_hits,
+        "top_k": len(top),
+        "mismatches": len(compare_surface_engine(structured_pairs, prices)),
+        "scalar_seconds": scalar_seconds,
+        "vector_seconds": vector_seconds,
+        "speedup": scalar_seconds / vector_seconds if vector_seconds else 0,
+    }
+
+
+micro_benchmarks = {
+    "price_matrix": benchmark_price_matrix,
+    "cycle_detector": benchmark_cycle_detector,
+    "ticker_decoding": benchmark_ticker_decoding,
+    "sharded_detection": benchmark_sharded_detection,
+    "latency_metrics": benchmark_latency_metrics,
+    "event_log": benchmark_event_log,
+    "ticker_snapshot": benchmark_ticker_snapshot,
+    "structure_triangular_pairs": benchmark_structure_triangular_pairs,
+    "trade_size_solver": benchmark_trade_size_solver,
+    "sorted_orderbook": benchmark_sorted_orderbook,
+    "event_loop_lag": benchmark_event_loop_lag,
+    "order_quantization": benchmark_order_quantization,
+    "incremental_surface": benchmark_incremental_surface,
+    "surface_engine": benchmark_surface_engine,
+}
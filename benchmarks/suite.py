@@ -0,0 +1,196 @@
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import time
+
+import numpy as np
+
+from benchmarks import arbot
+from benchmarks.synthetic import SyntheticBookSource, make_market_updates, make_synthetic_exchange
+
+
+def benchmark_detection_cycle(exchange, update_fraction=0.05, ticks=20, seed=0):
+    # Full tick: snapshot update, incremental surface scoring and depth
+    # confirmation against generated books on all three venues.
+    structured_pairs = arbot.structure_triangular_pairs(exchange['coin_list'])
+    snapshot = arbot.TickerSnapshot(exchange['coin_list'])
+    arbot.index_triangular_pairs(structured_pairs, snapshot)
+    surface_engine = arbot.SurfaceRateEngine(structured_pairs, snapshot)
+
+    mapping = {symbol: {"Kucoin": symbol, "Binance": symbol.replace('-', ''), "OKX": f"{symbol}-SWAP"}
+               for symbol in exchange['coin_list']}
+    books = {}
+    for symbol, venues in mapping.items():
+        for venue, venue_symbol in venues.items():
+            books[(venue, venue_symbol)] = arbot.SortedOrderBook.from_levels(exchange['books'][symbol])
+    balances = {venue: {currency: 1000 / value for currency, value in exchange['usd_value'].items()}
+                for venue in arbot.gateways}
+
+    saved_streams = arbot.order_book_streams
+    saved_ledger = arbot.balance_ledger
+    saved_mapping = dict(arbot.symbol_mapping)
+    saved_pairs = dict(arbot.venue_symbol_pairs)
+    arbot.symbol_mapping.update(mapping)
+    arbot.venue_symbol_pairs.clear()
+    arbot.order_book_streams = SyntheticBookSource(books)
+    arbot.balance_ledger = arbot.BalanceLedger(balances)
+
+    async def run():
+        hits = confirmed = 0
+        seconds = 0.0
+        for prices in make_market_updates(exchange['prices'], update_fraction, ticks, seed):
+            start = time.perf_counter()
+            surface_arbs = arbot.score_tick(prices, snapshot, surface_engine)
+            if surface_arbs:
+                confirmed += len(await arbot.confirm_surface_opportunities(surface_arbs))
+            seconds += time.perf_counter() - start
+            hits += len(surface_arbs)
+        return seconds / ticks, hits, confirmed
+
+    try:
+        cycle_seconds, hits, confirmed = asyncio.run(run())
+    finally:
+        arbot.order_book_streams = saved_streams
+        arbot.balance_ledger = saved_ledger
+        arbot.symbol_mapping.clear()
+        arbot.symbol_mapping.update(saved_mapping)
+        arbot.venue_symbol_pairs.clear()
+        arbot.venue_symbol_pairs.update(saved_pairs)
+    return {"triangles": len(structured_pairs), "detection_cycle_seconds": cycle_seconds,
+            "surface_hits": hits, "confirmed": confirmed}
+
+
+def run_benchmark_suite(n_currencies=60, n_pairs=400, depth=50, update_fraction=0.05, ticks=20,
+                        fill_queries=2000, sample_triangles=2000, nested_max_pairs=150, seed=0):
+    # Offline, seeded timings for the detection and fill-simulation hot paths.
+    # Whole-universe costs for the per-triangle functions are extrapolated from
+    # a sample so large sizes stay quick; the nested O(n^3) enumeration is
+    # skipped above nested_max_pairs.
+    rng = random.Random(seed)
+    exchange = make_synthetic_exchange(n_currencies, n_pairs, depth, seed=seed)
+    prices = exchange['prices']
+    coin_list = exchange['coin_list']
+    results = {"n_currencies": n_currencies, "n_pairs": len(coin_list), "depth": depth,
+               "update_fraction": update_fraction, "ticks": ticks, "seed": seed}
+
+    start = time.perf_counter()
+    structured_pairs = arbot.structure_triangular_pairs(coin_list)
+    results["structure_graph_seconds"] = time.perf_counter() - start
+    results["triangles"] = len(structured_pairs)
+    results["structure_nested_seconds"] = None
+    if len(coin_list) <= nested_max_pairs:
+        start = time.perf_counter()
+        arbot.structure_triangular_pairs_nested(coin_list)
+        results["structure_nested_seconds"] = time.perf_counter() - start
+
+    sample = rng.sample(structured_pairs, min(sample_triangles, len(structured_pairs)))
+    scale = len(structured_pairs) / len(sample) if sample else 0
+    snapshot = arbot.TickerSnapshot(coin_list)
+    arbot.index_triangular_pairs(structured_pairs, snapshot)
+    snapshot.update(prices)
+
+    start = time.perf_counter()
+    prices_dicts = [arbot.get_price_for_t_pair(t_pair, prices) for t_pair in sample]
+    results["price_scan_seconds"] = (time.perf_counter() - start) * scale
+
+    start = time.perf_counter()
+    for t_pair in sample:
+        arbot.get_price_for_t_pair(t_pair, snapshot)
+    results["price_indexed_seconds"] = (time.perf_counter() - start) * scale
+
+    start = time.perf_counter()
+    for t_pair, prices_dict in zip(sample, prices_dicts):
+        arbot.cal_triangular_arb_surface_rate(t_pair, prices_dict)
+    results["surface_rate_seconds"] = (time.perf_counter() - start) * scale
+
+    start = time.perf_counter()
+    surface_engine = arbot.SurfaceRateEngine(structured_pairs, snapshot)
+    surface_engine.top_k(snapshot, min_rate=arbot.profit_threshold)
+    results["surface_engine_full_seconds"] = time.perf_counter() - start
+
+    levels = exchange['books'][coin_list[0]]
+    book = arbot.SortedOrderBook.from_levels(levels)
+    depth_size = sum(float(quantity) for price, quantity in levels['asks'])
+    amounts = [rng.uniform(0, depth_size) for _ in range(fill_queries)]
+    start = time.perf_counter()
+    for amount in amounts:
+        arbot.simulate_fills(levels, 'buy', amount)
+    results["simulate_fills_levels_seconds"] = (time.perf_counter() - start) / fill_queries
+    start = time.perf_counter()
+    for amount in amounts:
+        arbot.simulate_fills(book, 'buy', amount)
+    results["simulate_fills_sorted_seconds"] = (time.perf_counter() - start) / fill_queries
+
+    cycle = benchmark_detection_cycle(exchange, update_fraction, ticks, seed)
+    results.update({key: value for key, value in cycle.items() if key != "triangles"})
+    return results
+
+
+benchmark_timing_keys = ("structure_graph_seconds", "structure_nested_seconds", "price_scan_seconds",
+                         "price_indexed_seconds", "surface_rate_seconds", "surface_engine_full_seconds",
+                         "simulate_fills_levels_seconds", "simulate_fills_sorted_seconds",
+                         "detection_cycle_seconds")
+
+
+def run_benchmark_sweep(sizes=((20, 60), (30, 120), (40, 200), (80, 600), (160, 2000), (320, 6000)),
+                        budget_seconds=0.1, **kwargs):
+    # The suite at growing (currencies, pairs). Each timing gets a log-log
+    # slope against pair count (about 2 for O(n^2), 3 for O(n^3)) and the first
+    # size where it no longer fits one poll interval (budget_seconds).
+    runs = [run_benchmark_suite(n_currencies, n_pairs, **kwargs) for n_currencies, n_pairs in sizes]
+    scaling = {}
+    for key in benchmark_timing_keys:
+        points = [(math.log(run["n_pairs"]), math.log(run[key])) for run in runs if run.get(key)]
+        exponent = None
+        if len(points) > 1:
+            mean_x = sum(x for x, y in points) / len(points)
+            mean_y = sum(y for x, y in points) / len(points)
+            variance = sum((x - mean_x) ** 2 for x, y in points)
+            if variance:
+                exponent = sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+        over = next(([run["n_currencies"], run["n_pairs"]] for run in runs
+                     if run.get(key) and run[key] > budget_seconds), None)
+        scaling[key] = {"exponent": exponent, "over_budget_at": over}
+    return {"runs": runs, "scaling": scaling, "budget_seconds": budget_seconds}
+
+
+def benchmark_environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "numpy": np.__version__,
+            "machine": platform.machine(), "cpus": os.cpu_count(), "created_at": time.time()}
+
+
+def write_benchmark_results(results, path):
+    with open(path, 'w') as f:
+        json.dump({"environment": benchmark_environment(), "results": results}, f, indent=2, sort_keys=True)
+    return path
+
+
+def compare_benchmark_results(baseline_path, current_path, tolerance=0.1):
+    # Timings that moved by more than `tolerance` between two result files,
+    # matched by run size and key.
+    def timings(path):
+        with open(path) as f:
+            results = json.load(f)["results"]
+        runs = results["runs"] if "runs" in results else [results]
+        return {(run["n_currencies"], run["n_pairs"], key): run[key]
+                for run in runs for key in benchmark_timing_keys if run.get(key)}
+
+    baseline = timings(baseline_path)
+    current = timings(current_path)
+    changes = {"regressions": [], "improvements": []}
+    for name in sorted(baseline.keys() & current.keys()):
+        ratio = current[name] / baseline[name]
+        if ratio > 1 + tolerance:
+            changes["regressions"].append((*name, baseline[name], current[name], ratio))
+        elif ratio < 1 - tolerance:
+            changes["improvements"].append((*name, baseline[name], current[name], ratio))
+    return changes
@@ -0,0 +1,165 @@
+import json
+import random
+import time
+
+from benchmarks import arbot
+
+
+def make_synthetic_market(n_bases, quotes=("USDT", "BTC", "ETH"), spread=0.001, seed=0):
+    rng = random.Random(seed)
+    usd_value = {quote: 10 ** rng.uniform(0, 4) for quote in quotes}
+    usd_value[quotes[0]] = 1.0
+    bases = [f"C{i}" for i in range(n_bases)]
+    for base in bases:
+        usd_value[base] = 10 ** rng.uniform(-3, 3)
+
+    symbols = []
+    for i, quote in enumerate(quotes):
+        for base in quotes[i + 1:]:
+            symbols.append(f"{base}-{quote}")
+    for base in bases:
+        for quote in quotes:
+            symbols.append(f"{base}-{quote}")
+
+    ticker = []
+    for symbol in symbols:
+        base, quote = symbol.split('-')
+        mid = usd_value[base] / usd_value[quote] * rng.uniform(0.995, 1.005)
+        ticker.append({
+            "symbol": symbol,
+            "buy": repr(mid * (1 - spread)),
+            "sell": repr(mid * (1 + spread)),
+        })
+    prices_json = {"code": "200000", "data": {"time": int(time.time() * 1000), "ticker": ticker}}
+
+    structured_pairs = []
+    for base in bases:
+        for i, quote in enumerate(quotes):
+            for cross in quotes[i + 1:]:
+                structured_pairs.append(arbot.make_t_pair(f"{base}-{quote}", f"{base}-{cross}", f"{cross}-{quote}"))
+    return prices_json, structured_pairs
+
+
+def make_synthetic_venue_tickers(n_pairs, venues=("Kucoin", "Binance", "OKX"), spread=0.001, seed=0):
+    # Returns a symbol_mapping-shaped dict for C{i}-USDT pairs and one bulk
+    # ticker payload per venue in that venue's own response shape.
+    rng = random.Random(seed)
+    pairs = [f"C{i}-USDT" for i in range(n_pairs)]
+    mids = [10 ** rng.uniform(-3, 3) for _ in pairs]
+    mapping = {pair: {"Kucoin": pair, "Binance": pair.replace('-', ''), "OKX": f"{pair}-SWAP"} for pair in pairs}
+
+    payloads = {}
+    for venue in venues:
+        rows = []
+        for pair, mid in zip(pairs, mids):
+            mid *= rng.uniform(0.997, 1.003)
+            bid, ask = repr(mid * (1 - spread)), repr(mid * (1 + spread))
+            symbol = mapping[pair][venue]
+            if venue == "Kucoin":
+                rows.append({"symbol": symbol, "buy": bid, "sell": ask})
+            elif venue == "Binance":
+                rows.append({"symbol": symbol, "bidPrice": bid, "askPrice": ask})
+            else:
+                rows.append({"instId": symbol, "bidPx": bid, "askPx": ask})
+        if venue == "Kucoin":
+            payloads[venue] = {"code": "200000", "data": {"ticker": rows}}
+        elif venue == "Binance":
+            payloads[venue] = rows
+        else:
+            payloads[venue] = {"code": "0", "data": rows}
+    return mapping, payloads
+
+
+def make_alltickers_payload(n_symbols=1500, delisted_fraction=0.02, seed=0):
+    # allTickers-shaped body with KuCoin's full field set, compact as served.
+    rng = random.Random(seed)
+    ticker = []
+    for i in range(n_symbols):
+        mid = 10 ** rng.uniform(-4, 4)
+        quoted = rng.random() >= delisted_fraction
+        ticker.append({
+            "symbol": f"C{i}-USDT",
+            "symbolName": f"C{i}-USDT",
+            "buy": repr(mid * 0.999) if quoted else None,
+            "bestBidSize": repr(rng.uniform(0, 1000)),
+            "sell": repr(mid * 1.001) if quoted else None,
+            "bestAskSize": repr(rng.uniform(0, 1000)),
+            "changeRate": repr(rng.uniform(-0.1, 0.1)),
+            "changePrice": repr(mid * rng.uniform(-0.1, 0.1)),
+            "high": repr(mid * 1.05),
+            "low": repr(mid * 0.95),
+            "vol": repr(rng.uniform(0, 1e6)),
+            "volValue": repr(rng.uniform(0, 1e7)),
+            "last": repr(mid),
+            "averagePrice": repr(mid),
+            "takerFeeRate": "0.001",
+            "makerFeeRate": "0.001",
+            "takerCoefficient": "1",
+            "makerCoefficient": "1"
+        })
+    body = {"code": "200000", "data": {"time": int(time.time() * 1000), "ticker": ticker}}
+    return json.dumps(body, separators=(',', ':')).encode()
+
+
+def make_synthetic_exchange(n_currencies=60, n_pairs=400, depth=50, spread=0.001, seed=0):
+    # N currencies joined by M distinct pairs: a chain first so every currency
+    # trades, then random extras. Each pair gets an allTickers row and a
+    # `depth`-level book either side around the same mid.
+    rng = random.Random(seed)
+    currencies = [f"C{i}" for i in range(n_currencies)]
+    usd_value = {currency: 10 ** rng.uniform(-3, 3) for currency in currencies}
+    n_pairs = min(n_pairs, n_currencies * (n_currencies - 1) // 2)
+    seen = set()
+    pairs = []
+    for base, quote in zip(currencies[1:], currencies):
+        seen.add(frozenset((base, quote)))
+        pairs.append((base, quote))
+    while len(pairs) < n_pairs:
+        base, quote = rng.sample(currencies, 2)
+        if frozenset((base, quote)) not in seen:
+            seen.add(frozenset((base, quote)))
+            pairs.append((base, quote))
+
+    ticker = []
+    books = {}
+    for base, quote in pairs[:n_pairs]:
+        symbol = f"{base}-{quote}"
+        mid = usd_value[base] / usd_value[quote] * rng.uniform(0.995, 1.005)
+        ticker.append({"symbol": symbol, "buy": repr(mid * (1 - spread)), "sell": repr(mid * (1 + spread))})
+        size = 1000 / usd_value[base]
+        books[symbol] = {
+            "bids": [[repr(mid * (1 - spread) * (1 - 0.0002 * i)), repr(size * rng.uniform(0.1, 2))]
+                     for i in range(depth)],
+            "asks": [[repr(mid * (1 + spread) * (1 + 0.0002 * i)), repr(size * rng.uniform(0.1, 2))]
+                     for i in range(depth)]
+        }
+    prices_json = {"code": "200000", "data": {"time": int(time.time() * 1000), "ticker": ticker}}
+    return {"prices": prices_json, "coin_list": [x['symbol'] for x in ticker], "books": books,
+            "usd_value": usd_value}
+
+
+def make_market_updates(prices_json, update_fraction=0.05, ticks=20, seed=0):
+    # Yields prices_json once per tick after moving update_fraction of its rows.
+    rng = random.Random(seed)
+    rows = prices_json['data']['ticker']
+    moved = max(1, int(len(rows) * update_fraction))
+    for _ in range(ticks):
+        for x in rng.sample(rows, moved):
+            move = rng.uniform(0.998, 1.002)
+            x['buy'] = repr(float(x['buy']) * move)
+            x['sell'] = repr(float(x['sell']) * move)
+        prices_json['data']['time'] = int(arbot.quote_clock() * 1000)
+        yield prices_json
+
+
+class SyntheticBookSource:
+    # order_book_streams stand-in serving generated books as always-current.
+    def __init__(self, books):
+        self.books = books
+
+    def get_orderbook(self, venue, symbol):
+        book = self.books.get((venue, symbol))
+        if book is not None:
+            book.received_at = arbot.quote_clock()
+            book.exchange_time = None
+        return book
@@ -3,13 +3,46 @@ import json
 import time
 import asyncio
 import os
+import hmac
+import base64
+import hashlib
+import sys
+import threading
+import random
+import math
+from decimal import Decimal
+import re
+from typing import Optional
+import itertools
+import functools
+import collections
+import multiprocessing
+import queue
+from multiprocessing import shared_memory
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import heapq
+import bisect
+from array import array
+import numpy as np
+import websockets
 from dotenv import load_dotenv
 from kucoin.client import Market as KucoinMarket
 from kucoin.client import Trade as KucoinTrade
 from kucoin.client import User as KucoinUser
-from binance.client import Client as BinanceClient, AsyncClient as BinanceAsyncClient
+from binance.client import AsyncClient as BinanceAsyncClient
 from okx.client import Client as OKXClient, AsyncClient as OKXAsyncClient
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
 load_dotenv()
 
 api_key_kucoin = os.getenv("KUCOIN_API_KEY")
@@ -23,13 +56,25 @@ api_key_okx = os.getenv("OKX_API_KEY")
 api_secret_okx = os.getenv("OKX_API_SECRET")
 okx_passphrase = os.getenv("OKX_PASSPHRASE")
 
-kucoin_client = KucoinTrade(api_key_kucoin, api_secret_kucoin, api_passphrase_kucoin, is_sandbox=False, url='')
-kucoin_user = KucoinUser(api_key_kucoin, api_secret_kucoin, api_passphrase_kucoin)
-binance_client = BinanceClient(api_key_binance, api_secret_binance)
-okx_client = OKXClient(api_key_okx, api_secret_okx, okx_passphrase, test=True)
-
-binance_async_client = BinanceAsyncClient(api_key_binance, api_secret_binance)
-okx_async_client = OKXAsyncClient(api_key_okx, api_secret_okx, okx_passphrase, test=True)
+# Built by create_sdk_clients() from the live entry points; some SDKs reach
+# the network on construction, and replay and benchmarks never need them.
+kucoin_client = None
+kucoin_user = None
+kucoin_market_data = None
+okx_client = None
+binance_async_client = None
+okx_async_client = None
+
+def create_sdk_clients():
+    global kucoin_client, kucoin_user, kucoin_market_data, okx_client, binance_async_client, okx_async_client
+    if kucoin_client is not None:
+        return
+    kucoin_client = KucoinTrade(api_key_kucoin, api_secret_kucoin, api_passphrase_kucoin, is_sandbox=False, url='')
+    kucoin_user = KucoinUser(api_key_kucoin, api_secret_kucoin, api_passphrase_kucoin)
+    kucoin_market_data = KucoinMarket()
+    okx_client = OKXClient(api_key_okx, api_secret_okx, okx_passphrase, test=True)
+    binance_async_client = BinanceAsyncClient(api_key_binance, api_secret_binance)
+    okx_async_client = OKXAsyncClient(api_key_okx, api_secret_okx, okx_passphrase, test=True)
 
 amount_dict = {"USDT": 0, "BTC": 0, "ETH": 0, "BNB": 0, "XRP": 0} 
 
@@ -42,24 +87,103 @@ symbol_mapping = {
 
 min_profit_margin = 0.01 
 max_trade_size_btc = 0.001  
+# Per spent asset on any leg, in that asset's units; assets not listed are bounded by inventory and depth only.
+max_trade_sizes = {"BTC": max_trade_size_btc}
 order_book_depth = 50  
 stop_loss_percentage = 0.005  
 profit_threshold = 0.003  
+surface_top_k = 10
+# Above this share of dirty triangles an incremental refresh costs more than
+# re-scoring the whole surface, so refresh falls back to a full pass.
+surface_incremental_max_fraction = 0.25
+# "auto" picks msgspec, then orjson, then the stdlib; "scan" extracts the
+# watched rows from the raw bytes without decoding the rest of the payload.
+ticker_decoder = "auto"
+detection_workers = 0
+shard_result_timeout = 5
 order_timeout_seconds = 10  
+# Quotes older than these are not acted on. Ages run from the earlier of the
+# exchange timestamp and our receive time.
+ticker_max_age_seconds = 1.0
+book_max_age_seconds = 0.5
+# Expected profit is scaled by exp(-delay / opportunity_lifetime_seconds),
+# delay being the oldest leg quote plus the venues' measured round trips.
+opportunity_lifetime_seconds = 1.0
+venue_latency_alpha = 0.2
+quote_clock = time.time
+execution_mode = "sequential"
+# Detection and execution run as separate tasks joined by bounded queues;
+# executors run concurrently on cycles that spend different inventory.
+pipeline_executors = 2
+pipeline_max_candidates = 64
+pipeline_max_executions = 4
+
+scan_spatial_arbitrage = True
+spatial_min_edge = 0.001
+spatial_top_k = 10
+# OKX entries in symbol_mapping are swap instruments, so its bulk feed is the SWAP one.
+detect_log_rate_cycles = False
+cycle_max_length = 4
+transfer_cost_rate = 0.0005
+bulk_ticker_urls = {
+    "Kucoin": "https://api.kucoin.com/api/v1/market/allTickers",
+    "Binance": "https://api.binance.com/api/v3/ticker/bookTicker",
+    "OKX": "https://www.okx.com/api/v5/market/tickers?instType=SWAP"
+}
+
+stream_order_books = True
+order_book_ws_urls = {
+    "Kucoin": None,
+    "Binance": "wss://stream.binance.com:9443",
+    "OKX": "wss://ws.okx.com:8443/ws/v5/public"
+}
+ws_reconnect_seconds = 1
+
+stream_user_data = True
+user_stream_ws_urls = {
+    "Kucoin": None,
+    "Binance": "wss://stream.binance.com:9443/ws",
+    "OKX": "wss://ws.okx.com:8443/ws/v5/private"
+}
+order_poll_min_seconds = 0.2
+order_poll_max_seconds = 2
+# Updates for ids nobody is tracking yet, kept in case the placement response
+# is still in flight; the oldest are dropped past this many.
+order_tracker_max_unclaimed = 1024
+balance_reconcile_seconds = 30
+# Simultaneous cycles net out in every asset but swap_1 up to this fraction of
+# the asset's gross flow; more is flagged as residual inventory.
+residual_inventory_tolerance = 0.005
+
+latency_metrics_enabled = True
+metrics_host = "127.0.0.1"
+metrics_port = 9108
+metrics_summary_seconds = 60
+event_log_path = os.getenv("ARBOT_EVENT_LOG", "arbot_events.jsonl")
+event_log_capacity = 65536
+event_log_flush_seconds = 0.25
+event_log_max_bytes = 64 * 1024 * 1024
+event_log_backups = 5
+# The writer thread also prints each record, so the console keeps its output.
+event_log_echo = True
+
+market_recording_path = os.getenv("ARBOT_RECORD_PATH")
+recorder_flush_records = 256
 
 kucoin_fee_rate = 0.001  
 binance_fee_rate = 0.001  
 okx_fee_rate = 0.001  
 
-api_call_timestamps = {
-    "Kucoin": [],
-    "Binance": [],
-    "OKX": []
+venue_fee_rates = {
+    "Kucoin": kucoin_fee_rate,
+    "Binance": binance_fee_rate,
+    "OKX": okx_fee_rate
 }
+
 rate_limit_windows = {
     "Kucoin": 60, 
     "Binance": 60,  
-    "OKX": 10      
+    "OKX": 2      
 }
 max_calls_per_window = {
     "Kucoin": 100,  
@@ -67,45 +191,480 @@ max_calls_per_window = {
     "OKX": 20      
 }
 
+PRIORITY_ORDER = 0
+PRIORITY_STATUS = 1
+PRIORITY_MARKET_DATA = 2
+# Share of each bucket a priority class may not dip into, so order placement
+# and cancels always find tokens even while market data is saturating.
+rate_limit_reserve = {
+    PRIORITY_ORDER: 0.0,
+    PRIORITY_STATUS: 0.1,
+    PRIORITY_MARKET_DATA: 0.3
+}
+endpoint_weights = {
+    "Kucoin": {"tickers": 1, "orderbook": 1, "order": 1, "cancel": 1, "status": 1, "balance": 1},
+    "Binance": {"tickers": 4, "orderbook": 5, "order": 1, "cancel": 1, "status": 4, "balance": 20},
+    "OKX": {"tickers": 1, "orderbook": 1, "order": 1, "cancel": 1, "status": 1, "balance": 1}
+}
+
+metadata_cache_path = os.getenv("ARBOT_METADATA_CACHE", "arbot_metadata.json")
+# A saved get_symbol_list response (record-symbols <path>) used instead of the live call.
+symbol_list_fixture_path = os.getenv("ARBOT_SYMBOL_LIST_FIXTURE")
+metadata_cache_version = 2
+metadata_cache_ttl = {
+    "kucoin_symbols": 6 * 3600,
+    "triangles": 6 * 3600,
+    "instruments": 6 * 3600
+}
+instrument_info_urls = {
+    "Binance": "https://api.binance.com/api/v3/exchangeInfo",
+    "OKX": "https://www.okx.com/api/v5/public/instruments?instType=SWAP"
+}
+metadata_refresh_seconds = 3600
+kucoin_symbol_fields = ("baseIncrement", "quoteIncrement", "priceIncrement",
+                        "baseMinSize", "quoteMinSize", "minFunds")
+
+gateway_max_workers = 8
+gateway_executor = ThreadPoolExecutor(max_workers=gateway_max_workers, thread_name_prefix="gateway")
+
+async def run_blocking(func, *args, **kwargs):
+    # Synchronous SDK calls run on a bounded pool so they never stall the event loop.
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(gateway_executor, functools.partial(func, *args, **kwargs))
+
+def endpoint_weight(exchange, endpoint, depth=None):
+    if exchange == "Binance" and endpoint == "orderbook" and depth is not None:
+        if depth <= 100:
+            return 5
+        if depth <= 500:
+            return 25
+        if depth <= 1000:
+            return 50
+        return 250
+    return endpoint_weights[exchange][endpoint]
+
+class TokenBucket:
+    __slots__ = ("capacity", "refill_rate", "tokens", "updated_at", "blocked_until",
+                 "waiting", "clock", "sleep")
+
+    def __init__(self, capacity, window, clock=time.monotonic, sleep=asyncio.sleep):
+        self.capacity = capacity
+        self.refill_rate = capacity / window
+        self.tokens = float(capacity)
+        self.clock = clock
+        self.sleep = sleep
+        self.updated_at = clock()
+        self.blocked_until = 0.0
+        self.waiting = [0, 0, 0]
+
+    def refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_rate)
+        self.updated_at = now
+        return now
+
+    def wait_time(self, weight, priority):
+        now = self.refill()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if any(self.waiting[:priority]):
+            # Higher-priority callers are queued; back off one grant and re-check.
+            return weight / self.refill_rate
+        floor = self.capacity * rate_limit_reserve[priority]
+        deficit = weight + floor - self.tokens
+        return deficit / self.refill_rate if deficit > 0 else 0
+
+    async def acquire(self, weight=1, priority=PRIORITY_MARKET_DATA):
+        waited = 0.0
+        delay = self.wait_time(weight, priority)
+        if delay > 0:
+            self.waiting[priority] += 1
+            try:
+                while delay > 0:
+                    await self.sleep(delay)
+                    waited += delay
+                    delay = self.wait_time(weight, priority)
+            finally:
+                self.waiting[priority] -= 1
+        self.tokens -= weight
+        return waited
+
+    def observe_headers(self, headers):
+        # Clamp local state to what the venue says we have actually used.
+        headers = {key.lower(): value for key, value in (headers or {}).items()}
+        now = self.refill()
+        if 'x-mbx-used-weight-1m' in headers:
+            self.tokens = min(self.tokens, self.capacity - float(headers['x-mbx-used-weight-1m']))
+        if 'gw-ratelimit-remaining' in headers:
+            self.tokens = min(self.tokens, float(headers['gw-ratelimit-remaining']))
+        if 'retry-after' in headers:
+            self.tokens = 0.0
+            self.blocked_until = max(self.blocked_until, now + float(headers['retry-after']))
+
+rate_limiters = {
+    exchange: TokenBucket(max_calls_per_window[exchange], rate_limit_windows[exchange])
+    for exchange in max_calls_per_window
+}
+
+async def handle_rate_limits(exchange, weight=1, priority=PRIORITY_MARKET_DATA):
+    started = time.perf_counter_ns()
+    waited = await rate_limiters[exchange].acquire(weight, priority)
+    latency_metrics.observe("rate_limit_wait", started)
+    return waited
+
+class BalanceLedger:
+    # Per-venue inventory, debited and credited optimistically from fills and
+    # reconciled in the background with one balance call per venue.
+    def __init__(self, balances):
+        self.balances = balances
+        self.in_flight = {venue: 0 for venue in balances}
+        self.generation = {venue: 0 for venue in balances}
+        self.residuals = {}
+
+    def available(self, venue, asset):
+        return self.balances[venue].get(asset) or 0
+
+    def snapshot(self):
+        return {venue: dict(book) for venue, book in self.balances.items()}
+
+    def reserve(self, venue):
+        self.in_flight[venue] += 1
+
+    def release(self, venue):
+        self.in_flight[venue] -= 1
+
+    def credit(self, venue, asset, amount):
+        book = self.balances[venue]
+        book[asset] = (book.get(asset) or 0) + amount
+        self.generation[venue] += 1
+
+    def apply_fill(self, venue, symbol, side, size, price):
+        if not size:
+            return
+        for asset, amount in fill_deltas(venue, symbol, side, size, price):
+            self.credit(venue, asset, amount)
+
+    def flag_residuals(self, residuals):
+        # Unhedged inventory left by partly filled cycles, per asset. Nothing
+        # flattens it; it stays flagged for the operator and on /metrics.
+        for asset, amount in residuals.items():
+            self.residuals[asset] = self.residuals.get(asset, 0) + amount
+
+    def replace(self, venue, balances):
+        book = self.balances[venue]
+        for asset in book:
+            book[asset] = 0
+        book.update(balances)
+        self.generation[venue] += 1
+
+    async def reconcile(self, venue):
+        # Skipped while orders are open on the venue, and discarded if a fill
+        # landed while the snapshot was in flight, so stale reads never undo it.
+        if self.in_flight[venue]:
+            return False
+        generation = self.generation[venue]
+        try:
+            balances = await gateways[venue].balances()
+        except Exception as e:
+            event_log.log("error", "balances", "reconcile_failed", venue=venue, error=str(e))
+            return False
+        if self.in_flight[venue] or generation != self.generation[venue]:
+            return False
+        self.replace(venue, balances)
+        return True
+
+    async def run(self):
+        while True:
+            await asyncio.gather(*(self.reconcile(venue) for venue in self.balances))
+            await asyncio.sleep(balance_reconcile_seconds)
+
+def fill_deltas(venue, symbol, side, size, price):
+    # (asset, amount) inventory changes for a fill of `size` base at `price`.
+    base, quote = symbol_assets(venue, symbol)
+    fee_rate = venue_fee_rates[venue]
+    if side == 'buy':
+        return [(quote, -size * price), (base, size * (1 - fee_rate))]
+    return [(base, -size), (quote, size * price * (1 - fee_rate))]
+
+balance_ledger = BalanceLedger({"Kucoin": amount_dict, "Binance": {}, "OKX": {}})
+
 def update_balances():
-    global amount_dict
     try:
+        accounts = kucoin_user.get_account_list(account_type='trade') or []
+        available = {account['currency']: float(account['available']) for account in accounts}
         for currency in amount_dict:
-            account_info = kucoin_user.get_account_list(currency=currency)
-            if account_info:
-                amount_dict[currency] = float(account_info[0]['available'])
-            else:
+            if currency not in available:
                 print(f"Warning: Currency {currency} not found on Kucoin.")
+        balance_ledger.replace("Kucoin", available)
     except Exception as e:
         print(f"Error updating balances: {e}")
 
-update_balances()
-print("Initial Balances:", amount_dict)
+def load_metadata_cache(path=metadata_cache_path):
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+    except FileNotFoundError:
+        return {"version": metadata_cache_version, "sections": {}}
+    except Exception as e:
+        print(f"Error loading metadata cache {path}: {e}")
+        return {"version": metadata_cache_version, "sections": {}}
+
+    if not isinstance(cache, dict) or cache.get("version") != metadata_cache_version:
+        print(f"Metadata cache {path} has an old version, ignoring it.")
+        return {"version": metadata_cache_version, "sections": {}}
+    return cache
+
+def save_metadata_cache(cache, path=metadata_cache_path):
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"Error saving metadata cache {path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def get_cache_section(cache, name, now=None):
+    section = cache["sections"].get(name)
+    if section is None:
+        return None
+    now = time.time() if now is None else now
+    if now - section["saved_at"] > metadata_cache_ttl[name]:
+        return None
+    return section["data"]
+
+def set_cache_section(cache, name, data, now=None):
+    cache["sections"][name] = {
+        "saved_at": time.time() if now is None else now,
+        "data": data
+    }
+
+def fetch_kucoin_symbols(symbol_list_source=None):
+    symbol_list = (symbol_list_source or kucoin_market_data.get_symbol_list)()
+    return {x['symbol']: {field: x.get(field) for field in kucoin_symbol_fields}
+            for x in symbol_list}
+
+def load_kucoin_symbols(cache, symbol_list_source=None, now=None):
+    kucoin_symbols = get_cache_section(cache, "kucoin_symbols", now)
+    if kucoin_symbols is None:
+        kucoin_symbols = fetch_kucoin_symbols(symbol_list_source)
+        set_cache_section(cache, "kucoin_symbols", kucoin_symbols, now)
+    return kucoin_symbols
+
+def apply_kucoin_symbols(kucoin_symbols):
+    instrument_tables["Kucoin"] = parse_kucoin_instruments(kucoin_symbols)
+
+powers_of_ten = [10 ** i for i in range(19)]
+
+def decimal_step(increment):
+    # "0.00100000" -> (1, 3): the increment as an integer count of 10**-decimals,
+    # read from the venue's string so no float rounding gets into the table.
+    increment = Decimal(str(increment)).normalize()
+    decimals = max(0, -increment.as_tuple().exponent)
+    return int(increment.scaleb(decimals)), decimals
+
+def quantize_units(value, step, decimals, up=False):
+    # value as a multiple of `step` units of 10**-decimals, rounded down unless
+    # `up`. Products within float noise of a whole unit count as that unit, so
+    # 0.29 on a 0.01 grid stays 29 rather than flooring to 28.
+    scaled = value * powers_of_ten[decimals]
+    units = round(scaled)
+    if abs(scaled - units) > 1e-9 * (scaled if scaled > 1.0 else 1.0):
+        units = math.ceil(scaled) if up else math.floor(scaled)
+    steps, rest = divmod(units, step)
+    if rest and up:
+        steps += 1
+    return steps * step
+
+def format_units(units, decimals):
+    if not decimals:
+        return str(units)
+    whole, frac = divmod(units, powers_of_ten[decimals])
+    return f"{whole}.{frac:0{decimals}d}"
+
+class Instrument:
+    # Tick and lot grids held as integer steps so order fields are snapped and
+    # formatted with integer arithmetic. Sizes are in the base asset; for OKX
+    # swaps the lot grid is in contracts of contract_value base each.
+    __slots__ = ("venue", "symbol", "price_step", "price_decimals", "size_step", "size_decimals",
+                 "min_size_units", "min_notional", "contract_value")
+
+    def __init__(self, venue, symbol, tick_size, lot_size, min_size=0, min_notional=0, contract_value=None):
+        self.venue = venue
+        self.symbol = symbol
+        self.price_step, self.price_decimals = decimal_step(tick_size)
+        self.size_step, self.size_decimals = decimal_step(lot_size)
+        self.min_size_units = quantize_units(float(min_size or 0), 1, self.size_decimals, up=True)
+        self.min_notional = float(min_notional or 0)
+        self.contract_value = float(contract_value) if contract_value else None
+
+    def price_units(self, price, side):
+        # Buys round down and sells round up, so snapping never worsens the limit.
+        return quantize_units(price, self.price_step, self.price_decimals, up=side == 'sell')
+
+    def size_units(self, size):
+        if self.contract_value:
+            size = size / self.contract_value
+        return quantize_units(size, self.size_step, self.size_decimals)
+
+    def spec(self):
+        # Constructor arguments after the symbol, as plain values for the metadata cache.
+        return [format_units(self.price_step, self.price_decimals), format_units(self.size_step, self.size_decimals),
+                format_units(self.min_size_units, self.size_decimals), self.min_notional, self.contract_value]
+
+    def base_size(self, venue_size):
+        return venue_size * self.contract_value if self.contract_value else venue_size
+
+    def order_fields(self, side, size, price):
+        # (size, price) strings on the venue's grid, or None when the snapped
+        # order falls under the venue's minimum size or notional.
+        size_units = self.size_units(size)
+        price_units = self.price_units(price, side)
+        if size_units <= 0 or size_units < self.min_size_units or price_units <= 0:
+            return None
+        notional = self.base_size(size_units / powers_of_ten[self.size_decimals]) * \
+            (price_units / powers_of_ten[self.price_decimals])
+        if notional < self.min_notional:
+            return None
+        return format_units(size_units, self.size_decimals), format_units(price_units, self.price_decimals)
+
+instrument_tables = {"Kucoin": {}, "Binance": {}, "OKX": {}}
+
+def parse_kucoin_instruments(kucoin_symbols):
+    return {symbol: Instrument("Kucoin", symbol, info['priceIncrement'], info['baseIncrement'],
+                               info.get('baseMinSize'), info.get('minFunds'))
+            for symbol, info in kucoin_symbols.items()
+            if info.get('priceIncrement') and info.get('baseIncrement')}
+
+def parse_binance_instruments(exchange_info):
+    instruments = {}
+    for x in exchange_info['symbols']:
+        filters = {f['filterType']: f for f in x.get('filters', [])}
+        if 'PRICE_FILTER' not in filters or 'LOT_SIZE' not in filters:
+            continue
+        notional = filters.get('NOTIONAL') or filters.get('MIN_NOTIONAL') or {}
+        instruments[x['symbol']] = Instrument("Binance", x['symbol'], filters['PRICE_FILTER']['tickSize'],
+                                              filters['LOT_SIZE']['stepSize'], filters['LOT_SIZE'].get('minQty'),
+                                              notional.get('minNotional'))
+    return instruments
+
+def parse_okx_instruments(instruments_json):
+    # Only linear swaps: their contract value is in the base asset the bot sizes in.
+    return {x['instId']: Instrument("OKX", x['instId'], x['tickSz'], x['lotSz'], x.get('minSz'),
+                                    contract_value=x.get('ctVal'))
+            for x in instruments_json['data']
+            if x.get('ctType', 'linear') == 'linear' and x.get('tickSz') and x.get('lotSz')}
+
+instrument_parsers = {
+    "Binance": parse_binance_instruments,
+    "OKX": parse_okx_instruments
+}
+
+def fetch_instruments(venue):
+    return instrument_parsers[venue](requests.get(instrument_info_urls[venue]).json())
+
+def instrument_specs(instruments):
+    return {venue: {symbol: instrument.spec() for symbol, instrument in table.items()}
+            for venue, table in instruments.items()}
+
+def instruments_from_specs(specs):
+    return {venue: {symbol: Instrument(venue, symbol, *spec) for symbol, spec in table.items()}
+            for venue, table in specs.items()}
+
+def load_instruments(cache, now=None):
+    specs = get_cache_section(cache, "instruments", now)
+    if specs is None:
+        instruments = {}
+        for venue in instrument_info_urls:
+            try:
+                instruments[venue] = fetch_instruments(venue)
+            except Exception as e:
+                print(f"Error fetching {venue} instruments: {e}")
+                return None
+        set_cache_section(cache, "instruments", instrument_specs(instruments), now)
+    else:
+        instruments = instruments_from_specs(specs)
+    instrument_tables.update(instruments)
+    return instruments
+
+def quantize_order(exchange, symbol, side, size, price):
+    # Venue-valid (size, price) for an order; unknown instruments pass through.
+    instrument = instrument_tables.get(exchange, {}).get(symbol)
+    if instrument is None:
+        return size, price
+    fields = instrument.order_fields(side, float(size), float(price))
+    if fields is None:
+        latency_metrics.reject("execute", "below_venue_minimum")
+        raise ValueError(f"{exchange} {symbol} order of {size} at {price} is below the venue minimum")
+    return fields
+
+def venue_base_size(exchange, symbol, venue_size):
+    instrument = instrument_tables.get(exchange, {}).get(symbol)
+    return instrument.base_size(venue_size) if instrument is not None else venue_size
+
+def load_structured_pairs(cache, coin_list, now=None):
+    coin_list = list(coin_list)
+    triangles = get_cache_section(cache, "triangles", now)
+    if triangles is None or triangles["coin_list"] != coin_list:
+        triangles = {
+            "coin_list": coin_list,
+            "cycles": sorted(cycle for cycle in find_currency_cycles(coin_list) if len(cycle) == 3)
+        }
+        set_cache_section(cache, "triangles", triangles, now)
+    return [make_t_pair(coin_list[i], coin_list[j], coin_list[k]) for i, j, k in triangles["cycles"]]
 
-kucoin_market_data = KucoinMarket()
-kucoin_inc_list = {}
-kucoin_qinc_list = {}
+def record_symbol_list_fixture(path):
+    create_sdk_clients()
+    with open(path, 'w') as f:
+        json.dump(kucoin_market_data.get_symbol_list(), f)
 
-for x in kucoin_market_data.get_symbol_list():
-    kucoin_inc_list[x['symbol']] = x['baseIncrement']
-    kucoin_qinc_list[x['symbol']] = x['quoteIncrement']
+def load_symbol_list_fixture(path):
+    with open(path) as f:
+        symbol_list = json.load(f)
+    return lambda: symbol_list
 
-def get_coin_arbitrage(url):
+async def refresh_metadata_cache(path=metadata_cache_path, interval=metadata_refresh_seconds):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            cache = load_metadata_cache(path)
+            kucoin_symbols = await run_blocking(fetch_kucoin_symbols)
+            set_cache_section(cache, "kucoin_symbols", kucoin_symbols)
+            apply_kucoin_symbols(kucoin_symbols)
+            instruments = {venue: await run_blocking(fetch_instruments, venue) for venue in instrument_info_urls}
+            set_cache_section(cache, "instruments", instrument_specs(instruments))
+            instrument_tables.update(instruments)
+            coin_list = [symbol for symbol in kucoin_symbols if symbol in symbol_mapping]
+            # Triangles are only rebuilt here; the running scan keeps its compiled set.
+            load_structured_pairs(cache, coin_list)
+            await run_blocking(save_metadata_cache, cache, path)
+        except Exception as e:
+            event_log.log("error", "metadata", "refresh_failed", error=str(e))
+
+metadata_cache = None
+kucoin_symbols = {}
+
+def fetch_ticker_payload(url):
+    # Returns the raw body and the quote_clock() time it arrived, so the time it
+    # spends queued behind a busy scorer still counts against its freshness.
     try:
-        response = requests.get(url).json()
-        return response
+        started = time.perf_counter_ns()
+        response = requests.get(url)
+        received_at = quote_clock()
+        latency_metrics.observe("fetch", started)
+        observe_venue_latency("Kucoin", (time.perf_counter_ns() - started) / 1e9)
+        rate_limiters["Kucoin"].observe_headers(response.headers)
+        return response.content, received_at
     except Exception as e:
-        print(f"Error fetching arbitrage data: {e}")
+        event_log.log("error", "feed", "fetch_failed", url=url, error=str(e))
         return None
 
-def collect_tradeables(json_obj):
-    coin_list = []
-    for coin in json_obj['data']['ticker']:
-        if coin['symbol'] in symbol_mapping:
-            coin_list.append(coin['symbol'])
-    return coin_list
+def record_ticker_payload_fixture(path, url='https://api.kucoin.com/api/v1/market/allTickers'):
+    with open(path, 'wb') as f:
+        f.write(requests.get(url).content)
 
-def structure_triangular_pairs(coin_list):
+def structure_triangular_pairs_nested(coin_list):
     triangular_pairs_list = []
     remove_duplicates_list = []
     pairs_list = coin_list[0:]
@@ -156,7 +715,232 @@ def structure_triangular_pairs(coin_list):
                                     remove_duplicates_list.append(unique_item)
     return triangular_pairs_list
 
+def make_t_pair(pair_a, pair_b, pair_c):
+    a_base, a_quote = pair_a.split('-')[:2]
+    b_base, b_quote = pair_b.split('-')[:2]
+    c_base, c_quote = pair_c.split('-')[:2]
+    return {
+        "a_base": a_base,
+        "b_base": b_base,
+        "c_base": c_base,
+        "a_quote": a_quote,
+        "b_quote": b_quote,
+        "c_quote": c_quote,
+        "pair_a": pair_a,
+        "pair_b": pair_b,
+        "pair_c": pair_c,
+        "combined": pair_a + ',' + pair_b + ',' + pair_c
+    }
+
+def build_currency_graph(coin_list):
+    adjacency = {}
+    for i, pair in enumerate(coin_list):
+        pair_split = pair.split('-')
+        base = pair_split[0]
+        quote = pair_split[1]
+        if base == quote:
+            continue
+        adjacency.setdefault(base, {}).setdefault(quote, []).append(i)
+        adjacency.setdefault(quote, {}).setdefault(base, []).append(i)
+    return adjacency
+
+def find_currency_cycles(coin_list, max_length=3):
+    # Triangles come back as sorted pair-index tuples; 4-cycles as pair indices
+    # in cycle order. Each cycle is rooted at its lowest-ranked currency.
+    adjacency = build_currency_graph(coin_list)
+    rank = {currency: r for r, currency in enumerate(adjacency)}
+    seen = set()
+    cycles = []
+
+    for u, u_edges in adjacency.items():
+        u_rank = rank[u]
+        for v in u_edges:
+            v_rank = rank[v]
+            if v_rank <= u_rank:
+                continue
+            v_edges = adjacency[v]
+            for w in v_edges:
+                w_rank = rank[w]
+                if w_rank <= u_rank:
+                    continue
+                if w_rank > v_rank and w in u_edges:
+                    for combo in itertools.product(u_edges[v], v_edges[w], u_edges[w]):
+                        key = tuple(sorted(combo))
+                        if key not in seen:
+                            seen.add(key)
+                            cycles.append(key)
+                if max_length < 4:
+                    continue
+                for x, wx_pairs in adjacency[w].items():
+                    if rank[x] <= v_rank or x not in u_edges:
+                        continue
+                    for combo in itertools.product(u_edges[v], v_edges[w], wx_pairs, u_edges[x]):
+                        key = tuple(sorted(combo))
+                        if key not in seen:
+                            seen.add(key)
+                            cycles.append(combo)
+    return cycles
+
+def structure_triangular_pairs(coin_list):
+    triangles = sorted(cycle for cycle in find_currency_cycles(coin_list) if len(cycle) == 3)
+    return [make_t_pair(coin_list[i], coin_list[j], coin_list[k]) for i, j, k in triangles]
+
+structured_pairs = []
+
+def initialize(symbol_list_source=None):
+    # Startup reads that hit the network, run by the entry point rather than
+    # at import so the module can be loaded offline for replay and benchmarks.
+    global metadata_cache, kucoin_symbols, structured_pairs
+    if symbol_list_source is None and symbol_list_fixture_path:
+        symbol_list_source = load_symbol_list_fixture(symbol_list_fixture_path)
+    create_sdk_clients()
+    update_balances()
+    print("Initial Balances:", amount_dict)
+    metadata_cache = load_metadata_cache()
+    kucoin_symbols = load_kucoin_symbols(metadata_cache, symbol_list_source)
+    apply_kucoin_symbols(kucoin_symbols)
+    load_instruments(metadata_cache)
+    structured_pairs = load_structured_pairs(metadata_cache, [symbol for symbol in kucoin_symbols
+                                                             if symbol in symbol_mapping])
+    save_metadata_cache(metadata_cache)
+
+fast_json_loads = orjson.loads if orjson is not None else json.loads
+
+if msgspec is not None:
+    # Only the fields read per tick are declared; msgspec skips the rest.
+    class KucoinTickerRow(msgspec.Struct):
+        symbol: str
+        buy: Optional[str] = None
+        sell: Optional[str] = None
+
+    class KucoinTickerData(msgspec.Struct):
+        ticker: list[KucoinTickerRow]
+        time: Optional[int] = None
+
+    class KucoinTickersResponse(msgspec.Struct):
+        data: KucoinTickerData
+
+    kucoin_tickers_decoder = msgspec.json.Decoder(KucoinTickersResponse)
+
+ticker_scan_pattern = re.compile(
+    rb'\{"symbol":"([^"\\]*(?:\\.[^"\\]*)*)"[^{}]*?"buy":(?:"([^"]*)"|null)[^{}]*?"sell":(?:"([^"]*)"|null)')
+ticker_time_pattern = re.compile(rb'"time":(\d+)')
+
+def resolve_ticker_decoder(decoder=None):
+    decoder = decoder or ticker_decoder
+    if decoder == "auto":
+        if msgspec is not None:
+            return "msgspec"
+        return "orjson" if orjson is not None else "json"
+    if (decoder == "msgspec" and msgspec is None) or (decoder == "orjson" and orjson is None):
+        event_log.log("warning", "feed", "decoder_unavailable", decoder=decoder)
+        return "json"
+    return decoder
+
+def decode_ticker_payload(payload, decoder=None):
+    # (exchange time in ms or None, iterator of (symbol, buy, sell)) from a raw
+    # allTickers body. buy/sell stay str or bytes; float() accepts both, so
+    # nothing else is converted.
+    decoder = resolve_ticker_decoder(decoder)
+    if decoder == "msgspec":
+        data = kucoin_tickers_decoder.decode(payload).data
+        return data.time, ((row.symbol, row.buy, row.sell) for row in data.ticker)
+    if decoder == "scan":
+        # The response time precedes the ticker rows, which carry no "time" of their own.
+        match = ticker_time_pattern.search(payload)
+        return int(match.group(1)) if match else None, \
+            ((scanned_symbol(match.group(1)), match.group(2), match.group(3))
+             for match in ticker_scan_pattern.finditer(payload))
+    loads = orjson.loads if decoder == "orjson" else json.loads
+    data = loads(payload)['data']
+    return data.get('time'), ((x['symbol'], x.get('buy'), x.get('sell')) for x in data['ticker'])
+
+def scanned_symbol(raw):
+    # Symbols are plain ASCII in practice; an escaped one goes through the JSON
+    # string decoder so it still matches the watched name.
+    return json.loads(b'"' + raw + b'"') if b'\\' in raw else raw.decode()
+
+class TickerSnapshot:
+    # Bid/ask for a fixed symbol universe in contiguous float arrays; the
+    # symbol -> index map is built once so triangles can keep integer indices.
+    # Each update bumps version and records which symbol indices moved.
+    __slots__ = ("symbol_index", "bids", "asks", "_empty", "version", "changed", "received_at", "exchange_time")
+
+    def __init__(self, symbols):
+        self.symbol_index = {}
+        for symbol in symbols:
+            if symbol not in self.symbol_index:
+                self.symbol_index[symbol] = len(self.symbol_index)
+        self._empty = array('d', [float('nan')]) * len(self.symbol_index)
+        self.bids = array('d', self._empty)
+        self.asks = array('d', self._empty)
+        self.version = 0
+        self.changed = np.arange(len(self.symbol_index))
+        self.received_at = None
+        self.exchange_time = None
+
+    def update(self, prices_json, received_at=None):
+        data = prices_json['data']
+        return self.update_rows(((x['symbol'], x.get('buy'), x.get('sell')) for x in data['ticker']),
+                                data.get('time'), received_at)
+
+    def load_payload(self, payload, decoder=None, received_at=None):
+        # Raw allTickers bytes straight into the float arrays.
+        exchange_time, rows = decode_ticker_payload(payload, decoder)
+        return self.update_rows(rows, exchange_time, received_at)
+
+    def age(self, now=None):
+        return quote_age(self.received_at, self.exchange_time, now)
+
+    def update_rows(self, rows, exchange_time=None, received_at=None):
+        self.received_at = quote_clock() if received_at is None else received_at
+        self.exchange_time = exchange_time / 1000 if exchange_time else None
+        symbol_index = self.symbol_index
+        bids = self.bids
+        asks = self.asks
+        previous_bids = np.array(bids)
+        previous_asks = np.array(asks)
+        bids[:] = self._empty
+        asks[:] = self._empty
+
+        for symbol, bid, ask in rows:
+            i = symbol_index.get(symbol)
+            if i is None:
+                continue
+            try:
+                bids[i] = float(bid)
+                asks[i] = float(ask)
+            except (TypeError, ValueError):
+                bids[i] = asks[i] = float('nan')
+
+        new_bids = np.frombuffer(bids, dtype=np.float64)
+        new_asks = np.frombuffer(asks, dtype=np.float64)
+        moved = ~((new_bids == previous_bids) | (np.isnan(new_bids) & np.isnan(previous_bids)))
+        moved |= ~((new_asks == previous_asks) | (np.isnan(new_asks) & np.isnan(previous_asks)))
+        self.changed = np.flatnonzero(moved)
+        self.version += 1
+        return self
+
+    def to_prices_json(self):
+        # allTickers-shaped dict of the tracked symbols that have a quote.
+        bids = self.bids
+        asks = self.asks
+        return {"data": {"time": int(self.exchange_time * 1000) if self.exchange_time else None,
+                         "ticker": [{"symbol": symbol, "buy": repr(bids[i]), "sell": repr(asks[i])}
+                                    for symbol, i in self.symbol_index.items() if bids[i] == bids[i]]}}
+
+def index_triangular_pairs(structured_pairs, snapshot):
+    symbol_index = snapshot.symbol_index
+    for t_pair in structured_pairs:
+        t_pair['pair_a_idx'] = symbol_index[t_pair['pair_a']]
+        t_pair['pair_b_idx'] = symbol_index[t_pair['pair_b']]
+        t_pair['pair_c_idx'] = symbol_index[t_pair['pair_c']]
+    return structured_pairs
+
 def get_price_for_t_pair(t_pair, prices_json):
+    if isinstance(prices_json, TickerSnapshot):
+        return get_price_for_t_pair_indexed(t_pair, prices_json)
+
     pair_a = t_pair['pair_a']
     pair_b = t_pair['pair_b']
     pair_c = t_pair['pair_c']
@@ -183,9 +967,30 @@ def get_price_for_t_pair(t_pair, prices_json):
         }
 
     except Exception as e:
-        print(f"Error getting prices for triangular pair: {e}")
+        event_log.log("error", "surface", "prices_failed", symbol=t_pair.get('combined'), error=str(e))
         return None
 
+def get_price_for_t_pair_indexed(t_pair, snapshot):
+    bids = snapshot.bids
+    asks = snapshot.asks
+    a = t_pair['pair_a_idx']
+    b = t_pair['pair_b_idx']
+    c = t_pair['pair_c_idx']
+
+    prices_dict = {
+        "pair_a_ask": asks[a],
+        "pair_a_bid": bids[a],
+        "pair_b_ask": asks[b],
+        "pair_b_bid": bids[b],
+        "pair_c_ask": asks[c],
+        "pair_c_bid": bids[c]
+    }
+    # NaN marks a symbol missing from this poll, mirroring the scan path failing
+    for price in prices_dict.values():
+        if price != price:
+            return None
+    return prices_dict
+
 def cal_triangular_arb_surface_rate(t_pair, prices_dict):
     starting_amount = 1
     min_surface_rate = 0
@@ -202,7 +1007,7 @@ def cal_triangular_arb_surface_rate(t_pair, prices_dict):
     pair_c = t_pair['pair_c']
 
     if prices_dict is None:
-        print("Error: prices_dict is None. Skipping calculation.")
+        event_log.log("error", "surface", "no_prices", symbol=t_pair.get('combined'))
         return surface_dict
 
     a_ask = prices_dict['pair_a_ask']
@@ -226,25 +1031,26 @@ def cal_triangular_arb_surface_rate(t_pair, prices_dict):
         if direction == "forward":
             swap_1 = a_base
             swap_2 = a_quote
-            swap_1_rate = (1 / a_ask) * (1 - kucoin_fee_rate) if a_ask != 0 else 0
+            swap_1_rate = a_bid * (1 - kucoin_fee_rate)
             direction_trade_1 = "base_to_quote"
+            contract_1 = pair_a
             acquired_coin_t1 = starting_amount * swap_1_rate
 
             if a_quote == b_quote and calculated == 0:
-                swap_2_rate = b_bid * (1 - kucoin_fee_rate)
+                swap_2_rate = (1 / b_ask) * (1 - kucoin_fee_rate) if b_ask != 0 else 0
                 acquired_coin_t2 = acquired_coin_t1 * swap_2_rate
                 direction_trade_2 = "quote_to_base"
                 contract_2 = pair_b
 
                 if b_base == c_base:
                     swap_3 = c_base
-                    swap_3_rate = (1 / c_ask) * (1 - kucoin_fee_rate) if c_ask != 0 else 0
+                    swap_3_rate = c_bid * (1 - kucoin_fee_rate)
                     direction_trade_3 = "base_to_quote"
                     contract_3 = pair_c
 
                 if b_base == c_quote:
                     swap_3 = c_quote
-                    swap_3_rate = c_bid * (1 - kucoin_fee_rate)
+                    swap_3_rate = (1 / c_ask) * (1 - kucoin_fee_rate) if c_ask != 0 else 0
                     direction_trade_3 = "quote_to_base"
                     contract_3 = pair_c
 
@@ -252,20 +1058,20 @@ def cal_triangular_arb_surface_rate(t_pair, prices_dict):
                 calculated = 1
 
             if a_quote == b_base and calculated == 0:
-                swap_2_rate = (1 / b_ask) * (1 - binance_fee_rate) if b_ask != 0 else 0
+                swap_2_rate = b_bid * (1 - binance_fee_rate)
                 acquired_coin_t2 = acquired_coin_t1 * swap_2_rate
                 direction_trade_2 = "base_to_quote"
                 contract_2 = pair_b
 
                 if b_quote == c_base:
                     swap_3 = c_base
-                    swap_3_rate = (1 / c_ask) * (1 - okx_fee_rate) if c_ask != 0 else 0
+                    swap_3_rate = c_bid * (1 - okx_fee_rate)
                     direction_trade_3 = "base_to_quote"
                     contract_3 = pair_c
 
                 if b_quote == c_quote:
                     swap_3 = c_quote
-                    swap_3_rate = c_bid * (1 - okx_fee_rate)
+                    swap_3_rate = (1 / c_ask) * (1 - okx_fee_rate) if c_ask != 0 else 0
                     direction_trade_3 = "quote_to_base"
                     contract_3 = pair_c
 
@@ -273,20 +1079,20 @@ def cal_triangular_arb_surface_rate(t_pair, prices_dict):
                 calculated = 1
 
             if a_quote == c_quote and calculated == 0:
-                swap_2_rate = c_bid * (1 - okx_fee_rate)
+                swap_2_rate = (1 / c_ask) * (1 - okx_fee_rate) if c_ask != 0 else 0
                 acquired_coin_t2 = acquired_coin_t1 * swap_2_rate
                 direction_trade_2 = "quote_to_base"
                 contract_2 = pair_c
 
                 if c_base == b_base:
                     swap_3 = b_base
-                    swap_3_rate = (1 / b_ask) * (1 - binance_fee_rate) if b_ask != 0 else 0
+                    swap_3_rate = b_bid * (1 - binance_fee_rate)
                     direction_trade_3 = "base_to_quote"
                     contract_3 = pair_b
 
                 if c_base == b_quote:
                     swap_3 = b_quote
-                    swap_3_rate = b_bid * (1 - binance_fee_rate)
+                    swap_3_rate = (1 / b_ask) * (1 - binance_fee_rate) if b_ask != 0 else 0
                     direction_trade_3 = "quote_to_base"
                     contract_3 = pair_b
 
@@ -294,20 +1100,20 @@ def cal_triangular_arb_surface_rate(t_pair, prices_dict):
                 calculated = 1
 
             if a_quote == c_base and calculated == 0:
-                swap_2_rate = (1 / c_ask) * (1 - okx_fee_rate) if c_ask != 0 else 0
+                swap_2_rate = c_bid * (1 - okx_fee_rate)
                 acquired_coin_t2 = acquired_coin_t1 * swap_2_rate
                 direction_trade_2 = "base_to_quote"
                 contract_2 = pair_c
 
                 if c_quote == b_base:
                     swap_3 = b_base
-                    swap_3_rate = (1 / b_ask) * (1 - binance_fee_rate) if b_ask != 0 else 0
+                    swap_3_rate = b_bid * (1 - binance_fee_rate)
                     direction_trade_3 = "base_to_quote"
                     contract_3 = pair_b
 
                 if c_quote == b_quote:
                     swap_3 = b_quote
-                    swap_3_rate = b_bid * (1 - binance_fee_rate)
+                    swap_3_rate = (1 / b_ask) * (1 - binance_fee_rate) if b_ask != 0 else 0
                     direction_trade_3 = "quote_to_base"
                     contract_3 = pair_b
 
@@ -317,25 +1123,26 @@ def cal_triangular_arb_surface_rate(t_pair, prices_dict):
         if direction == "reverse":
             swap_1 = a_quote
             swap_2 = a_base
-            swap_1_rate = a_bid * (1 - kucoin_fee_rate)
+            swap_1_rate = (1 / a_ask) * (1 - kucoin_fee_rate) if a_ask != 0 else 0
             direction_trade_1 = "quote_to_base"
+            contract_1 = pair_a
             acquired_coin_t1 = starting_amount * swap_1_rate
 
             if a_base == b_quote and calculated == 0:
-                swap_2_rate = b_bid * (1 - kucoin_fee_rate)
+                swap_2_rate = (1 / b_ask) * (1 - kucoin_fee_rate) if b_ask != 0 else 0
                 acquired_coin_t2 = acquired_coin_t1 * swap_2_rate
                 direction_trade_2 = "quote_to_base"
                 contract_2 = pair_b
 
                 if b_base == c_base:
                     swap_3 = c_base
-                    swap_3_rate = (1 / c_ask) * (1 - kucoin_fee_rate) if c_ask != 0 else 0
+                    swap_3_rate = c_bid * (1 - kucoin_fee_rate)
                     direction_trade_3 = "base_to_quote"
                     contract_3 = pair_c
 
                 if b_base == c_quote:
                     swap_3 = c_quote
-                    swap_3_rate = c_bid * (1 - kucoin_fee_rate)
+                    swap_3_rate = (1 / c_ask) * (1 - kucoin_fee_rate) if c_ask != 0 else 0
                     direction_trade_3 = "quote_to_base"
                     contract_3 = pair_c
 
@@ -343,20 +1150,20 @@ def cal_triangular_arb_surface_rate(t_pair, prices_dict):
                 calculated = 1
 
             if a_base == b_base and calculated == 0:
-                swap_2_rate = (1 / b_ask) * (1 - binance_fee_rate) if b_ask != 0 else 0
+                swap_2_rate = b_bid * (1 - binance_fee_rate)
                 acquired_coin_t2 = acquired_coin_t1 * swap_2_rate
                 direction_trade_2 = "base_to_quote"
                 contract_2 = pair_b
 
                 if b_quote == c_base:
                     swap_3 = c_base
-                    swap_3_rate = (1 / c_ask) * (1 - okx_fee_rate) if c_ask != 0 else 0
+                    swap_3_rate = c_bid * (1 - okx_fee_rate)
                     direction_trade_3 = "base_to_quote"
                     contract_3 = pair_c
 
                 if b_quote == c_quote:
                     swap_3 = c_quote
-                    swap_3_rate = c_bid * (1 - okx_fee_rate)
+                    swap_3_rate = (1 / c_ask) * (1 - okx_fee_rate) if c_ask != 0 else 0
                     direction_trade_3 = "quote_to_base"
                     contract_3 = pair_c
 
@@ -364,20 +1171,20 @@ def cal_triangular_arb_surface_rate(t_pair, prices_dict):
                 calculated = 1
 
             if a_base == c_quote and calculated == 0:
-                swap_2_rate = c_bid * (1 - okx_fee_rate)
+                swap_2_rate = (1 / c_ask) * (1 - okx_fee_rate) if c_ask != 0 else 0
                 acquired_coin_t2 = acquired_coin_t1 * swap_2_rate
                 direction_trade_2 = "quote_to_base"
                 contract_2 = pair_c
 
                 if c_base == b_base:
                     swap_3 = b_base
-                    swap_3_rate = (1 / b_ask) * (1 - binance_fee_rate) if b_ask != 0 else 0
+                    swap_3_rate = b_bid * (1 - binance_fee_rate)
                     direction_trade_3 = "base_to_quote"
                     contract_3 = pair_b
 
                 if c_base == b_quote:
                     swap_3 = b_quote
-                    swap_3_rate = b_bid * (1 - binance_fee_rate)
+                    swap_3_rate = (1 / b_ask) * (1 - binance_fee_rate) if b_ask != 0 else 0
                     direction_trade_3 = "quote_to_base"
                     contract_3 = pair_b
 
@@ -385,20 +1192,20 @@ def cal_triangular_arb_surface_rate(t_pair, prices_dict):
                 calculated = 1
 
             if a_base == c_base and calculated == 0:
-                swap_2_rate = (1 / c_ask) * (1 - okx_fee_rate) if c_ask != 0 else 0
+                swap_2_rate = c_bid * (1 - okx_fee_rate)
                 acquired_coin_t2 = acquired_coin_t1 * swap_2_rate
                 direction_trade_2 = "base_to_quote"
                 contract_2 = pair_c
 
                 if c_quote == b_base:
                     swap_3 = b_base
-                    swap_3_rate = (1 / b_ask) * (1 - binance_fee_rate) if b_ask != 0 else 0
+                    swap_3_rate = b_bid * (1 - binance_fee_rate)
                     direction_trade_3 = "base_to_quote"
                     contract_3 = pair_b
 
                 if c_quote == b_quote:
                     swap_3 = b_quote
-                    swap_3_rate = b_bid * (1 - binance_fee_rate)
+                    swap_3_rate = (1 / b_ask) * (1 - binance_fee_rate) if b_ask != 0 else 0
                     direction_trade_3 = "quote_to_base"
                     contract_3 = pair_b
 
@@ -435,39 +1242,1800 @@ def cal_triangular_arb_surface_rate(t_pair, prices_dict):
 
     return surface_dict
 
+def compile_surface_legs(t_pair, direction):
+    # Table form of the branch tree in cal_triangular_arb_surface_rate: each leg
+    # is (contract, invert_ask, fee_factor, direction_trade), checked in the same order.
+    a_base = t_pair['a_base']
+    a_quote = t_pair['a_quote']
+    b_base = t_pair['b_base']
+    b_quote = t_pair['b_quote']
+    c_base = t_pair['c_base']
+    c_quote = t_pair['c_quote']
+    pair_a = t_pair['pair_a']
+    pair_b = t_pair['pair_b']
+    pair_c = t_pair['pair_c']
+
+    if direction == "forward":
+        swap_1 = a_base
+        swap_2 = a_quote
+        leg_1 = (pair_a, False, 1 - kucoin_fee_rate, "base_to_quote")
+    else:
+        swap_1 = a_quote
+        swap_2 = a_base
+        leg_1 = (pair_a, True, 1 - kucoin_fee_rate, "quote_to_base")
+
+    if swap_2 == b_quote:
+        leg_2 = (pair_b, True, 1 - kucoin_fee_rate, "quote_to_base")
+        held, pair_3, base_3, quote_3, fee_3 = b_base, pair_c, c_base, c_quote, kucoin_fee_rate
+    elif swap_2 == b_base:
+        leg_2 = (pair_b, False, 1 - binance_fee_rate, "base_to_quote")
+        held, pair_3, base_3, quote_3, fee_3 = b_quote, pair_c, c_base, c_quote, okx_fee_rate
+    elif swap_2 == c_quote:
+        leg_2 = (pair_c, True, 1 - okx_fee_rate, "quote_to_base")
+        held, pair_3, base_3, quote_3, fee_3 = c_base, pair_b, b_base, b_quote, binance_fee_rate
+    elif swap_2 == c_base:
+        leg_2 = (pair_c, False, 1 - okx_fee_rate, "base_to_quote")
+        held, pair_3, base_3, quote_3, fee_3 = c_quote, pair_b, b_base, b_quote, binance_fee_rate
+    else:
+        return None
+
+    if held == quote_3:
+        swap_3 = quote_3
+        leg_3 = (pair_3, True, 1 - fee_3, "quote_to_base")
+    elif held == base_3:
+        swap_3 = base_3
+        leg_3 = (pair_3, False, 1 - fee_3, "base_to_quote")
+    else:
+        swap_3 = 0
+        leg_3 = (pair_3, False, 0.0, None)
+
+    return (swap_1, swap_2, swap_3), (leg_1, leg_2, leg_3)
+
+class SurfaceRateEngine:
+    # All triangles compiled to (2 * n_triangles, 3) leg arrays, row 2i forward
+    # and 2i + 1 reverse, so a poll is one gather and two products. refresh()
+    # re-scores only the triangles touching symbols that moved since the last
+    # snapshot version it saw, and keeps the profitable ones in a lazy heap.
+    __slots__ = ("structured_pairs", "n_symbols", "gather_index", "fee_factor",
+                 "valid", "legs", "swaps", "rates", "acquired", "profit_loss_perc",
+                 "symbol_offsets", "symbol_triangles", "prices", "best", "heap", "heap_floor",
+                 "seen_version", "evaluated", "evaluated_total", "ticks")
+
+    def __init__(self, structured_pairs, snapshot):
+        symbol_index = snapshot.symbol_index
+        n_rows = 2 * len(structured_pairs)
+        self.structured_pairs = structured_pairs
+        self.n_symbols = len(symbol_index)
+        leg_index = np.zeros((n_rows, 3), dtype=np.intp)
+        invert = np.zeros((n_rows, 3), dtype=bool)
+        self.fee_factor = np.zeros((n_rows, 3), dtype=np.float64)
+        self.valid = np.zeros(n_rows, dtype=bool)
+        self.legs = [None] * n_rows
+        self.swaps = [None] * n_rows
+
+        for i, t_pair in enumerate(structured_pairs):
+            for d, direction in enumerate(('forward', 'reverse')):
+                row = 2 * i + d
+                compiled = compile_surface_legs(t_pair, direction)
+                if compiled is None:
+                    continue
+                self.swaps[row], self.legs[row] = compiled
+                for j, (contract, invert_ask, fee_factor, _) in enumerate(self.legs[row]):
+                    leg_index[row, j] = symbol_index[contract]
+                    invert[row, j] = invert_ask
+                    self.fee_factor[row, j] = fee_factor
+                self.valid[row] = True
+
+        # Bids and inverted asks are concatenated per poll, so the invert flag
+        # becomes an offset into one price vector.
+        self.gather_index = leg_index + invert * self.n_symbols
+        self.rates = None
+        self.acquired = None
+        self.profit_loss_perc = None
+
+        # symbol -> triangles reverse index in CSR form.
+        triangles = np.repeat(np.arange(n_rows) // 2, 3).reshape(n_rows, 3)[self.valid].ravel()
+        symbols = leg_index[self.valid].ravel()
+        order = np.argsort(symbols, kind='stable')
+        self.symbol_triangles = triangles[order]
+        self.symbol_offsets = np.zeros(self.n_symbols + 1, dtype=np.intp)
+        np.cumsum(np.bincount(symbols, minlength=self.n_symbols), out=self.symbol_offsets[1:])
+
+        self.prices = None
+        self.best = None
+        self.heap = []
+        self.heap_floor = None
+        self.seen_version = None
+        self.evaluated = 0
+        self.evaluated_total = 0
+        self.ticks = 0
+
+    def compute(self, snapshot):
+        bids = np.frombuffer(snapshot.bids, dtype=np.float64)
+        asks = np.frombuffer(snapshot.asks, dtype=np.float64)
+        inv_asks = np.divide(1.0, asks, out=np.zeros_like(asks), where=asks != 0)
+
+        self.rates = np.concatenate((bids, inv_asks))[self.gather_index] * self.fee_factor
+        self.acquired = np.cumprod(self.rates, axis=1)
+        profit_loss_perc = (self.acquired[:, 2] - 1) * 100
+        profit_loss_perc[~self.valid] = np.nan
+        self.profit_loss_perc = profit_loss_perc.reshape(-1, 2)
+        return self.profit_loss_perc
+
+    def invalidate(self):
+        self.seen_version = None
+
+    def dirty_triangles(self, changed):
+        changed = np.asarray(changed, dtype=np.intp)
+        starts = self.symbol_offsets[changed]
+        counts = self.symbol_offsets[changed + 1] - starts
+        ends = np.cumsum(counts)
+        index = np.repeat(starts - (ends - counts), counts) + np.arange(ends[-1] if len(ends) else 0)
+        return np.unique(self.symbol_triangles[index])
+
+    def refresh(self, snapshot, min_rate=0):
+        # Incremental only when exactly one update happened since the last
+        # refresh and it touched few triangles; a skipped version, a new
+        # min_rate or a broad move re-scores everything.
+        current = self.seen_version is not None and min_rate == self.heap_floor
+        if current and snapshot.version == self.seen_version:
+            self.evaluated = 0
+            self.ticks += 1
+            return self.evaluated
+        dirty = None
+        if current and snapshot.version == self.seen_version + 1:
+            changed = snapshot.changed
+            dirty = self.dirty_triangles(changed)
+            if len(dirty) > surface_incremental_max_fraction * len(self.structured_pairs):
+                dirty = None
+        if dirty is None:
+            self.full_refresh(snapshot, min_rate)
+            self.seen_version = snapshot.version
+            self.evaluated_total += self.evaluated
+            self.ticks += 1
+            return self.evaluated
+
+        bids = np.frombuffer(snapshot.bids, dtype=np.float64)
+        asks = np.frombuffer(snapshot.asks, dtype=np.float64)
+        self.prices[changed] = bids[changed]
+        changed_asks = asks[changed]
+        self.prices[self.n_symbols + changed] = np.divide(1.0, changed_asks, out=np.zeros_like(changed_asks),
+                                                          where=changed_asks != 0)
+
+        rows = (2 * dirty[:, None] + np.array([0, 1])).ravel()
+        rates = self.prices[self.gather_index[rows]] * self.fee_factor[rows]
+        acquired = np.cumprod(rates, axis=1)
+        self.rates[rows] = rates
+        self.acquired[rows] = acquired
+        perc = (acquired[:, 2] - 1) * 100
+        perc[~self.valid[rows]] = np.nan
+        self.profit_loss_perc[dirty] = perc.reshape(-1, 2)
+        self.score(dirty, min_rate)
+
+        self.seen_version = snapshot.version
+        self.evaluated = len(dirty)
+        self.evaluated_total += self.evaluated
+        self.ticks += 1
+        return self.evaluated
+
+    def full_refresh(self, snapshot, min_rate):
+        bids = np.frombuffer(snapshot.bids, dtype=np.float64)
+        asks = np.frombuffer(snapshot.asks, dtype=np.float64)
+        inv_asks = np.divide(1.0, asks, out=np.zeros_like(asks), where=asks != 0)
+        self.prices = np.concatenate((bids, inv_asks))
+        self.compute(snapshot)
+        self.best = np.full(len(self.structured_pairs), np.nan)
+        self.heap = []
+        self.heap_floor = min_rate
+        self.score(np.arange(len(self.structured_pairs)), min_rate)
+        self.evaluated = len(self.structured_pairs)
+
+    def score(self, triangles, min_rate):
+        perc = self.profit_loss_perc[triangles]
+        best = np.where(perc[:, 0] > 0, perc[:, 0], perc[:, 1])
+        self.best[triangles] = best
+        for i in triangles[best > min_rate]:
+            heapq.heappush(self.heap, (-self.best[i], i))
+        if len(self.heap) > 4 * len(self.structured_pairs) // 3 + 64:
+            live = np.flatnonzero(self.best > min_rate)
+            self.heap = [(-self.best[i], i) for i in live]
+            heapq.heapify(self.heap)
+
+    def top_k(self, snapshot, k=surface_top_k, min_rate=0):
+        # Heap entries go stale when their triangle is re-scored; they are
+        # dropped as they surface instead of being searched for on update.
+        self.refresh(snapshot, min_rate)
+        heap = self.heap
+        best = self.best
+        found = []
+        seen = set()
+        while heap and len(found) < k:
+            neg_best, i = heapq.heappop(heap)
+            if i in seen or best[i] != -neg_best or not best[i] > min_rate:
+                continue
+            seen.add(i)
+            found.append((neg_best, i))
+        for entry in found:
+            heapq.heappush(heap, entry)
+        perc = self.profit_loss_perc
+        return [self.surface_dict(2 * i + (0 if perc[i, 0] > 0 else 1)) for _, i in found]
+
+    def surface_dict(self, row):
+        (swap_1, swap_2, swap_3), legs = self.swaps[row], self.legs[row]
+        rates = self.rates[row]
+        acquired = self.acquired[row]
+        profit_loss = float(acquired[2]) - 1
+        return {
+            "swap_1": swap_1,
+            "swap_2": swap_2,
+            "swap_3": swap_3,
+            "contract_1": legs[0][0],
+            "contract_2": legs[1][0],
+            "contract_3": legs[2][0],
+            "direction_trade_1": legs[0][3],
+            "direction_trade_2": legs[1][3],
+            "direction_trade_3": legs[2][3],
+            "starting_amount": 1,
+            "acquired_coin_t1": float(acquired[0]),
+            "acquired_coin_t2": float(acquired[1]),
+            "acquired_coin_t3": float(acquired[2]),
+            "swap_1_rate": float(rates[0]),
+            "swap_2_rate": float(rates[1]),
+            "swap_3_rate": float(rates[2]),
+            "profit_loss": profit_loss,
+            "profit_loss_perc": (profit_loss / 1) * 100 if profit_loss != 0 else 0,
+            "direction": "forward" if row % 2 == 0 else "reverse",
+        }
+
+class SharedPriceArray:
+    # One shared-memory block: an int64 sequence counter followed by the bid
+    # and ask float64 arrays. The counter is a seqlock: odd while the feed is
+    # writing, so readers that saw it change retry instead of using torn prices.
+    def __init__(self, n_symbols, name=None):
+        size = 8 + 16 * max(n_symbols, 1)
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size if self.owner else 0)
+        self.n_symbols = n_symbols
+        self.sequence = np.ndarray((1,), dtype=np.int64, buffer=self.shm.buf)
+        self.bids = np.ndarray((n_symbols,), dtype=np.float64, buffer=self.shm.buf, offset=8)
+        self.asks = np.ndarray((n_symbols,), dtype=np.float64, buffer=self.shm.buf, offset=8 + 8 * n_symbols)
+        if self.owner:
+            self.sequence[0] = 0
+            self.bids[:] = np.nan
+            self.asks[:] = np.nan
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def write(self, bids, asks):
+        self.sequence[0] += 1
+        self.bids[:] = np.frombuffer(bids, dtype=np.float64)
+        self.asks[:] = np.frombuffer(asks, dtype=np.float64)
+        self.sequence[0] += 1
+        return int(self.sequence[0])
+
+    def close(self):
+        del self.sequence, self.bids, self.asks
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+class SharedTickerView:
+    # TickerSnapshot stand-in over a SharedPriceArray, read in place.
+    __slots__ = ("symbol_index", "bids", "asks", "version", "changed")
+
+    def __init__(self, symbol_index, prices):
+        self.symbol_index = symbol_index
+        self.bids = prices.bids
+        self.asks = prices.asks
+        self.version = 0
+        self.changed = None
+
+def detection_worker(worker_id, shm_name, symbol_index, shard, wake, stop, results, k, min_rate):
+    prices = SharedPriceArray(len(symbol_index), name=shm_name)
+    view = SharedTickerView(symbol_index, prices)
+    surface_engine = SurfaceRateEngine(shard, view)
+    try:
+        while not stop.is_set():
+            if not wake.wait(0.1):
+                continue
+            wake.clear()
+            while True:
+                sequence = int(prices.sequence[0])
+                if sequence % 2:
+                    continue
+                surface_engine.invalidate()
+                candidates = surface_engine.top_k(view, k, min_rate)
+                if int(prices.sequence[0]) == sequence:
+                    break
+            results.put((sequence, worker_id, candidates, surface_engine.evaluated))
+    finally:
+        del view
+        prices.close()
+
+class ShardedSurfaceDetector:
+    # Triangles are dealt round-robin to worker processes. top_k() publishes
+    # the snapshot into shared memory, wakes every worker and merges the
+    # per-shard candidates, so it drops in where SurfaceRateEngine.top_k is used
+    # and execute_arbitrage stays in the calling process.
+    def __init__(self, structured_pairs, snapshot, workers=detection_workers, k=surface_top_k,
+                 min_rate=profit_threshold):
+        self.k = k
+        self.min_rate = min_rate
+        self.prices = SharedPriceArray(len(snapshot.symbol_index))
+        self.results = multiprocessing.Queue()
+        self.stop = multiprocessing.Event()
+        self.wakes = []
+        self.processes = []
+        self.evaluated = 0
+        self.evaluated_total = 0
+        self.ticks = 0
+        for worker_id in range(workers):
+            wake = multiprocessing.Event()
+            process = multiprocessing.Process(
+                target=detection_worker, daemon=True,
+                args=(worker_id, self.prices.name, dict(snapshot.symbol_index), structured_pairs[worker_id::workers],
+                      wake, self.stop, self.results, k, min_rate))
+            process.start()
+            self.wakes.append(wake)
+            self.processes.append(process)
+
+    def top_k(self, snapshot, k=None, min_rate=None):
+        k = self.k if k is None else k
+        min_rate = self.min_rate if min_rate is None else min_rate
+        sequence = self.prices.write(snapshot.bids, snapshot.asks)
+        for wake in self.wakes:
+            wake.set()
+
+        candidates = []
+        pending = len(self.processes)
+        self.evaluated = 0
+        deadline = time.monotonic() + shard_result_timeout
+        while pending:
+            try:
+                result_sequence, _, shard_candidates, evaluated = self.results.get(
+                    timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                event_log.log("warning", "surface", "workers_timed_out", pending=pending,
+                              timeout_seconds=shard_result_timeout)
+                break
+            if result_sequence != sequence:
+                continue
+            pending -= 1
+            self.evaluated += evaluated
+            candidates.extend(shard_candidates)
+        self.evaluated_total += self.evaluated
+        self.ticks += 1
+        candidates = [candidate for candidate in candidates if candidate['profit_loss_perc'] > min_rate]
+        candidates.sort(key=lambda candidate: candidate['profit_loss_perc'], reverse=True)
+        return candidates[:k]
+
+    def close(self):
+        self.stop.set()
+        for process in self.processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+        self.prices.close()
+
+def parse_bulk_tickers(venue, payload):
+    if venue == "Kucoin":
+        return ((x['symbol'], x['buy'], x['sell']) for x in payload['data']['ticker'])
+    if venue == "Binance":
+        return ((x['symbol'], x['bidPrice'], x['askPrice']) for x in payload)
+    return ((x['instId'], x['bidPx'], x['askPx']) for x in payload['data'])
+
+class PriceMatrix:
+    # venues x pairs bid/ask matrix for same-symbol spatial arbitrage; each
+    # venue's bulk ticker payload overwrites its row in place.
+    def __init__(self, pairs, venues=("Kucoin", "Binance", "OKX"), mapping=None):
+        mapping = symbol_mapping if mapping is None else mapping
+        self.pairs = list(pairs)
+        self.venues = list(venues)
+        self.symbols = [[mapping.get(pair, {}).get(venue) for pair in self.pairs] for venue in self.venues]
+        self.symbol_index = [{symbol: j for j, symbol in enumerate(row) if symbol} for row in self.symbols]
+        self.bids = np.full((len(self.venues), len(self.pairs)), np.nan)
+        self.asks = np.full((len(self.venues), len(self.pairs)), np.nan)
+        fees = np.array([venue_fee_rates[venue] for venue in self.venues])
+        # keep[b, s]: fraction kept after paying the buy fee on b and sell fee on s.
+        self.keep = np.outer(1 - fees, 1 - fees)[:, :, None]
+        self.same_venue = np.eye(len(self.venues), dtype=bool)[:, :, None]
+
+    def update(self, venue, payload):
+        v = self.venues.index(venue)
+        symbol_index = self.symbol_index[v]
+        index, bids, asks = [], [], []
+        for symbol, bid, ask in parse_bulk_tickers(venue, payload):
+            j = symbol_index.get(symbol)
+            if j is None:
+                continue
+            index.append(j)
+            bids.append(bid or 'nan')
+            asks.append(ask or 'nan')
+        self.bids[v] = np.nan
+        self.asks[v] = np.nan
+        if index:
+            self.bids[v, index] = np.array(bids, dtype=float)
+            self.asks[v, index] = np.array(asks, dtype=float)
+        return self
+
+    def edges(self):
+        # edges[b, s, j]: net return of buying pair j on venue b and selling it on venue s.
+        with np.errstate(divide='ignore', invalid='ignore'):
+            edges = self.bids[None, :, :] / self.asks[:, None, :] * self.keep - 1
+        edges[np.broadcast_to(self.same_venue, edges.shape) | ~np.isfinite(edges)] = -np.inf
+        return edges
+
+    def top_k(self, k=spatial_top_k, min_edge=spatial_min_edge):
+        edges = self.edges()
+        flat = edges.ravel()
+        candidates = np.flatnonzero(flat > min_edge)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(flat[candidates], -k)[-k:]]
+        candidates = candidates[np.argsort(-flat[candidates], kind='stable')]
+        opportunities = []
+        for buy, sell, j in zip(*np.unravel_index(candidates, edges.shape)):
+            opportunities.append({
+                "pair": self.pairs[j],
+                "buy_venue": self.venues[buy],
+                "buy_symbol": self.symbols[buy][j],
+                "buy_price": float(self.asks[buy, j]),
+                "sell_venue": self.venues[sell],
+                "sell_symbol": self.symbols[sell][j],
+                "sell_price": float(self.bids[sell, j]),
+                "edge": float(edges[buy, sell, j])
+            })
+        return opportunities
+
+def fetch_bulk_tickers(venue):
+    try:
+        response = requests.get(bulk_ticker_urls[venue])
+        rate_limiters[venue].observe_headers(response.headers)
+        return response.json()
+    except Exception as e:
+        event_log.log("error", "spatial", "fetch_failed", venue=venue, error=str(e))
+        return None
+
+async def update_price_matrix(price_matrix, venue):
+    await handle_rate_limits(venue, endpoint_weight(venue, "tickers"), PRIORITY_MARKET_DATA)
+    payload = await run_blocking(fetch_bulk_tickers, venue)
+    if payload is not None:
+        price_matrix.update(venue, payload)
+
+async def scan_spatial_opportunities(price_matrix, interval=1):
+    while True:
+        await asyncio.gather(*(update_price_matrix(price_matrix, venue) for venue in price_matrix.venues))
+        for opportunity in price_matrix.top_k():
+            event_log.log("info", "spatial", "opportunity", symbol=opportunity['pair'],
+                          buy_venue=opportunity['buy_venue'], buy_price=opportunity['buy_price'],
+                          sell_venue=opportunity['sell_venue'], sell_price=opportunity['sell_price'],
+                          edge=opportunity['edge'])
+        await asyncio.sleep(interval)
+
+class LogRateCycleDetector:
+    # Nodes are (venue, asset); an edge u -> v weighs -log(rate * (1 - fee)), so
+    # a cycle whose weights sum below zero multiplies back to more than 1.
+    # The same asset on two venues is joined by transfer edges.
+    def __init__(self, max_length=cycle_max_length, transfer_cost=transfer_cost_rate, mapping=None):
+        mapping = symbol_mapping if mapping is None else mapping
+        self.max_length = max_length
+        self.transfer_weight = -math.log(1 - transfer_cost)
+        self.node_index = {}
+        self.nodes = []
+        self.out_edges = []
+        self.edge_legs = {}
+        self.asset_nodes = {}
+        self.pair_symbols = {}
+        for pair, venues in mapping.items():
+            for venue, symbol in venues.items():
+                if symbol:
+                    self.pair_symbols.setdefault(venue, {})[symbol] = pair
+
+    def node(self, venue, asset, touched):
+        key = (venue, asset)
+        u = self.node_index.get(key)
+        if u is None:
+            u = self.node_index[key] = len(self.nodes)
+            self.nodes.append(key)
+            self.out_edges.append({})
+            for v in self.asset_nodes.setdefault(asset, []):
+                self.set_edge(u, v, self.transfer_weight, (None, asset, "transfer"), touched)
+                self.set_edge(v, u, self.transfer_weight, (None, asset, "transfer"), touched)
+            self.asset_nodes[asset].append(u)
+        return u
+
+    def set_edge(self, u, v, weight, leg, touched):
+        if weight is None:
+            if self.out_edges[u].pop(v, None) is not None:
+                del self.edge_legs[(u, v)]
+            return
+        if self.out_edges[u].get(v) != weight:
+            self.out_edges[u][v] = weight
+            self.edge_legs[(u, v)] = leg
+            touched.append((u, v))
+
+    def update_pair(self, venue, pair, bid, ask, touched):
+        base, quote = pair.split('-')[:2]
+        keep = 1 - venue_fee_rates[venue]
+        b = self.node(venue, base, touched)
+        q = self.node(venue, quote, touched)
+        self.set_edge(b, q, -math.log(bid * keep) if bid > 0 else None, (venue, pair, "base_to_quote"), touched)
+        self.set_edge(q, b, -math.log(keep / ask) if ask > 0 else None, (venue, pair, "quote_to_base"), touched)
+
+    def update_venue(self, venue, payload):
+        # Returns the edges whose weight changed; only cycles through them are re-checked.
+        touched = []
+        pair_symbols = self.pair_symbols.get(venue, {})
+        for symbol, bid, ask in parse_bulk_tickers(venue, payload):
+            pair = symbol if venue == "Kucoin" else pair_symbols.get(symbol)
+            if pair is None:
+                continue
+            try:
+                bid, ask = float(bid), float(ask)
+            except (TypeError, ValueError):
+                bid = ask = 0.0
+            self.update_pair(venue, pair, bid, ask, touched)
+        return touched
+
+    def best_paths(self, source, hops):
+        # Hop-bounded Bellman-Ford from source, relaxing only out of the nodes
+        # improved in the previous round. layers[k][x] = (weight, predecessor).
+        layers = [{source: (0.0, None)}]
+        best = {source: 0.0}
+        out_edges = self.out_edges
+        for _ in range(hops):
+            relaxed = {}
+            for x, (weight, _) in layers[-1].items():
+                for y, edge_weight in out_edges[x].items():
+                    candidate = weight + edge_weight
+                    if candidate < best.get(y, float('inf')):
+                        best[y] = candidate
+                        relaxed[y] = (candidate, x)
+            if not relaxed:
+                break
+            layers.append(relaxed)
+        return layers
+
+    def detect(self, touched=None, min_rate=0):
+        if touched is None:
+            touched = list(self.edge_legs)
+        threshold = -math.log1p(min_rate)
+        by_target = {}
+        for u, v in touched:
+            if v in self.out_edges[u]:
+                by_target.setdefault(v, []).append(u)
+
+        cycles = {}
+        for v, sources in by_target.items():
+            layers = self.best_paths(v, self.max_length - 1)
+            for u in sources:
+                for depth in range(len(layers) - 1, 0, -1):
+                    if u in layers[depth]:
+                        break
+                else:
+                    continue
+                weight = self.out_edges[u][v] + layers[depth][u][0]
+                if weight >= threshold:
+                    continue
+                path = [u]
+                node = u
+                for k in range(depth, 0, -1):
+                    node = layers[k][node][1]
+                    path.append(node)
+                path.reverse()
+                if len(set(path)) != len(path):
+                    continue
+                start = path.index(min(path))
+                cycle = tuple(path[start:] + path[:start])
+                cycles[cycle] = weight
+        return [self.opportunity(cycle) for cycle, _ in sorted(cycles.items(), key=lambda item: item[1])]
+
+    def opportunity(self, cycle):
+        # Same keys as the surface-rate dicts, numbered per leg, plus the venue
+        # of each leg and the cycle length.
+        opportunity = {"starting_amount": 1}
+        acquired = 1.0
+        for leg, u in enumerate(cycle, 1):
+            v = cycle[leg % len(cycle)]
+            venue, contract, direction = self.edge_legs[(u, v)]
+            rate = math.exp(-self.out_edges[u][v])
+            acquired *= rate
+            opportunity[f"swap_{leg}"] = self.nodes[u][1]
+            opportunity[f"contract_{leg}"] = contract
+            opportunity[f"exchange_{leg}"] = venue
+            opportunity[f"direction_trade_{leg}"] = direction
+            opportunity[f"swap_{leg}_rate"] = rate
+            opportunity[f"acquired_coin_t{leg}"] = acquired
+        profit_loss = acquired - 1
+        opportunity["profit_loss"] = profit_loss
+        opportunity["profit_loss_perc"] = profit_loss * 100
+        opportunity["direction"] = "forward"
+        opportunity["cycle_length"] = len(cycle)
+        return opportunity
+
+def enumerate_log_rate_cycles(detector, max_length=None, min_rate=0):
+    # Exhaustive simple-cycle search, rooted at each cycle's lowest node; the
+    # reference the incremental detector is checked and benchmarked against.
+    max_length = max_length or detector.max_length
+    threshold = -math.log1p(min_rate)
+    out_edges = detector.out_edges
+    cycles = []
+
+    def extend(root, path, weight):
+        u = path[-1]
+        for v, edge_weight in out_edges[u].items():
+            if v == root and len(path) > 1:
+                if weight + edge_weight < threshold:
+                    cycles.append((weight + edge_weight, tuple(path)))
+            elif v > root and v not in path and len(path) < max_length:
+                path.append(v)
+                extend(root, path, weight + edge_weight)
+                path.pop()
+
+    for root in range(len(detector.nodes)):
+        extend(root, [root], 0.0)
+    cycles.sort()
+    return cycles
+
+class BookSide:
+    # Levels kept in parallel arrays sorted best-first. Bids store negated
+    # prices as keys so both sides bisect in ascending order. The prefix sums
+    # are truncated at the first changed level and only re-extended as deep
+    # as a query needs, so top-of-book updates stay cheap.
+    __slots__ = ("sign", "keys", "quantities", "cum_quantity", "cum_notional")
+
+    def __init__(self, sign):
+        self.sign = sign
+        self.keys = array('d')
+        self.quantities = array('d')
+        self.cum_quantity = array('d')
+        self.cum_notional = array('d')
+
+    def __len__(self):
+        return len(self.keys)
+
+    def clear(self):
+        del self.keys[:]
+        del self.quantities[:]
+        del self.cum_quantity[:]
+        del self.cum_notional[:]
+
+    def load(self, levels):
+        sign = self.sign
+        parsed = sorted((sign * float(level[0]), float(level[1])) for level in levels)
+        self.keys = array('d', [key for key, quantity in parsed if quantity > 0])
+        self.quantities = array('d', [quantity for key, quantity in parsed if quantity > 0])
+        self.cum_quantity = array('d')
+        self.cum_notional = array('d')
+
+    def upsert(self, price, quantity):
+        key = self.sign * price
+        keys = self.keys
+        i = bisect.bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            if quantity == 0:
+                del keys[i]
+                del self.quantities[i]
+            else:
+                self.quantities[i] = quantity
+        elif quantity != 0:
+            keys.insert(i, key)
+            self.quantities.insert(i, quantity)
+        else:
+            return
+        del self.cum_quantity[i:]
+        del self.cum_notional[i:]
+
+    def price(self, i):
+        return self.sign * self.keys[i]
+
+    def levels(self, depth=None):
+        sign = self.sign
+        return [[sign * key, quantity] for key, quantity in zip(self.keys[:depth], self.quantities[:depth])]
+
+    def _extend(self, amount=float('inf'), index=None, notional=float('inf')):
+        cum_quantity = self.cum_quantity
+        cum_notional = self.cum_notional
+        i = len(cum_quantity)
+        end = len(self.keys) if index is None else min(index, len(self.keys))
+        total_quantity = cum_quantity[-1] if i else 0
+        total_notional = cum_notional[-1] if i else 0
+        while i < end and total_quantity < amount and total_notional < notional:
+            quantity = self.quantities[i]
+            total_quantity += quantity
+            total_notional += self.sign * self.keys[i] * quantity
+            cum_quantity.append(total_quantity)
+            cum_notional.append(total_notional)
+            i += 1
+
+    def fill(self, amount):
+        # Returns (filled_amount, notional) for taking `amount` from the best level down.
+        cum_quantity = self.cum_quantity
+        if not cum_quantity or cum_quantity[-1] < amount:
+            self._extend(amount)
+        if not cum_quantity:
+            return 0, 0
+        i = bisect.bisect_left(cum_quantity, amount)
+        if i == len(cum_quantity):
+            return cum_quantity[-1], self.cum_notional[-1]
+        filled_before = cum_quantity[i - 1] if i else 0
+        notional_before = self.cum_notional[i - 1] if i else 0
+        return amount, notional_before + (amount - filled_before) * self.price(i)
+
+    def fill_notional(self, notional):
+        # Returns (filled_amount, spent) for spending `notional` from the best level down.
+        cum_notional = self.cum_notional
+        if not cum_notional or cum_notional[-1] < notional:
+            self._extend(notional=notional)
+        if not cum_notional:
+            return 0, 0
+        i = bisect.bisect_left(cum_notional, notional)
+        if i == len(cum_notional):
+            return self.cum_quantity[-1], cum_notional[-1]
+        filled_before = self.cum_quantity[i - 1] if i else 0
+        notional_before = cum_notional[i - 1] if i else 0
+        return filled_before + (notional - notional_before) / self.price(i), notional
+
+    def price_for(self, amount):
+        # Worst level price touched when filling `amount` from the best level down.
+        cum_quantity = self.cum_quantity
+        if not cum_quantity or cum_quantity[-1] < amount:
+            self._extend(amount)
+        if not cum_quantity:
+            return 0
+        return self.price(min(bisect.bisect_left(cum_quantity, amount), len(cum_quantity) - 1))
+
+    def size_within(self, limit_price):
+        # Quantity available at prices no worse than limit_price.
+        i = bisect.bisect_right(self.keys, self.sign * limit_price)
+        if len(self.cum_quantity) < i:
+            self._extend(index=i)
+        return self.cum_quantity[i - 1] if i else 0
+
+class SortedOrderBook:
+    __slots__ = ("bids", "asks", "received_at", "exchange_time")
+
+    def __init__(self):
+        self.bids = BookSide(-1)
+        self.asks = BookSide(1)
+        self.received_at = None
+        self.exchange_time = None
+
+    @classmethod
+    def from_levels(cls, orderbook):
+        book = cls()
+        book.bids.load(orderbook['bids'])
+        book.asks.load(orderbook['asks'])
+        book.received_at = quote_clock()
+        # KuCoin REST books carry "time" and OKX "ts", both in ms; Binance's carry none.
+        exchange_time = orderbook.get('time') or orderbook.get('ts')
+        book.exchange_time = int(exchange_time) / 1000 if exchange_time else None
+        return book
+
+    def age(self, now=None):
+        return quote_age(self.received_at, self.exchange_time, now)
+
+    def side(self, direction):
+        return self.asks if direction == 'buy' else self.bids
+
+    def to_orderbook(self, depth=order_book_depth):
+        return {"bids": self.bids.levels(depth), "asks": self.asks.levels(depth)}
+
+class LocalOrderBook(SortedOrderBook):
+    __slots__ = ("venue", "symbol", "sequence", "synced", "resyncing", "pending")
+
+    def __init__(self, venue, symbol):
+        super().__init__()
+        self.venue = venue
+        self.symbol = symbol
+        self.sequence = None
+        self.synced = False
+        self.resyncing = False
+        self.pending = []
+
+    def reset(self):
+        self.bids.clear()
+        self.asks.clear()
+        self.sequence = None
+        self.synced = False
+        self.pending = []
+
+    def apply_snapshot(self, bids, asks, sequence, exchange_time=None):
+        self.bids.load(bids)
+        self.asks.load(asks)
+        self.sequence = int(sequence)
+        self.synced = True
+        self.received_at = quote_clock()
+        self.exchange_time = int(exchange_time) / 1000 if exchange_time else None
+
+    def apply_levels(self, book_side, levels):
+        for level in levels:
+            book_side.upsert(float(level[0]), float(level[1]))
+
+    def apply_event(self, event):
+        # Returns False on a sequence gap; the caller resyncs from a snapshot.
+        if self.venue == "Binance":
+            if event['u'] <= self.sequence:
+                return True
+            if event['U'] > self.sequence + 1:
+                return False
+            self.apply_levels(self.bids, event['b'])
+            self.apply_levels(self.asks, event['a'])
+            self.sequence = event['u']
+        elif self.venue == "Kucoin":
+            if event['sequenceEnd'] <= self.sequence:
+                return True
+            if event['sequenceStart'] > self.sequence + 1:
+                return False
+            for side, book_side in (('bids', self.bids), ('asks', self.asks)):
+                for price, size, sequence in event['changes'][side]:
+                    if int(sequence) > self.sequence and float(price) != 0:
+                        self.apply_levels(book_side, [(price, size)])
+            self.sequence = event['sequenceEnd']
+        elif self.venue == "OKX":
+            if event['prevSeqId'] != self.sequence:
+                return False
+            self.apply_levels(self.bids, event['bids'])
+            self.apply_levels(self.asks, event['asks'])
+            self.sequence = event['seqId']
+        self.received_at = quote_clock()
+        exchange_time = event.get('E') or event.get('time') or event.get('ts')
+        if exchange_time:
+            self.exchange_time = int(exchange_time) / 1000
+        return True
+
+async def fetch_binance_book_snapshot(symbol):
+    snapshot = await gateways["Binance"].raw_orderbook(symbol, 1000)
+    return snapshot['bids'], snapshot['asks'], snapshot['lastUpdateId']
+
+async def fetch_kucoin_book_snapshot(symbol):
+    snapshot = await gateways["Kucoin"].raw_orderbook(symbol, 100)
+    return snapshot['bids'], snapshot['asks'], snapshot['sequence']
+
+async def fetch_kucoin_ws_url():
+    response = await run_blocking(requests.post, 'https://api.kucoin.com/api/v1/bullet-public')
+    data = response.json()['data']
+    server = data['instanceServers'][0]
+    return f"{server['endpoint']}?token={data['token']}", server['pingInterval'] / 1000
+
+async def ping_kucoin(ws, ping_interval):
+    while True:
+        await asyncio.sleep(ping_interval)
+        await ws.send(json.dumps({"id": str(int(time.time() * 1000)), "type": "ping"}))
+
+class OrderBookStreams:
+    def __init__(self, symbols_by_venue, urls=None, snapshot_sources=None):
+        self.symbols = symbols_by_venue
+        self.books = {(venue, symbol): LocalOrderBook(venue, symbol)
+                      for venue, symbols in symbols_by_venue.items() for symbol in symbols}
+        self.urls = dict(order_book_ws_urls, **(urls or {}))
+        self.snapshot_sources = {
+            "Binance": fetch_binance_book_snapshot,
+            "Kucoin": fetch_kucoin_book_snapshot
+        }
+        self.snapshot_sources.update(snapshot_sources or {})
+        self.messages = {venue: 0 for venue in symbols_by_venue}
+        self.resyncs = {venue: 0 for venue in symbols_by_venue}
+        self.heard = {}
+
+    def get_orderbook(self, venue, symbol):
+        book = self.books.get((venue, symbol))
+        if book is None or not book.synced:
+            return None
+        # A synced book with no gap has seen every change up to the venue's
+        # latest message, so a quiet symbol is as fresh as its connection.
+        heard = self.heard.get(venue)
+        if heard is not None and heard[0] > book.received_at:
+            book.received_at, book.exchange_time = heard
+        return book
+
+    def heard_from(self, venue, exchange_time=None):
+        self.heard[venue] = (quote_clock(), int(exchange_time) / 1000 if exchange_time else None)
+
+    async def run(self):
+        await asyncio.gather(*(self.run_venue(venue) for venue, symbols in self.symbols.items() if symbols))
+
+    async def run_venue(self, venue):
+        stream = {"Binance": self.stream_binance, "Kucoin": self.stream_kucoin, "OKX": self.stream_okx}[venue]
+        while True:
+            try:
+                await stream()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                event_log.log("error", "books", "stream_failed", venue=venue, error=str(e))
+            for symbol in self.symbols[venue]:
+                self.books[(venue, symbol)].reset()
+            await asyncio.sleep(ws_reconnect_seconds)
+
+    def on_event(self, book, event):
+        self.messages[book.venue] += 1
+        self.heard_from(book.venue, event.get('E') or event.get('time') or event.get('ts'))
+        if market_recorder is not None:
+            market_recorder.record("diff", book.venue, book.symbol, event)
+        if not book.synced:
+            book.pending.append(event)
+            self.schedule_resync(book)
+        elif not book.apply_event(event):
+            event_log.log("warning", "books", "sequence_gap", venue=book.venue, symbol=book.symbol)
+            self.resyncs[book.venue] += 1
+            book.reset()
+            book.pending.append(event)
+            self.schedule_resync(book)
+
+    def schedule_resync(self, book):
+        if not book.resyncing:
+            book.resyncing = True
+            asyncio.create_task(self.resync(book))
+
+    async def resync(self, book):
+        try:
+            bids, asks, sequence = await self.snapshot_sources[book.venue](book.symbol)
+            if market_recorder is not None:
+                market_recorder.record("book", book.venue, book.symbol,
+                                       {"bids": bids, "asks": asks, "sequence": sequence})
+            pending = book.pending
+            book.apply_snapshot(bids, asks, sequence)
+            book.pending = []
+            for i, event in enumerate(pending):
+                if not book.apply_event(event):
+                    # Keep the diffs from the gap on; the next snapshot may predate them.
+                    self.resyncs[book.venue] += 1
+                    book.reset()
+                    book.pending = pending[i:]
+                    break
+        except Exception as e:
+            event_log.log("error", "books", "snapshot_failed", venue=book.venue, symbol=book.symbol, error=str(e))
+            book.reset()
+        finally:
+            book.resyncing = False
+        if not book.synced:
+            await asyncio.sleep(ws_reconnect_seconds)
+            self.schedule_resync(book)
+
+    async def stream_binance(self):
+        streams = '/'.join(f"{symbol.lower()}@depth@100ms" for symbol in self.symbols["Binance"])
+        async with websockets.connect(f"{self.urls['Binance']}/stream?streams={streams}") as ws:
+            async for raw in ws:
+                event = fast_json_loads(raw)['data']
+                self.on_event(self.books[("Binance", event['s'])], event)
+
+    async def stream_kucoin(self):
+        url = self.urls["Kucoin"]
+        ping_interval = 18
+        if url is None:
+            url, ping_interval = await fetch_kucoin_ws_url()
+
+        async with websockets.connect(url) as ws:
+            await ws.send(json.dumps({
+                "id": str(int(time.time() * 1000)),
+                "type": "subscribe",
+                "topic": "/market/level2:" + ','.join(self.symbols["Kucoin"]),
+                "response": True
+            }))
+            ping_task = asyncio.create_task(ping_kucoin(ws, ping_interval))
+            try:
+                async for raw in ws:
+                    message = fast_json_loads(raw)
+                    if message.get('type') != 'message':
+                        continue
+                    event = message['data']
+                    self.on_event(self.books[("Kucoin", event['symbol'])], event)
+            finally:
+                ping_task.cancel()
+
+    async def stream_okx(self):
+        # OKX sends the snapshot over the socket, so a gap is fixed by resubscribing.
+        async with websockets.connect(self.urls["OKX"]) as ws:
+            await ws.send(json.dumps({
+                "op": "subscribe",
+                "args": [{"channel": "books", "instId": symbol} for symbol in self.symbols["OKX"]]
+            }))
+            async for raw in ws:
+                if raw == 'pong':
+                    continue
+                message = fast_json_loads(raw)
+                if 'data' not in message:
+                    continue
+                book = self.books[("OKX", message['arg']['instId'])]
+                self.messages["OKX"] += 1
+                for event in message['data']:
+                    self.heard_from("OKX", event.get('ts'))
+                    if message.get('action') == 'snapshot':
+                        book.apply_snapshot(event['bids'], event['asks'], event['seqId'], event.get('ts'))
+                    elif not book.synced or not book.apply_event(event):
+                        event_log.log("warning", "books", "sequence_gap", venue="OKX", symbol=book.symbol)
+                        self.resyncs["OKX"] += 1
+                        book.reset()
+                        args = [{"channel": "books", "instId": book.symbol}]
+                        await ws.send(json.dumps({"op": "unsubscribe", "args": args}))
+                        await ws.send(json.dumps({"op": "subscribe", "args": args}))
+                        break
+
+class MarketRecorder:
+    # Append-only gzip JSON lines. Every flush appends one gzip member, so a
+    # crash loses at most the unflushed buffer and the file stays readable.
+    def __init__(self, path, flush_records=recorder_flush_records):
+        self.path = path
+        self.flush_records = flush_records
+        self.buffer = []
+        self.records = 0
+
+    def record(self, kind, venue, symbol, data, at=None):
+        self.buffer.append(json.dumps({
+            "t": time.time() if at is None else at,
+            "kind": kind,
+            "venue": venue,
+            "symbol": symbol,
+            "data": data
+        }))
+        self.records += 1
+        if len(self.buffer) >= self.flush_records:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        try:
+            with gzip.open(self.path, 'at') as f:
+                f.write('\n'.join(self.buffer) + '\n')
+        except Exception as e:
+            event_log.log("error", "recorder", "write_failed", path=self.path, error=str(e))
+        self.buffer = []
+
+def read_market_recording(path):
+    try:
+        with gzip.open(path, 'rt') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    except EOFError:
+        print(f"Market recording {path} ends in a truncated block, stopping there.")
+
+market_recorder = None
+order_book_streams = None
+
+class KucoinGateway:
+    venue = "Kucoin"
+
+    async def place_order(self, symbol, side, size, price):
+        await handle_rate_limits(self.venue, endpoint_weight(self.venue, "order"), PRIORITY_ORDER)
+        order = await run_blocking(kucoin_client.create_limit_order, symbol=symbol, side=side, size=size, price=price)
+        return order['orderId']
+
+    async def cancel_order(self, symbol, order_id):
+        await handle_rate_limits(self.venue, endpoint_weight(self.venue, "cancel"), PRIORITY_ORDER)
+        return await run_blocking(kucoin_client.cancel_order, order_id)
+
+    async def order_status(self, symbol, order_id):
+        await handle_rate_limits(self.venue, endpoint_weight(self.venue, "status"), PRIORITY_STATUS)
+        order = await run_blocking(kucoin_client.get_order_details, order_id)
+        filled_size = float(order.get('dealSize') or 0)
+        if order['status'] == 'done':
+            state = "canceled" if order.get('cancelExist') and filled_size < float(order.get('size') or 0) else "filled"
+        else:
+            state = "partially_filled" if filled_size > 0 else "open"
+        return {"state": state, "filled_size": filled_size, "raw": order}
+
+    async def raw_orderbook(self, symbol, depth):
+        await handle_rate_limits(self.venue, endpoint_weight(self.venue, "orderbook", depth), PRIORITY_MARKET_DATA)
+        return await run_blocking(kucoin_market_data.get_part_order, symbol, depth)
+
+    async def balances(self):
+        await handle_rate_limits(self.venue, endpoint_weight(self.venue, "balance"), PRIORITY_STATUS)
+        accounts = await run_blocking(kucoin_user.get_account_list, account_type='trade')
+        return {account['currency']: float(account['available']) for account in accounts}
+
+class BinanceGateway:
+    venue = "Binance"
+    states = {"FILLED": "filled", "PARTIALLY_FILLED": "partially_filled", "CANCELED": "canceled",
+              "EXPIRED": "canceled", "REJECTED": "canceled", "NEW": "open"}
+
+    def observe_rate_limits(self):
+        response = getattr(binance_async_client, 'response', None)
+        if response is not None:
+            rate_limiters["Binance"].observe_headers(response.headers)
+
+    async def place_order(self, symbol, side, quantity, price):
+        await handle_rate_limits(self.venue, endpoint_weight(self.venue, "order"), PRIORITY_ORDER)
+        if side == 'buy':
+            order = await binance_async_client.order_limit_buy(symbol=symbol, quantity=quantity, price=price)
+        else:
+            order = await binance_async_client.order_limit_sell(symbol=symbol, quantity=quantity, price=price)
+        self.observe_rate_limits()
+        return order['orderId']
+
+    async def cancel_order(self, symbol, order_id):
+        await handle_rate_limits(self.venue, endpoint_weight(self.venue, "cancel"), PRIORITY_ORDER)
+        response = await binance_async_client.cancel_order(symbol=symbol, orderId=order_id)
+        self.observe_rate_limits()
+        return response
+
+    async def order_status(self, symbol, order_id):
+        await handle_rate_limits(self.venue, endpoint_weight(self.venue, "status"), PRIORITY_STATUS)
+        order = await binance_async_client.get_order(symbol=symbol, orderId=order_id)
+        self.observe_rate_limits()
+        return {"state": self.states.get(order['status'], "open"),
+                "filled_size": float(order.get('executedQty') or 0), "raw": order}
+
+    async def raw_orderbook(self, symbol, depth):
+        await handle_rate_limits(self.venue, endpoint_weight(self.venue, "orderbook", depth), PRIORITY_MARKET_DATA)
+        orderbook = await binance_async_client.get_order_book(symbol=symbol, limit=depth)
+        self.observe_rate_limits()
+        return orderbook
+
+    async def balances(self):
+        await handle_rate_limits(self.venue, endpoint_weight(self.venue, "balance"), PRIORITY_STATUS)
+        account = await binance_async_client.get_account()
+        self.observe_rate_limits()
+        return {balance['asset']: float(balance['free']) for balance in account['balances']}
+
+class OKXGateway:
+    venue = "OKX"
+    states = {"filled": "filled", "partially_filled": "partially_filled", "canceled": "canceled",
+              "mmp_canceled": "canceled", "live": "open"}
+
+    async def place_order(self, symbol, side, size, price):
+        await handle_rate_limits(self.venue, endpoint_weight(self.venue, "order"), PRIORITY_ORDER)
+        order = await run_blocking(okx_client.create_order, instId=symbol, tdMode='cash', side=side,
+                                   ordType='limit', sz=str(size), px=str(price))
+        return order['data'][0]['ordId']
+
+    async def place_stop_loss(self, symbol, side, size, stop_price):
+        await handle_rate_limits(self.venue, endpoint_weight(self.venue, "order"), PRIORITY_ORDER)
+        return await run_blocking(okx_client.create_order, instId=symbol, tdMode='cash', side=side,
+                                  ordType='stop_loss', sz=str(size), slTriggerPx=str(stop_price))
+
+    async def cancel_order(self, symbol, order_id):
+        await handle_rate_limits(self.venue, endpoint_weight(self.venue, "cancel"), PRIORITY_ORDER)
+        return await run_blocking(okx_client.cancel_order, instId=symbol, ordId=order_id)
+
+    async def order_status(self, symbol, order_id):
+        await handle_rate_limits(self.venue, endpoint_weight(self.venue, "status"), PRIORITY_STATUS)
+        order = (await run_blocking(okx_client.get_order_details, instId=symbol, ordId=order_id))['data'][0]
+        return {"state": self.states.get(order['state'], "open"),
+                "filled_size": venue_base_size(self.venue, symbol, float(order.get('accFillSz') or 0)),
+                "raw": order}
+
+    async def raw_orderbook(self, symbol, depth):
+        await handle_rate_limits(self.venue, endpoint_weight(self.venue, "orderbook", depth), PRIORITY_MARKET_DATA)
+        response = await okx_async_client.get(f'/api/v5/market/books?instId={symbol}&sz={depth}')
+        return response.data[0]
+
+    async def balances(self):
+        await handle_rate_limits(self.venue, endpoint_weight(self.venue, "balance"), PRIORITY_STATUS)
+        response = await okx_async_client.get('/api/v5/account/balance')
+        return {detail['ccy']: float(detail['availBal']) for detail in response.data[0]['details']}
+
+gateways = {
+    "Kucoin": KucoinGateway(),
+    "Binance": BinanceGateway(),
+    "OKX": OKXGateway()
+}
+
+class EventLoopLagMonitor:
+    # Sleeps for a fixed interval and records how late the loop woke it up;
+    # any blocking call on the loop shows up directly as lag.
+    __slots__ = ("interval", "lags", "max_lag")
+
+    def __init__(self, interval=0.01, window=1000):
+        self.interval = interval
+        self.lags = collections.deque(maxlen=window)
+        self.max_lag = 0.0
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - expected, 0.0)
+            self.lags.append(lag)
+            if lag > self.max_lag:
+                self.max_lag = lag
+
+    def summary(self):
+        lags = sorted(self.lags)
+        if not lags:
+            return {"samples": 0, "mean": 0, "p99": 0, "max": self.max_lag}
+        return {
+            "samples": len(lags),
+            "mean": sum(lags) / len(lags),
+            "p99": lags[min(int(len(lags) * 0.99), len(lags) - 1)],
+            "max": self.max_lag
+        }
+
+event_loop_lag = EventLoopLagMonitor()
+
+class LatencyHistogram:
+    # HDR-style log-linear buckets over integer nanoseconds: 64 linear
+    # sub-buckets per power of two, so any value is kept within ~1.6%.
+    __slots__ = ("counts", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    @staticmethod
+    def bucket(value):
+        shift = value.bit_length() - 7
+        if shift <= 0:
+            return value
+        return (shift << 6) + (value >> shift)
+
+    @staticmethod
+    def bucket_floor(index):
+        if index < 128:
+            return index
+        shift = (index >> 6) - 1
+        return (index - (shift << 6)) << shift
+
+    def record(self, value):
+        index = self.bucket(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        if not self.count:
+            return 0
+        target = q * self.count
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self.bucket_floor(index), self.max)
+        return self.max
+
+    def cumulative(self, bounds):
+        # Counts at or below each bound, for Prometheus' cumulative buckets.
+        counts = [0] * len(bounds)
+        for index, count in self.counts.items():
+            floor = self.bucket_floor(index)
+            for i, bound in enumerate(bounds):
+                if floor <= bound:
+                    counts[i] += count
+        return counts
+
+class LatencyMetrics:
+    # Spans are two perf_counter_ns() reads and a histogram record; with
+    # enabled False, observe() returns before touching anything.
+    prometheus_bounds = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                         0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, enabled=latency_metrics_enabled):
+        self.enabled = enabled
+        self.histograms = {}
+        self.rejections = {}
+        self.queues = {}
+        self.tick_started = None
+        self.surface_engine = None
+
+    def observe(self, stage, started_ns):
+        if not self.enabled:
+            return
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = LatencyHistogram()
+        histogram.record(time.perf_counter_ns() - started_ns)
+
+    def reject(self, stage, reason, count=1):
+        # Counted even with timing disabled; they say why ticks never reach an order.
+        key = (stage, reason)
+        self.rejections[key] = self.rejections.get(key, 0) + count
+
+    def sample_queue(self, name, depth):
+        # Current and high-water depth per pipeline queue.
+        sample = self.queues.get(name)
+        if sample is None:
+            self.queues[name] = [depth, depth]
+        else:
+            sample[0] = depth
+            sample[1] = max(sample[1], depth)
+
+    def tick(self):
+        self.tick_started = time.perf_counter_ns()
+
+    def order_placed(self):
+        # First order after a tick closes the tick-to-trade span.
+        if self.tick_started is not None:
+            self.observe("tick_to_trade", self.tick_started)
+            self.tick_started = None
+
+    def summary(self):
+        return {stage: {"count": histogram.count,
+                        "p50_ms": histogram.percentile(0.5) / 1e6,
+                        "p99_ms": histogram.percentile(0.99) / 1e6,
+                        "max_ms": histogram.max / 1e6}
+                for stage, histogram in self.histograms.items()}
+
+    def prometheus(self):
+        bounds_ns = [bound * 1e9 for bound in self.prometheus_bounds]
+        lines = ["# TYPE arbot_stage_latency_seconds histogram"]
+        for stage, histogram in self.histograms.items():
+            for bound, count in zip(self.prometheus_bounds, histogram.cumulative(bounds_ns)):
+                lines.append(f'arbot_stage_latency_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'arbot_stage_latency_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+            lines.append(f'arbot_stage_latency_seconds_sum{{stage="{stage}"}} {histogram.total / 1e9}')
+            lines.append(f'arbot_stage_latency_seconds_count{{stage="{stage}"}} {histogram.count}')
+        lines.append("# TYPE arbot_rejections_total counter")
+        for (stage, reason), count in self.rejections.items():
+            lines.append(f'arbot_rejections_total{{stage="{stage}",reason="{reason}"}} {count}')
+        lines.append("# TYPE arbot_queue_depth gauge")
+        for name, (depth, high_water) in self.queues.items():
+            lines.append(f'arbot_queue_depth{{queue="{name}"}} {depth}')
+            lines.append(f'arbot_queue_depth_max{{queue="{name}"}} {high_water}')
+        if self.surface_engine is not None:
+            lines.append("# TYPE arbot_surface_triangles_evaluated gauge")
+            lines.append(f'arbot_surface_triangles_evaluated {self.surface_engine.evaluated}')
+            lines.append("# TYPE arbot_surface_triangles_evaluated_total counter")
+            lines.append(f'arbot_surface_triangles_evaluated_total {self.surface_engine.evaluated_total}')
+            lines.append("# TYPE arbot_surface_ticks_total counter")
+            lines.append(f'arbot_surface_ticks_total {self.surface_engine.ticks}')
+        lines.append("# TYPE arbot_residual_inventory gauge")
+        for asset, amount in balance_ledger.residuals.items():
+            lines.append(f'arbot_residual_inventory{{asset="{asset}"}} {amount}')
+        lines.append("# TYPE arbot_event_log_records_total counter")
+        lines.append(f'arbot_event_log_records_total{{state="written"}} {event_log.written}')
+        lines.append(f'arbot_event_log_records_total{{state="dropped"}} {event_log.dropped}')
+        lines.append("# TYPE arbot_venue_latency_seconds gauge")
+        for venue, seconds in venue_latency.items():
+            lines.append(f'arbot_venue_latency_seconds{{venue="{venue}"}} {seconds}')
+        lag = event_loop_lag.summary()
+        lines.append("# TYPE arbot_event_loop_lag_seconds gauge")
+        lines.append(f'arbot_event_loop_lag_seconds{{stat="p99"}} {lag["p99"]}')
+        lines.append(f'arbot_event_loop_lag_seconds{{stat="max"}} {lag["max"]}')
+        return '\n'.join(lines) + '\n'
+
+    async def serve(self, host=metrics_host, port=metrics_port):
+        async def handle(reader, writer):
+            try:
+                request = await reader.readline()
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                if request.split(b' ')[1:2] == [b'/metrics']:
+                    body = self.prometheus().encode()
+                    status = b'200 OK'
+                else:
+                    body = b'not found\n'
+                    status = b'404 Not Found'
+                writer.write(b'HTTP/1.1 ' + status + b'\r\nContent-Type: text/plain; version=0.0.4\r\n'
+                             b'Content-Length: ' + str(len(body)).encode() + b'\r\nConnection: close\r\n\r\n' + body)
+                await writer.drain()
+            finally:
+                writer.close()
+
+        return await asyncio.start_server(handle, host, port)
+
+    async def log_summary(self, interval=metrics_summary_seconds):
+        while True:
+            await asyncio.sleep(interval)
+            self.log_summary_once()
+
+    def log_summary_once(self):
+        for stage, stats in self.summary().items():
+            event_log.log("info", "metrics", "summary", latency=stage, n=stats['count'], p50_ms=round(stats['p50_ms'], 3),
+                          p99_ms=round(stats['p99_ms'], 3), max_ms=round(stats['max_ms'], 3))
+        for (stage, reason), count in self.rejections.items():
+            event_log.log("info", "metrics", "summary", rejected_at=stage, reason=reason, count=count)
+        for name, (depth, high_water) in self.queues.items():
+            event_log.log("info", "metrics", "summary", queue=name, depth=depth, max=high_water)
+        engine = self.surface_engine
+        if engine is not None and engine.ticks:
+            event_log.log("info", "metrics", "summary", surface_evaluated=engine.evaluated,
+                          total=engine.evaluated_total, ticks=engine.ticks,
+                          avg=round(engine.evaluated_total / engine.ticks, 1))
+
+latency_metrics = LatencyMetrics()
+
+def event_record_dict(record):
+    at_ns, level, stage, event, venue, symbol, order_id, values = record
+    entry = {"ts_ns": at_ns, "level": level, "stage": stage, "event": event}
+    if venue is not None:
+        entry["venue"] = venue
+    if symbol is not None:
+        entry["symbol"] = symbol
+    if order_id is not None:
+        entry["order_id"] = order_id
+    if values:
+        entry.update(values)
+    return entry
+
+def format_event_record(record):
+    at_ns, level, stage, event, venue, symbol, order_id, values = record
+    fields = ' '.join(f"{key}={value}" for key, value in
+                      (("venue", venue), ("symbol", symbol), ("order_id", order_id), *values.items())
+                      if value is not None)
+    return f"{level.upper()} {stage} {event} {fields}".rstrip()
+
+if orjson is not None:
+    def encode_event_record(record):
+        return orjson.dumps(event_record_dict(record), default=str)
+else:
+    def encode_event_record(record):
+        return json.dumps(event_record_dict(record), default=str, separators=(',', ':')).encode()
+
+class EventLog:
+    # log() appends one flat tuple to a deque, which is atomic under the GIL
+    # so gateway threads log without a lock; the writer thread does all the
+    # formatting and encoding, draining in batches to rotating JSONL files.
+    # Past capacity the record is dropped and counted, so callers never wait
+    # on I/O. Within headroom of capacity the check, the append and the drop
+    # count run under a lock, so the count is exact and maxlen never evicts.
+    headroom = 64
+
+    def __init__(self, path=event_log_path, capacity=event_log_capacity, flush_seconds=event_log_flush_seconds,
+                 max_bytes=event_log_max_bytes, backups=event_log_backups, echo=event_log_echo):
+        self.path = path
+        self.capacity = capacity
+        self.flush_seconds = flush_seconds
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.echo = echo
+        self.records = collections.deque(maxlen=capacity)
+        self.full_lock = threading.Lock()
+        self.dropped = 0
+        self.written = 0
+        self.stopping = threading.Event()
+        self.thread = None
+        self.file = None
+
+    def log(self, level, stage, event, venue=None, symbol=None, order_id=None, **values):
+        record = (time.time_ns(), level, stage, event, venue, symbol, order_id, values)
+        if len(self.records) < self.capacity - self.headroom:
+            self.records.append(record)
+            return True
+        with self.full_lock:
+            if len(self.records) >= self.capacity:
+                self.dropped += 1
+                return False
+            self.records.append(record)
+            return True
+
+    def __len__(self):
+        return len(self.records)
+
+    def drain(self):
+        # Only the writer pops, so every record counted here is there to take.
+        records = self.records
+        return [records.popleft() for _ in range(len(records))]
+
+    def rotate(self):
+        self.file.close()
+        if not self.backups:
+            # Nothing to keep; start the file over.
+            self.file = open(self.path, 'wb')
+            return
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+        self.file = open(self.path, 'ab')
+
+    def flush(self):
+        records = self.drain()
+        if not records:
+            return 0
+        if self.echo:
+            sys.stdout.write(''.join(format_event_record(record) + '\n' for record in records))
+            sys.stdout.flush()
+        if self.path:
+            try:
+                if self.file is None:
+                    self.file = open(self.path, 'ab')
+                self.file.write(b''.join(encode_event_record(record) + b'\n' for record in records))
+                self.file.flush()
+                if self.file.tell() > self.max_bytes:
+                    self.rotate()
+            except Exception as e:
+                print(f"Error writing event log {self.path}: {e}")
+        self.written += len(records)
+        return len(records)
+
+    def run(self):
+        while not self.stopping.wait(self.flush_seconds):
+            self.flush()
+        self.flush()
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="event-log", daemon=True)
+            self.thread.start()
+        return self
+
+    def close(self):
+        if self.thread is not None:
+            self.stopping.set()
+            self.thread.join()
+            self.thread = None
+        else:
+            self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+event_log = EventLog()
+
+venue_latency = {"Kucoin": 0.0, "Binance": 0.0, "OKX": 0.0}
+
+def observe_venue_latency(venue, seconds):
+    # EWMA of request round trips per venue, seeded by the first sample.
+    previous = venue_latency.get(venue)
+    venue_latency[venue] = seconds if not previous else \
+        previous + venue_latency_alpha * (seconds - previous)
+
+def quote_age(received_at, exchange_time=None, now=None):
+    if received_at is None:
+        return float('inf')
+    now = quote_clock() if now is None else now
+    return now - (received_at if exchange_time is None else min(received_at, exchange_time))
+
+class TrackedOrder:
+    __slots__ = ("exchange", "symbol", "order_id", "state", "filled_size", "changed", "updated_at")
+
+    def __init__(self, exchange, symbol, order_id):
+        self.exchange = exchange
+        self.symbol = symbol
+        self.order_id = order_id
+        self.state = "open"
+        self.filled_size = 0.0
+        self.changed = asyncio.Event()
+        self.updated_at = 0.0
+
+    @property
+    def done(self):
+        return self.state in ("filled", "canceled")
+
+    async def wait_update(self, timeout=None):
+        # Resolves on the next fill, partial fill or cancel; False on timeout.
+        try:
+            await asyncio.wait_for(self.changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self.changed.clear()
+        return True
+
+class OrderTracker:
+    def __init__(self, max_unclaimed=order_tracker_max_unclaimed):
+        self.orders = {}
+        self.unclaimed = collections.OrderedDict()
+        self.max_unclaimed = max_unclaimed
+        self.stream_connected = {"Kucoin": False, "Binance": False, "OKX": False}
+        self.polls = {"Kucoin": 0, "Binance": 0, "OKX": 0}
+
+    def track(self, exchange, symbol, order_id):
+        key = (exchange, str(order_id))
+        order = self.orders.get(key)
+        if order is None:
+            order = self.unclaimed.pop(key, None) or TrackedOrder(exchange, symbol, order_id)
+            self.orders[key] = order
+        order.symbol = symbol
+        return order
+
+    def forget(self, exchange, order_id):
+        self.orders.pop((exchange, str(order_id)), None)
+
+    def update(self, exchange, order_id, state, filled_size, symbol=None):
+        # Stream events can beat the placement response, so updates for unknown
+        # ids are held until track() claims them. Those also include stop-loss
+        # and outside orders and late events after forget(), hence the bound.
+        key = (exchange, str(order_id))
+        order = self.orders.get(key)
+        if order is None:
+            order = self.unclaimed.get(key)
+            if order is None:
+                order = self.unclaimed[key] = TrackedOrder(exchange, symbol, order_id)
+                if len(self.unclaimed) > self.max_unclaimed:
+                    self.unclaimed.popitem(last=False)
+            else:
+                self.unclaimed.move_to_end(key)
+        if order.done or (state == order.state and filled_size == order.filled_size):
+            return order
+        order.state = state
+        order.filled_size = filled_size
+        order.updated_at = time.monotonic()
+        order.changed.set()
+        return order
+
+    async def poll(self, order):
+        self.polls[order.exchange] += 1
+        status = await gateways[order.exchange].order_status(order.symbol, order.order_id)
+        self.update(order.exchange, order.order_id, status['state'], status['filled_size'])
+
+    async def wait_done(self, order):
+        # Stream updates resolve immediately; REST polling backs off while
+        # nothing changes and is only a slow safety net when the stream is up.
+        delay = order_poll_min_seconds
+        while not order.done:
+            timeout = order_poll_max_seconds if self.stream_connected[order.exchange] else delay
+            if await order.wait_update(timeout):
+                delay = order_poll_min_seconds
+                continue
+            await self.poll(order)
+            delay = min(delay * 2, order_poll_max_seconds)
+        return order.state
+
+order_tracker = OrderTracker()
+
+def hmac_b64(secret, message):
+    return base64.b64encode(hmac.new(secret.encode(), message.encode(), hashlib.sha256).digest()).decode()
+
+def fetch_kucoin_private_ws_url():
+    timestamp = str(int(time.time() * 1000))
+    endpoint = '/api/v1/bullet-private'
+    headers = {
+        "KC-API-KEY": api_key_kucoin,
+        "KC-API-SIGN": hmac_b64(api_secret_kucoin, timestamp + 'POST' + endpoint),
+        "KC-API-TIMESTAMP": timestamp,
+        "KC-API-PASSPHRASE": hmac_b64(api_secret_kucoin, api_passphrase_kucoin),
+        "KC-API-KEY-VERSION": "2"
+    }
+    data = requests.post('https://api.kucoin.com' + endpoint, headers=headers).json()['data']
+    server = data['instanceServers'][0]
+    return f"{server['endpoint']}?token={data['token']}", server['pingInterval'] / 1000
+
+class UserDataStreams:
+    kucoin_states = {"open": "open", "match": "partially_filled", "update": "open",
+                     "filled": "filled", "canceled": "canceled"}
+
+    def __init__(self, tracker, venues=("Kucoin", "Binance", "OKX"), urls=None):
+        self.tracker = tracker
+        self.venues = venues
+        self.urls = dict(user_stream_ws_urls, **(urls or {}))
+        self.messages = {venue: 0 for venue in venues}
+
+    async def run(self):
+        await asyncio.gather(*(self.run_venue(venue) for venue in self.venues))
+
+    async def run_venue(self, venue):
+        stream = {"Binance": self.stream_binance, "Kucoin": self.stream_kucoin, "OKX": self.stream_okx}[venue]
+        while True:
+            try:
+                await stream()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                event_log.log("error", "orders", "user_stream_failed", venue=venue, error=str(e))
+            finally:
+                self.tracker.stream_connected[venue] = False
+            await asyncio.sleep(ws_reconnect_seconds)
+
+    async def stream_binance(self):
+        listen_key = await binance_async_client.stream_get_listen_key()
+        async with websockets.connect(f"{self.urls['Binance']}/{listen_key}") as ws:
+            self.tracker.stream_connected["Binance"] = True
+            keepalive_task = asyncio.create_task(self.keepalive_binance(listen_key))
+            try:
+                async for raw in ws:
+                    event = fast_json_loads(raw)
+                    if event.get('e') != 'executionReport':
+                        continue
+                    self.messages["Binance"] += 1
+                    self.tracker.update("Binance", event['i'], BinanceGateway.states.get(event['X'], "open"),
+                                        float(event['z']), event['s'])
+            finally:
+                keepalive_task.cancel()
+
+    async def keepalive_binance(self, listen_key):
+        while True:
+            await asyncio.sleep(30 * 60)
+            await binance_async_client.stream_keepalive(listen_key)
+
+    async def stream_kucoin(self):
+        url = self.urls["Kucoin"]
+        ping_interval = 18
+        if url is None:
+            url, ping_interval = await run_blocking(fetch_kucoin_private_ws_url)
+
+        async with websockets.connect(url) as ws:
+            await ws.send(json.dumps({
+                "id": str(int(time.time() * 1000)),
+                "type": "subscribe",
+                "topic": "/spotMarket/tradeOrdersV2",
+                "privateChannel": True,
+                "response": True
+            }))
+            self.tracker.stream_connected["Kucoin"] = True
+            ping_task = asyncio.create_task(ping_kucoin(ws, ping_interval))
+            try:
+                async for raw in ws:
+                    message = fast_json_loads(raw)
+                    if message.get('type') != 'message':
+                        continue
+                    event = message['data']
+                    self.messages["Kucoin"] += 1
+                    state = self.kucoin_states.get(event['type'], "open")
+                    if state == "open" and float(event.get('filledSize') or 0) > 0:
+                        state = "partially_filled"
+                    self.tracker.update("Kucoin", event['orderId'], state,
+                                        float(event.get('filledSize') or 0), event['symbol'])
+            finally:
+                ping_task.cancel()
+
+    async def stream_okx(self):
+        async with websockets.connect(self.urls["OKX"]) as ws:
+            timestamp = str(int(time.time()))
+            await ws.send(json.dumps({"op": "login", "args": [{
+                "apiKey": api_key_okx,
+                "passphrase": okx_passphrase,
+                "timestamp": timestamp,
+                "sign": hmac_b64(api_secret_okx, timestamp + 'GET' + '/users/self/verify')
+            }]}))
+            subscribed = False
+            async for raw in ws:
+                if raw == 'pong':
+                    continue
+                message = fast_json_loads(raw)
+                if message.get('event') == 'login' and not subscribed:
+                    await ws.send(json.dumps({"op": "subscribe", "args": [{"channel": "orders", "instType": "ANY"}]}))
+                    subscribed = True
+                    self.tracker.stream_connected["OKX"] = True
+                    continue
+                if message.get('event') == 'error':
+                    raise RuntimeError(message.get('msg'))
+                for event in message.get('data', []):
+                    self.messages["OKX"] += 1
+                    self.tracker.update("OKX", event['ordId'], OKXGateway.states.get(event['state'], "open"),
+                                        venue_base_size("OKX", event['instId'], float(event.get('accFillSz') or 0)),
+                                        event['instId'])
+
 async def get_kucoin_orderbook_async(symbol, depth):
-    await handle_rate_limits("Kucoin")
+    if order_book_streams is not None:
+        orderbook = order_book_streams.get_orderbook("Kucoin", symbol)
+        if orderbook is not None:
+            return orderbook
 
     try:
-        return kucoin_market_data.get_part_order(symbol, depth)
+        return SortedOrderBook.from_levels(await gateways["Kucoin"].raw_orderbook(symbol, depth))
     except Exception as e:
-        print(f"Error fetching Kucoin order book for {symbol}: {e}")
+        event_log.log("error", "depth_check", "book_fetch_failed", venue="Kucoin", symbol=symbol, error=str(e))
         return None
 
 async def get_binance_orderbook_async(symbol, depth):
-    await handle_rate_limits("Binance")
+    if order_book_streams is not None:
+        orderbook = order_book_streams.get_orderbook("Binance", symbol)
+        if orderbook is not None:
+            return orderbook
 
     try:
-        return await binance_async_client.get_order_book(symbol=symbol, limit=depth)
+        return SortedOrderBook.from_levels(await gateways["Binance"].raw_orderbook(symbol, depth))
     except Exception as e:
-        print(f"Error fetching Binance order book for {symbol}: {e}")
+        event_log.log("error", "depth_check", "book_fetch_failed", venue="Binance", symbol=symbol, error=str(e))
         return None
 
 async def get_okx_orderbook_async(instId, depth):
-    await handle_rate_limits("OKX")
+    if order_book_streams is not None:
+        orderbook = order_book_streams.get_orderbook("OKX", instId)
+        if orderbook is not None:
+            return orderbook
 
     try:
-        response = await okx_async_client.get(f'/api/v5/market/books?instId={instId}&sz={depth}')
-        return response.data[0] 
+        return SortedOrderBook.from_levels(await gateways["OKX"].raw_orderbook(instId, depth))
     except Exception as e:
-        print(f"Error fetching OKX order book for {instId}: {e}")
+        event_log.log("error", "depth_check", "book_fetch_failed", venue="OKX", symbol=instId, error=str(e))
         return None
 
 def simulate_fills(orderbook, direction, amount, slippage_tolerance=0.001):
     if orderbook is None:
-        print("Error: Order book is None. Cannot simulate fills.")
+        event_log.log("error", "execute", "no_book_to_simulate")
         return 0, 0
 
+    if isinstance(orderbook, SortedOrderBook):
+        filled_amount, notional = orderbook.side(direction).fill(amount)
+        if direction == 'buy':
+            total_cost = notional * (1 + slippage_tolerance)
+        else:
+            total_cost = notional * (1 - slippage_tolerance)
+        effective_price = total_cost / filled_amount if filled_amount > 0 else 0
+        return filled_amount, effective_price
+
     filled_amount = 0
     total_cost = 0
     remaining_amount = amount
@@ -499,98 +3067,600 @@ def simulate_fills(orderbook, direction, amount, slippage_tolerance=0.001):
     effective_price = total_cost / filled_amount if filled_amount > 0 else 0
     return filled_amount, effective_price
 
-async def execute_kucoin_trade(symbol, side, size=None, funds=None, stop_price=None):
+venue_symbol_pairs = {}
+
+def symbol_assets(venue, symbol):
+    pair = venue_symbol_pairs.get((venue, symbol))
+    if pair is None:
+        pair = next((pair for pair, venues in symbol_mapping.items() if venues.get(venue) == symbol), symbol)
+        venue_symbol_pairs[(venue, symbol)] = pair
+    base, quote = pair.split('-')[:2]
+    return base, quote
+
+def resolve_leg_venue(contract, leg):
+    if contract not in symbol_mapping:
+        return None, None
+    if leg == 1:
+        return "Kucoin", symbol_mapping[contract]["Kucoin"]
+    if symbol_mapping[contract]["Binance"]:
+        return "Binance", symbol_mapping[contract]["Binance"]
+    if symbol_mapping[contract]["OKX"]:
+        return "OKX", symbol_mapping[contract]["OKX"]
+    return None, None
+
+async def fetch_orderbook(exchange, symbol, depth=order_book_depth):
+    if exchange == "Kucoin":
+        return await get_kucoin_orderbook_async(symbol, depth)
+    elif exchange == "Binance":
+        return await get_binance_orderbook_async(symbol, depth)
+    elif exchange == "OKX":
+        return await get_okx_orderbook_async(symbol, depth)
+    return None
+
+async def fetch_orderbooks(venues, depth=order_book_depth):
+    venues = list(dict.fromkeys(venues))
+    orderbooks = await asyncio.gather(*(fetch_orderbook(exchange, symbol, depth) for exchange, symbol in venues))
+    return dict(zip(venues, orderbooks))
+
+def walk_depth(orderbook, direction, amount_in, fee_rate):
+    # Returns (amount_consumed, amount_out, base_size, limit_price): buys spend
+    # quote, sells spend base; limit_price is the worst level touched.
+    side = orderbook.side(direction)
+    if direction == 'buy':
+        filled, spent = side.fill_notional(amount_in)
+        return spent, filled * (1 - fee_rate), filled, side.price_for(filled)
+    filled, notional = side.fill(amount_in)
+    return filled, notional * (1 - fee_rate), filled, side.price_for(filled)
+
+def depth_segments(orderbook, direction, fee_rate):
+    # (input capacity, output per unit input) per level, best first: buys
+    # spend quote for base, sells spend base for quote, fees come off the output.
+    side = orderbook.side(direction)
+    sign = side.sign
+    keep = 1 - fee_rate
+    for key, quantity in zip(side.keys, side.quantities):
+        price = sign * key
+        if direction == 'buy':
+            yield price * quantity, keep / price
+        else:
+            yield quantity, price * keep
+
+def solve_trade_size(legs, input_limits=(float('inf'),) * 3):
+    # legs are (orderbook, direction, fee_rate). Each leg's output is concave
+    # piecewise-linear in its input with a breakpoint per level, so the cycle's
+    # profit out(x) - x is concave in the leg-1 input x and peaks where the
+    # product of the three marginal rates falls to 1. One merged pass steps x
+    # to the nearest breakpoint of any leg, or input limit, until it does.
+    segments = [depth_segments(*leg) for leg in legs]
+    remaining = [0.0] * len(legs)
+    rates = [0.0] * len(legs)
+    limits = list(input_limits)
+    amount_in = amount_out = 0.0
+    marginal_rate = 0.0
+    breakpoints = 0
+    while True:
+        exhausted = False
+        for k, leg_segments in enumerate(segments):
+            while remaining[k] <= 0:
+                level = next(leg_segments, None)
+                if level is None:
+                    exhausted = True
+                    break
+                remaining[k], rates[k] = level
+        if exhausted:
+            break
+        marginal_rate = rates[0] * rates[1] * rates[2]
+        if marginal_rate <= 1:
+            break
+
+        step = float('inf')
+        binding = 0
+        scale = 1.0
+        for k in range(len(legs)):
+            leg_step = min(remaining[k], limits[k]) / scale
+            if leg_step < step:
+                step, binding = leg_step, k
+            scale *= rates[k]
+        if step <= 0:
+            break
+
+        flow = step
+        for k in range(len(legs)):
+            remaining[k] -= flow
+            limits[k] -= flow
+            flow *= rates[k]
+        # Land the binding leg exactly on its breakpoint despite rounding.
+        if remaining[binding] <= limits[binding]:
+            remaining[binding] = 0.0
+        else:
+            limits[binding] = 0.0
+        amount_in += step
+        amount_out += flow
+        breakpoints += 1
+
+    return {
+        "amount_in": amount_in,
+        "amount_out": amount_out,
+        "profit": amount_out - amount_in,
+        "marginal_rate": marginal_rate,
+        "breakpoints": breakpoints
+    }
+
+def surface_leg_path(surface_arb):
+    # (direction, spent, acquired) per leg, following the asset held after each
+    # leg from swap_1; None when the contracts do not close back on swap_1.
+    held = surface_arb['swap_1']
+    path = []
+    for leg in (1, 2, 3):
+        base, quote = surface_arb[f'contract_{leg}'].split('-')[:2]
+        if held == quote:
+            path.append(('buy', quote, base))
+            held = base
+        elif held == base:
+            path.append(('sell', base, quote))
+            held = quote
+        else:
+            return None
+    return path if held == surface_arb['swap_1'] else None
+
+def calculate_real_rate(surface_arb, orderbooks):
+    path = surface_leg_path(surface_arb)
+    if path is None:
+        latency_metrics.reject("depth_check", "broken_path")
+        return None
+    legs = []
+    for leg, (direction, spent, received) in enumerate(path, 1):
+        exchange, symbol = resolve_leg_venue(surface_arb[f'contract_{leg}'], leg)
+        orderbook = orderbooks.get((exchange, symbol))
+        if orderbook is None:
+            latency_metrics.reject("depth_check", "no_book")
+            return None
+        if orderbook.age() > book_max_age_seconds:
+            latency_metrics.reject("depth_check", "book_stale")
+            return None
+        legs.append((exchange, symbol, direction, orderbook, venue_fee_rates[exchange]))
+
+    # Every leg spends inventory already on its venue: simultaneous legs go out
+    # before leg 1's proceeds land, and sequential legs may sit on another venue.
+    input_limits = [min(balance_ledger.available(exchange, spent), max_trade_sizes.get(spent, float('inf')))
+                    for (exchange, symbol, direction, orderbook, fee_rate), (_, spent, _) in zip(legs, path)]
+
+    solution = solve_trade_size([(orderbook, direction, fee_rate)
+                                 for exchange, symbol, direction, orderbook, fee_rate in legs], input_limits)
+    trade_amount = solution["amount_in"]
+    if trade_amount <= 0:
+        latency_metrics.reject("depth_check", "no_profitable_size")
+        return None
+
+    real_rate_arb = dict(surface_arb)
+    acquired = trade_amount
+    for leg, (exchange, symbol, direction, orderbook, fee_rate) in enumerate(legs, 1):
+        consumed, acquired, size, limit_price = walk_depth(orderbook, direction, acquired, fee_rate)
+        real_rate_arb[f'size_{leg}'] = size
+        real_rate_arb[f'price_{leg}'] = limit_price
+        if size > 0:
+            real_rate_arb[f'expected_price_{leg}'] = consumed / size if direction == 'buy' \
+                else acquired / (1 - fee_rate) / size
+        real_rate_arb[f'exchange_{leg}'] = exchange
+        real_rate_arb[f'symbol_{leg}'] = symbol
+        real_rate_arb[f'contract_{leg}_direction'] = direction
+        real_rate_arb[f'real_acquired_coin_t{leg}'] = acquired
+
+    real_profit_loss = acquired - trade_amount
+    real_rate_perc = (real_profit_loss / trade_amount) * 100
+    # The opportunity has to survive the oldest leg quote plus the time to get
+    # orders to the venues: the slowest one when legs go out together, all of
+    # them in turn when sequential.
+    quote_age_seconds = max(orderbook.age() for exchange, symbol, direction, orderbook, fee_rate in legs)
+    latencies = [venue_latency.get(exchange, 0.0) for exchange, symbol, direction, orderbook, fee_rate in legs]
+    delay = quote_age_seconds + (max(latencies) if execution_mode == "simultaneous" else sum(latencies))
+    survival = math.exp(-max(delay, 0.0) / opportunity_lifetime_seconds)
+    real_rate_arb.update({
+        "trade_amount": trade_amount,
+        "solver_marginal_rate": solution["marginal_rate"],
+        "solver_breakpoints": solution["breakpoints"],
+        "real_profit_loss": real_profit_loss,
+        "real_rate_perc": real_rate_perc,
+        "quote_age_seconds": quote_age_seconds,
+        "expected_delay_seconds": delay,
+        "expected_profit": real_profit_loss * survival,
+        "expected_rate_perc": real_rate_perc * survival,
+    })
+    return real_rate_arb
+
+async def get_depth_from_orderbook(surface_arb, orderbooks=None):
+    if orderbooks is None:
+        orderbooks = await fetch_orderbooks(
+            resolve_leg_venue(surface_arb[f'contract_{leg}'], leg) for leg in (1, 2, 3))
     try:
-        if side == 'buy':
-            order = kucoin_client.create_limit_order(symbol, side, stop_price, size)
-        else: 
-            order = kucoin_client.create_limit_order(symbol, side, stop_price, size)
-        order_id = order['orderId']
-        print(f"Executed {side} order on Kucoin for {symbol}: {size if size else funds}")
+        return calculate_real_rate(surface_arb, orderbooks)
+    except Exception as e:
+        event_log.log("error", "depth_check", "real_rate_failed", error=str(e))
+        latency_metrics.reject("depth_check", "error")
+        return None
 
-        await handle_order_timeout("Kucoin", symbol, order_id)
+async def confirm_surface_opportunities(surface_arbs):
+    # One concurrent fetch per distinct book across every hit in the cycle.
+    orderbooks = await fetch_orderbooks(
+        resolve_leg_venue(surface_arb[f'contract_{leg}'], leg)
+        for surface_arb in surface_arbs for leg in (1, 2, 3))
+    real_rate_arbs = []
+    for surface_arb in surface_arbs:
+        real_rate_arb = await get_depth_from_orderbook(surface_arb, orderbooks)
+        if real_rate_arb is None:
+            continue
+        if real_rate_arb['expected_rate_perc'] > profit_threshold:
+            real_rate_arbs.append(real_rate_arb)
+        else:
+            latency_metrics.reject("depth_check", "below_threshold")
+    real_rate_arbs.sort(key=lambda arb: arb['expected_rate_perc'], reverse=True)
+    return real_rate_arbs
+
+async def place_order(exchange, symbol, side, size, price):
+    size, price = quantize_order(exchange, symbol, side, size, price)
+    latency_metrics.order_placed()
+    started = time.perf_counter_ns()
+    order_id = await gateways[exchange].place_order(symbol, side, size, price)
+    latency_metrics.observe("order_place", started)
+    observe_venue_latency(exchange, (time.perf_counter_ns() - started) / 1e9)
+    return order_id
+
+async def settle_order(exchange, symbol, side, price, order_id):
+    order = order_tracker.track(exchange, symbol, order_id)
+    balance_ledger.reserve(exchange)
+    started = time.perf_counter_ns()
+    try:
+        filled = await handle_order_timeout(exchange, symbol, order_id)
+    finally:
+        latency_metrics.observe("fill_confirm", started)
+        balance_ledger.release(exchange)
+        balance_ledger.apply_fill(exchange, symbol, side, order.filled_size, price)
+        if market_recorder is not None:
+            market_recorder.record("fill", exchange, symbol, {"order_id": str(order_id), "side": side,
+                                                             "price": price, "filled_size": order.filled_size,
+                                                             "state": order.state})
+    return filled, order.filled_size
+
+async def execute_kucoin_trade(symbol, side, size, stop_price=None):
+    try:
+        order_id = await place_order("Kucoin", symbol, side, size, stop_price)
+        event_log.log("info", "execute", "order_placed", venue="Kucoin", symbol=symbol, order_id=order_id,
+                      side=side, size=size, price=stop_price)
+
+        await settle_order("Kucoin", symbol, side, stop_price, order_id)
 
         return order_id
     except Exception as e:
-        print(f"Error executing Kucoin trade: {e}")
+        event_log.log("error", "execute", "trade_failed", venue="Kucoin", symbol=symbol, error=str(e))
         return None
 
-async def execute_binance_trade(symbol, side, quantity, stop_price=None):
+async def execute_binance_trade(symbol, side, size, stop_price=None):
     try:
-        if side == 'buy':
-            order = binance_client.order_limit_buy(symbol=symbol, quantity=quantity, price=stop_price)
-        else: 
-            order = binance_client.order_limit_sell(symbol=symbol, quantity=quantity, price=stop_price)
-        order_id = order['orderId']
-        print(f"Executed {side} order on Binance for {symbol}: {quantity}")
+        order_id = await place_order("Binance", symbol, side, size, stop_price)
+        event_log.log("info", "execute", "order_placed", venue="Binance", symbol=symbol, order_id=order_id,
+                      side=side, size=size, price=stop_price)
 
-        await handle_order_timeout("Binance", symbol, order_id) 
+        await settle_order("Binance", symbol, side, stop_price, order_id)
 
         return order_id
     except Exception as e:
-        print(f"Error executing Binance trade: {e}")
+        event_log.log("error", "execute", "trade_failed", venue="Binance", symbol=symbol, error=str(e))
         return None
 
 async def execute_okx_trade(symbol, side, size, stop_price=None):
     try:
-        order = okx_client.create_order(
-            instId=symbol,
-            tdMode='cash',
-            side=side,
-            ordType='limit',
-            sz=str(size),
-            px=str(stop_price)
-        )
-        order_id = order['data'][0]['ordId']
-        print(f"Executed {side} order on OKX for {symbol}: {size}")
-
-        await handle_order_timeout("OKX", symbol, order_id)
+        order_id = await place_order("OKX", symbol, side, size, stop_price)
+        event_log.log("info", "execute", "order_placed", venue="OKX", symbol=symbol, order_id=order_id,
+                      side=side, size=size, price=stop_price)
+
+        await settle_order("OKX", symbol, side, stop_price, order_id)
 
         if stop_price:
             if side == 'buy':
                 stop_side = 'sell'
             else:
                 stop_side = 'buy'
-            okx_client.create_order(
-                instId=symbol,
-                tdMode='cash',
-                side=stop_side,
-                ordType='stop_loss', 
-                sz=str(size),
-                slTriggerPx=str(stop_price)  
-            )
-            print(f"Placed {stop_side} stop-loss order at {stop_price} on OKX for {symbol}")
+            stop_size, stop_price = quantize_order("OKX", symbol, stop_side, size, stop_price)
+            await gateways["OKX"].place_stop_loss(symbol, stop_side, stop_size, stop_price)
+            event_log.log("info", "execute", "stop_loss_placed", venue="OKX", symbol=symbol, side=stop_side,
+                          size=stop_size, price=stop_price)
 
         return order_id
     except Exception as e:
-        print(f"Error executing OKX trade: {e}")
+        event_log.log("error", "execute", "trade_failed", venue="OKX", symbol=symbol, error=str(e))
         return None
 
-async def find_arbitrage_opportunities():
-    global structured_pairs
-    while True:
-        prices = get_coin_arbitrage('https://api.kucoin.com/api/v1/market/allTickers')
-
-        arbitrage_opportunity = None
-
-        if prices is not None:
-            for t_pair in structured_pairs:
-                prices_dict = get_price_for_t_pair(t_pair, prices)
-                if prices_dict is not None:
-                    surface_arb = cal_triangular_arb_surface_rate(t_pair, prices_dict)
-                    if surface_arb and surface_arb.get('profit_loss_perc', 0) > profit_threshold:
-                        real_rate_arb = get_depth_from_orderbook(surface_arb)
-                        if real_rate_arb and real_rate_arb.get('real_rate_perc', 0) > profit_threshold:
-                            arbitrage_opportunity = real_rate_arb
-                            break
-
-        if arbitrage_opportunity:
-            await execute_arbitrage(arbitrage_opportunity)
+async def execute_leg(leg, exchange, symbol, side, size, price, started_at):
+    report = {
+        "leg": leg,
+        "exchange": exchange,
+        "symbol": symbol,
+        "side": side,
+        "size": size,
+        "price": price,
+        "order_id": None,
+        "filled": False,
+        "filled_size": 0.0,
+        "placed_seconds": None,
+        "confirmed_seconds": None
+    }
+    try:
+        report["order_id"] = await place_order(exchange, symbol, side, size, price)
+        report["placed_seconds"] = time.perf_counter() - started_at
+        report["filled"], report["filled_size"] = await settle_order(exchange, symbol, side, price,
+                                                                     report["order_id"])
+        report["confirmed_seconds"] = time.perf_counter() - started_at
+    except Exception as e:
+        event_log.log("error", "execute", "leg_failed", venue=exchange, symbol=symbol, leg=leg, error=str(e))
+        latency_metrics.reject("execute", "leg_error")
+        report["error"] = str(e)
+    return report
+
+async def execute_arbitrage_simultaneous(real_rate_arb):
+    # Legs trade on different venues from pre-funded inventory, so all three
+    # are placed at once from the sizes and limit prices of the depth walk.
+    swap_1 = real_rate_arb['swap_1']
+    if not real_rate_arb.get('trade_amount') or \
+            real_rate_arb['trade_amount'] > balance_ledger.available(real_rate_arb['exchange_1'], swap_1):
+        event_log.log("error", "execute", "insufficient_funds", venue=real_rate_arb.get('exchange_1'),
+                      asset=swap_1, trade_amount=real_rate_arb.get('trade_amount'))
+        return None
 
-        await asyncio.sleep(0.1) 
+    started_at = time.perf_counter()
+    reports = await asyncio.gather(*(
+        execute_leg(leg, real_rate_arb[f'exchange_{leg}'], real_rate_arb[f'symbol_{leg}'],
+                    real_rate_arb[f'contract_{leg}_direction'], real_rate_arb[f'size_{leg}'],
+                    real_rate_arb[f'price_{leg}'], started_at)
+        for leg in (1, 2, 3)))
+
+    for report in reports:
+        event_log.log("info", "execute", "leg_report", venue=report['exchange'], symbol=report['symbol'],
+                      order_id=report['order_id'], leg=report['leg'], side=report['side'],
+                      placed_seconds=report['placed_seconds'], confirmed_seconds=report['confirmed_seconds'],
+                      filled=report['filled'], filled_size=report['filled_size'])
+
+    unfilled = [report['leg'] for report in reports if not report['filled']]
+    if unfilled:
+        event_log.log("warning", "execute", "legs_unfilled", legs=unfilled)
+
+    # Legs are not cancelled or unwound when others miss: whatever the fills
+    # leave besides the swap_1 result is unhedged inventory, flagged below.
+    deltas = cycle_inventory_deltas(reports)
+    event_log.log("info", "execute", "inventory_delta",
+                  deltas={f"{venue}:{asset}": amount for (venue, asset), amount in deltas.items()})
+    residuals = cycle_residuals(deltas, swap_1)
+    if residuals:
+        balance_ledger.flag_residuals(residuals)
+        event_log.log("warning", "execute", "residual_inventory", residuals=residuals)
+
+    event_log.log("info", "balances", "after_trades", balances=balance_ledger.snapshot())
+    return reports
+
+def cycle_inventory_deltas(reports):
+    # Net change per (venue, asset) from what each leg actually filled.
+    deltas = {}
+    for report in reports:
+        for asset, amount in fill_deltas(report['exchange'], report['symbol'], report['side'],
+                                         report['filled_size'], report['price']):
+            deltas[(report['exchange'], asset)] = deltas.get((report['exchange'], asset), 0) + amount
+    return deltas
+
+def cycle_residuals(deltas, swap_1, tolerance=residual_inventory_tolerance):
+    # A fully filled cycle moves inventory between venues but nets out in every
+    # asset except swap_1, short of limit-price slippage; anything left over
+    # `tolerance` of the asset's gross flow is exposure.
+    net = {}
+    gross = {}
+    for (venue, asset), amount in deltas.items():
+        net[asset] = net.get(asset, 0) + amount
+        gross[asset] = gross.get(asset, 0) + abs(amount)
+    return {asset: amount for asset, amount in net.items()
+            if asset != swap_1 and abs(amount) > tolerance * gross[asset]}
 
-async def execute_arbitrage(real_rate_arb):
-    global amount_dict
+async def find_arbitrage_opportunities():
+    global structured_pairs, order_book_streams, market_recorder
+    asyncio.create_task(refresh_metadata_cache())
+    asyncio.create_task(event_loop_lag.run())
+    if latency_metrics.enabled:
+        await latency_metrics.serve()
+        asyncio.create_task(latency_metrics.log_summary())
+    if stream_order_books:
+        order_book_streams = OrderBookStreams({
+            venue: [symbol_mapping[pair][venue] for pair in symbol_mapping]
+            for venue in ("Kucoin", "Binance", "OKX")
+        })
+        asyncio.create_task(order_book_streams.run())
+    if stream_user_data:
+        asyncio.create_task(UserDataStreams(order_tracker).run())
+    asyncio.create_task(balance_ledger.run())
+    if scan_spatial_arbitrage:
+        asyncio.create_task(scan_spatial_opportunities(PriceMatrix(symbol_mapping)))
+    if market_recording_path:
+        market_recorder = MarketRecorder(market_recording_path)
+        market_recorder.record("meta", None, None, {"symbol_mapping": symbol_mapping,
+                                                    "balances": balance_ledger.balances})
+    snapshot = TickerSnapshot(t_pair[pair] for t_pair in structured_pairs
+                              for pair in ('pair_a', 'pair_b', 'pair_c'))
+    index_triangular_pairs(structured_pairs, snapshot)
+    if detection_workers:
+        surface_engine = ShardedSurfaceDetector(structured_pairs, snapshot)
+    else:
+        surface_engine = SurfaceRateEngine(structured_pairs, snapshot)
+    latency_metrics.surface_engine = surface_engine
+    cycle_detector = LogRateCycleDetector() if detect_log_rate_cycles else None
+    await ArbitragePipeline(snapshot, surface_engine, cycle_detector).run()
+
+class CoalescingQueue:
+    # Bounded queue keyed by triangle: a newer item for a key that is still
+    # waiting replaces it in place, so a burst of ticks never queues the same
+    # cycle twice. New keys past maxsize are dropped and counted.
+    def __init__(self, name, maxsize):
+        self.name = name
+        self.maxsize = maxsize
+        self.items = {}
+        self.ready = asyncio.Event()
+
+    def __len__(self):
+        return len(self.items)
+
+    def put(self, key, item):
+        if key in self.items:
+            latency_metrics.reject(self.name, "coalesced")
+        elif len(self.items) >= self.maxsize:
+            latency_metrics.reject(self.name, "queue_full")
+            return False
+        self.items[key] = item
+        self.ready.set()
+        latency_metrics.sample_queue(self.name, len(self.items))
+        return True
+
+    async def get(self):
+        # Every waiter wakes on set(); the ones that find the items already
+        # taken by another consumer go back to waiting.
+        while not self.items:
+            self.ready.clear()
+            await self.ready.wait()
+        key = next(iter(self.items))
+        item = self.items.pop(key)
+        if not self.items:
+            self.ready.clear()
+        latency_metrics.sample_queue(self.name, len(self.items))
+        return item
+
+    async def get_batch(self):
+        while not self.items:
+            self.ready.clear()
+            await self.ready.wait()
+        items = list(self.items.values())
+        self.items.clear()
+        self.ready.clear()
+        latency_metrics.sample_queue(self.name, 0)
+        return items
+
+def triangle_key(arb):
+    # Both directions of a triangle trade the same three books.
+    return tuple(sorted((arb['contract_1'], arb['contract_2'], arb['contract_3'])))
+
+def spent_assets(arb):
+    spent = set()
+    for leg in (1, 2, 3):
+        base, quote = symbol_assets(arb[f'exchange_{leg}'], arb[f'symbol_{leg}'])
+        spent.add((arb[f'exchange_{leg}'], quote if arb[f'contract_{leg}_direction'] == 'buy' else base))
+    return spent
+
+class ArbitragePipeline:
+    # feed -> scorer -> confirmer -> executors. Only the newest ticker waits
+    # for the scorer, candidates coalesce per triangle, and each executor
+    # holds the (venue, asset) pairs its legs spend, so a cycle in flight
+    # never pauses polling and two cycles never size from the same inventory.
+    def __init__(self, snapshot, surface_engine, cycle_detector=None, executors=pipeline_executors):
+        self.snapshot = snapshot
+        self.surface_engine = surface_engine
+        self.cycle_detector = cycle_detector
+        self.executors = executors
+        self.ticks = CoalescingQueue("ticks", 1)
+        self.candidates = CoalescingQueue("candidates", pipeline_max_candidates)
+        self.executions = CoalescingQueue("executions", pipeline_max_executions)
+        self.busy_assets = set()
+
+    async def feed(self):
+        while True:
+            await handle_rate_limits("Kucoin", endpoint_weight("Kucoin", "tickers"), PRIORITY_MARKET_DATA)
+            fetched = await run_blocking(fetch_ticker_payload, 'https://api.kucoin.com/api/v1/market/allTickers')
+            if fetched is not None:
+                self.ticks.put("Kucoin", fetched)
+            await asyncio.sleep(0.1)
+
+    async def score(self):
+        while True:
+            prices, received_at = (await self.ticks.get_batch())[-1]
+            try:
+                surface_arbs = score_tick(prices, self.snapshot, self.surface_engine, self.cycle_detector,
+                                          received_at)
+            except Exception as e:
+                event_log.log("error", "surface", "score_failed", error=str(e))
+                continue
+            if market_recorder is not None:
+                market_recorder.record("ticker", "Kucoin", None, self.snapshot.to_prices_json())
+            for surface_arb in surface_arbs:
+                self.candidates.put(triangle_key(surface_arb), surface_arb)
+
+    async def confirm(self):
+        while True:
+            surface_arbs = await self.candidates.get_batch()
+            started = time.perf_counter_ns()
+            try:
+                real_rate_arbs = await confirm_surface_opportunities(surface_arbs)
+            except Exception as e:
+                event_log.log("error", "depth_check", "confirm_failed", error=str(e))
+                continue
+            latency_metrics.observe("depth_check", started)
+            for real_rate_arb in real_rate_arbs:
+                real_rate_arb['confirmed_at'] = quote_clock()
+                self.executions.put(triangle_key(real_rate_arb), real_rate_arb)
+
+    async def execute(self):
+        while True:
+            real_rate_arb = await self.executions.get()
+            if quote_clock() - real_rate_arb['confirmed_at'] > book_max_age_seconds:
+                latency_metrics.reject("execute", "expired")
+                continue
+            assets = spent_assets(real_rate_arb)
+            if assets & self.busy_assets:
+                latency_metrics.reject("execute", "asset_busy")
+                continue
+            self.busy_assets |= assets
+            try:
+                await execute_arbitrage(real_rate_arb)
+            except Exception as e:
+                event_log.log("error", "execute", "arbitrage_failed", error=str(e))
+            finally:
+                self.busy_assets -= assets
+
+    async def run(self):
+        await asyncio.gather(self.feed(), self.score(), self.confirm(),
+                             *(self.execute() for _ in range(self.executors)))
+
+def score_tick(prices, snapshot, surface_engine, cycle_detector=None, received_at=None):
+    # prices is either a raw allTickers body or an already decoded dict (replay).
+    latency_metrics.tick()
+    started = time.perf_counter_ns()
+    if isinstance(prices, (bytes, bytearray)):
+        snapshot.load_payload(prices, received_at=received_at)
+        latency_metrics.observe("parse", started)
+        if cycle_detector is not None:
+            prices = fast_json_loads(prices)
+    else:
+        snapshot.update(prices, received_at)
+        latency_metrics.observe("price_lookup", started)
+    if cycle_detector is not None:
+        for cycle in cycle_detector.detect(cycle_detector.update_venue("Kucoin", prices),
+                                           min_rate=profit_threshold)[:surface_top_k]:
+            event_log.log("info", "cycles", "log_rate_cycle", legs=cycle['cycle_length'],
+                          profit_loss_perc=cycle['profit_loss_perc'])
+    started = time.perf_counter_ns()
+    surface_arbs = surface_engine.top_k(snapshot, min_rate=profit_threshold)
+    latency_metrics.observe("surface_calc", started)
+    # The engine still scores stale ticks so its incremental state stays in
+    # step; only the book fetches and orders are skipped.
+    if surface_arbs and snapshot.age() > ticker_max_age_seconds:
+        latency_metrics.reject("surface", "ticker_stale", len(surface_arbs))
+        return []
+    return surface_arbs
+
+async def detect_opportunity(prices, snapshot, surface_engine, cycle_detector=None):
+    surface_arbs = score_tick(prices, snapshot, surface_engine, cycle_detector)
+    if surface_arbs:
+        started = time.perf_counter_ns()
+        real_rate_arbs = await confirm_surface_opportunities(surface_arbs)
+        latency_metrics.observe("depth_check", started)
+        if real_rate_arbs:
+            return real_rate_arbs[0]
+    return None
+
+async def execute_arbitrage(real_rate_arb, mode=None):
+    if (mode or execution_mode) == "simultaneous":
+        return await execute_arbitrage_simultaneous(real_rate_arb)
 
     contract_1 = real_rate_arb['contract_1']
     contract_2 = real_rate_arb['contract_2']
@@ -621,18 +3691,18 @@ async def execute_arbitrage(real_rate_arb):
     direction_3 = real_rate_arb['contract_3_direction']
 
     swap_1 = real_rate_arb['swap_1']
-    first_amount1 = amount_dict.get(swap_1)
+    swap_2 = real_rate_arb['swap_2']
+    first_amount1 = balance_ledger.available(exchange_1, swap_1)
 
     if not all([swap_1, symbol_1, direction_1, first_amount1]):
-        print("Error: Missing required keys in real_rate_arb or insufficient funds. Skipping arbitrage.")
+        event_log.log("error", "execute", "insufficient_funds", venue=exchange_1, asset=swap_1)
         return
 
-    if first_amount1 > max_trade_size_btc:
-        first_amount1 = max_trade_size_btc
+    first_amount1 = min(first_amount1, max_trade_sizes.get(swap_1, float('inf')))
 
     kucoin_orderbook = await get_kucoin_orderbook_async(symbol_1, order_book_depth)
     filled_amount1, effective_price1 = simulate_fills(kucoin_orderbook, direction_1,
-                                                      float(first_amount1))
+                                                      float(real_rate_arb.get('size_1', first_amount1)))
 
     if filled_amount1 > 0:
         if direction_1 == 'buy':
@@ -644,13 +3714,9 @@ async def execute_arbitrage(real_rate_arb):
                                                size=filled_amount1, stop_price=stop_price1)
 
         if order_id1 is None:
-            print("Error: Trade 1 failed. Exiting arbitrage sequence.")
+            event_log.log("error", "execute", "sequence_aborted", leg=1)
             return
 
-        await asyncio.sleep(0.5)
-
-        update_balances()
-
         if exchange_2 == "Binance":
             execute_trade_2 = execute_binance_trade
             orderbook_2 = await get_binance_orderbook_async(symbol_2, order_book_depth)
@@ -658,7 +3724,8 @@ async def execute_arbitrage(real_rate_arb):
             execute_trade_2 = execute_okx_trade
             orderbook_2 = await get_okx_orderbook_async(symbol_2, order_book_depth)
 
-        filled_amount2, effective_price2 = simulate_fills(orderbook_2, direction_2, float(amount_dict[swap_2]))
+        filled_amount2, effective_price2 = simulate_fills(orderbook_2, direction_2, float(
+            real_rate_arb.get('size_2', balance_ledger.available(exchange_2, swap_2))))
         if direction_2 == 'buy':
             stop_price2 = effective_price2 * (1 - stop_loss_percentage)
         else:
@@ -668,13 +3735,9 @@ async def execute_arbitrage(real_rate_arb):
                                           size=filled_amount2, stop_price=stop_price2)
 
         if order_id2 is None:
-            print("Error: Trade 2 failed. Exiting arbitrage sequence.")
+            event_log.log("error", "execute", "sequence_aborted", leg=2)
             return
 
-        await asyncio.sleep(0.5)
-
-        update_balances()
-
         if exchange_3 == "Binance":
             execute_trade_3 = execute_binance_trade
             orderbook_3 = await get_binance_orderbook_async(symbol_3, order_book_depth)
@@ -682,7 +3745,8 @@ async def execute_arbitrage(real_rate_arb):
             execute_trade_3 = execute_okx_trade
             orderbook_3 = await get_okx_orderbook_async(symbol_3, order_book_depth)
 
-        filled_amount3, effective_price3 = simulate_fills(orderbook_3, direction_3, float(amount_dict[swap_1]))
+        filled_amount3, effective_price3 = simulate_fills(orderbook_3, direction_3, float(
+            real_rate_arb.get('size_3', balance_ledger.available(exchange_3, swap_1))))
         if direction_3 == 'buy':
             stop_price3 = effective_price3 * (1 - stop_loss_percentage)
         else:
@@ -692,41 +3756,334 @@ async def execute_arbitrage(real_rate_arb):
                                           size=filled_amount3, stop_price=stop_price3)
 
         if order_id3 is None:
-            print("Error: Trade 3 failed. Exiting arbitrage sequence.")
+            event_log.log("error", "execute", "sequence_aborted", leg=3)
             return
 
-        update_balances()
-        print("Balances after trades:", amount_dict)
+        event_log.log("info", "balances", "after_trades", balances=balance_ledger.snapshot())
     else:
-        print("Trade 1 not filled. Skipping arbitrage.")
+        event_log.log("info", "execute", "sequence_skipped", reason="leg_1_not_filled")
 
 
 async def handle_order_timeout(exchange, symbol, order_id):
-    start_time = time.time()
-    while True:
-        if exchange == "Kucoin":
-            order_status = kucoin_client.get_order_details(order_id)
-            if order_status['status'] == 'done':
-                break
-        elif exchange == "Binance":
-            order_status = binance_client.get_order(symbol=symbol, orderId=order_id)
-            if order_status['status'] == 'FILLED':
-                break
-        elif exchange == "OKX":
-            order_status = okx_client.get_order_details(instId=symbol, ordId=order_id)
-            if order_status['data'][0]['state'] == 'filled':
-                break
+    order = order_tracker.track(exchange, symbol, order_id)
+    try:
+        state = await asyncio.wait_for(order_tracker.wait_done(order), order_timeout_seconds)
+    except asyncio.TimeoutError:
+        await gateways[exchange].cancel_order(symbol, order_id)
+        # Fills can land between the last update and the cancel, so the size
+        # the ledger applies comes from one more status read.
+        await order_tracker.poll(order)
+        event_log.log("warning", "execute", "order_timed_out", venue=exchange, symbol=symbol, order_id=order_id,
+                      filled_size=order.filled_size)
+        return False 
+    finally:
+        order_tracker.forget(exchange, order_id)
+    return state == "filled"  
+
+class SimulatedExchange:
+    # Gateway stand-in for one venue during replay. Limit orders fill at once
+    # against the replayed book up to their limit price and the rest is
+    # canceled, so every order is done before place_order returns.
+    def __init__(self, venue, replay):
+        self.venue = venue
+        self.replay = replay
+        self.orders = {}
+
+    async def place_order(self, symbol, side, size, price):
+        self.replay.order_placed()
+        order_id = f"{self.venue}-{len(self.orders) + 1}"
+        filled = notional = 0.0
+        book = self.replay.get_orderbook(self.venue, symbol)
+        if book is not None and size and price:
+            book_side = book.side(side)
+            filled, notional = book_side.fill(min(float(size), book_side.size_within(float(price))))
+        state = "filled" if filled and filled >= float(size) * (1 - 1e-9) else "canceled"
+        self.orders[order_id] = {"state": state, "filled_size": filled, "raw": {"notional": notional}}
+        self.replay.settle(self.venue, symbol, side, filled, notional, state)
+        order_tracker.update(self.venue, order_id, state, filled, symbol)
+        return order_id
+
+    async def place_stop_loss(self, symbol, side, size, stop_price):
+        return None
+
+    async def cancel_order(self, symbol, order_id):
+        order = self.orders.get(order_id)
+        if order is not None and order["state"] != "filled":
+            order["state"] = "canceled"
+        return order
+
+    async def order_status(self, symbol, order_id):
+        return self.orders[order_id]
+
+    async def raw_orderbook(self, symbol, depth):
+        book = self.replay.get_orderbook(self.venue, symbol)
+        return book.to_orderbook(depth) if book is not None else {"bids": [], "asks": []}
 
-        if time.time() - start_time > order_timeout_seconds:
-            if exchange == "Kucoin":
-                kucoin_client.cancel_order(order_id)
-            elif exchange == "Binance":
-                binance_client.cancel_order(symbol=symbol, orderId=order_id)
-            elif exchange == "OKX":
-                okx_client.cancel_order(instId=symbol, ordId=order_id)
-            print(f"{exchange} order {order_id} timed out and was canceled.")
-            return False 
-        await asyncio.sleep(1)
-    return True  
-
-async def handle_rate_limits(exchange):
\ No newline at end of file
+    async def balances(self):
+        return dict(self.replay.balances[self.venue])
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+class MarketReplay:
+    # Drives detect_opportunity and execute_arbitrage from a recording, with
+    # SimulatedExchange gateways and the recorded books standing in for the
+    # live streams. speed=None replays as fast as possible; otherwise the
+    # recorded gaps are divided by speed.
+    def __init__(self, path, speed=None, balances=None, mode="simultaneous", top_of_book_size=1e9):
+        self.path = path
+        self.speed = speed
+        self.mode = mode
+        self.top_of_book_size = top_of_book_size
+        self.balances = {venue: dict(balances.get(venue, {})) for venue in gateways} if balances else None
+        self.start_balances = None
+        self.books = {}
+        self.snapshot = None
+        self.surface_engine = None
+        self.tick_started = None
+        self.attempt = None
+        self.ticks = 0
+        self.opportunities = 0
+        self.hits = 0
+        self.orders = 0
+        self.recorded_fills = 0
+        self.latencies = []
+        self.now = None
+        self.heard = {}
+
+    def clock(self):
+        # Quote ages during replay run on recorded time.
+        return self.now
+
+    def get_orderbook(self, venue, symbol):
+        book = self.books.get((venue, symbol))
+        if book is not None and book.synced and len(book.bids) and len(book.asks):
+            heard = self.heard.get(venue)
+            if heard is not None and heard > book.received_at:
+                book.received_at = heard
+            return book
+        # Without a recorded book, quote the last ticker's top of book.
+        base, quote = symbol_assets(venue, symbol)
+        kucoin_symbol = symbol_mapping.get(f"{base}-{quote}", {}).get("Kucoin", f"{base}-{quote}")
+        i = self.snapshot.symbol_index.get(kucoin_symbol) if self.snapshot is not None else None
+        if i is None or not self.snapshot.bids[i] > 0 or not self.snapshot.asks[i] > 0:
+            return None
+        book = SortedOrderBook.from_levels({"bids": [[self.snapshot.bids[i], self.top_of_book_size]],
+                                            "asks": [[self.snapshot.asks[i], self.top_of_book_size]]})
+        book.received_at, book.exchange_time = self.snapshot.received_at, self.snapshot.exchange_time
+        return book
+
+    def order_placed(self):
+        self.orders += 1
+        if self.tick_started is not None:
+            self.latencies.append(time.perf_counter() - self.tick_started)
+
+    def settle(self, venue, symbol, side, filled, notional, state):
+        if self.attempt is not None:
+            self.attempt.append(state)
+        if not filled:
+            return
+        base, quote = symbol_assets(venue, symbol)
+        keep = 1 - venue_fee_rates[venue]
+        book = self.balances[venue]
+        if side == 'buy':
+            book[quote] = book.get(quote, 0) - notional
+            book[base] = book.get(base, 0) + filled * keep
+        else:
+            book[base] = book.get(base, 0) - filled
+            book[quote] = book.get(quote, 0) + notional * keep
+
+    def value(self, asset, quote="USDT"):
+        if asset == quote:
+            return 1.0
+        for symbol, invert in ((f"{asset}-{quote}", False), (f"{quote}-{asset}", True)):
+            i = self.snapshot.symbol_index.get(symbol)
+            if i is not None and self.snapshot.bids[i] > 0 and self.snapshot.asks[i] > 0:
+                mid = (self.snapshot.bids[i] + self.snapshot.asks[i]) / 2
+                return 1 / mid if invert else mid
+        return None
+
+    def on_meta(self, data):
+        for pair, venues in data.get("symbol_mapping", {}).items():
+            symbol_mapping.setdefault(pair, venues)
+        if self.balances is None:
+            recorded = data.get("balances", {})
+            self.balances = {venue: dict(recorded.get(venue, {})) for venue in gateways}
+
+    def on_book(self, venue, symbol, data):
+        book = self.books.get((venue, symbol))
+        if book is None:
+            book = self.books[(venue, symbol)] = LocalOrderBook(venue, symbol)
+        book.apply_snapshot(data['bids'], data['asks'], data['sequence'])
+
+    def on_diff(self, venue, symbol, event):
+        self.heard[venue] = self.now
+        book = self.books.get((venue, symbol))
+        if book is not None and book.synced and not book.apply_event(event):
+            book.reset()
+
+    async def on_ticker(self, prices):
+        if self.snapshot is None:
+            coin_list = [x['symbol'] for x in prices['data']['ticker'] if x['symbol'] in symbol_mapping]
+            pairs = structure_triangular_pairs(coin_list)
+            self.snapshot = TickerSnapshot(t_pair[pair] for t_pair in pairs for pair in ('pair_a', 'pair_b', 'pair_c'))
+            index_triangular_pairs(pairs, self.snapshot)
+            self.surface_engine = SurfaceRateEngine(pairs, self.snapshot)
+        self.ticks += 1
+        self.tick_started = time.perf_counter()
+        opportunity = await detect_opportunity(prices, self.snapshot, self.surface_engine)
+        if opportunity is None:
+            return
+        self.opportunities += 1
+        self.attempt = []
+        await execute_arbitrage(opportunity, mode=self.mode)
+        if self.attempt and all(state == "filled" for state in self.attempt):
+            self.hits += 1
+        self.attempt = None
+
+    async def run(self):
+        global order_book_streams, balance_ledger, execution_mode, quote_clock
+        saved_gateways = dict(gateways)
+        saved_streams = order_book_streams
+        saved_ledger = balance_ledger
+        saved_mode = execution_mode
+        saved_clock = quote_clock
+        execution_mode = self.mode
+        quote_clock = self.clock
+        saved_mapping = dict(symbol_mapping)
+        saved_connected = dict(order_tracker.stream_connected)
+        order_book_streams = self
+        for venue in saved_gateways:
+            gateways[venue] = SimulatedExchange(venue, self)
+            order_tracker.stream_connected[venue] = True
+
+        first_at = None
+        wall_start = time.perf_counter()
+        try:
+            for record in read_market_recording(self.path):
+                kind = record['kind']
+                self.now = record['t']
+                if kind == "meta":
+                    self.on_meta(record['data'])
+                    continue
+                if self.balances is None:
+                    self.balances = {venue: {} for venue in gateways}
+                if self.start_balances is None:
+                    self.start_balances = {venue: dict(book) for venue, book in self.balances.items()}
+                    balance_ledger = BalanceLedger({venue: dict(book) for venue, book in self.balances.items()})
+
+                if self.speed:
+                    first_at = record['t'] if first_at is None else first_at
+                    delay = (record['t'] - first_at) / self.speed - (time.perf_counter() - wall_start)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+
+                if kind == "ticker":
+                    await self.on_ticker(record['data'])
+                elif kind == "book":
+                    self.on_book(record['venue'], record['symbol'], record['data'])
+                elif kind == "diff":
+                    self.on_diff(record['venue'], record['symbol'], record['data'])
+                elif kind == "fill":
+                    self.recorded_fills += 1
+        finally:
+            gateways.update(saved_gateways)
+            order_book_streams = saved_streams
+            balance_ledger = saved_ledger
+            execution_mode = saved_mode
+            quote_clock = saved_clock
+            symbol_mapping.clear()
+            symbol_mapping.update(saved_mapping)
+            order_tracker.stream_connected.update(saved_connected)
+        return self.report()
+
+    def report(self):
+        inventory_change = {}
+        pnl = 0.0
+        for venue, book in (self.balances or {}).items():
+            for asset in set(book) | set(self.start_balances.get(venue, {})):
+                change = book.get(asset, 0) - self.start_balances[venue].get(asset, 0)
+                if abs(change) < 1e-12:
+                    continue
+                inventory_change[(venue, asset)] = change
+                price = self.value(asset) if self.snapshot is not None else None
+                if price is not None:
+                    pnl += change * price
+        latencies_ms = [latency * 1000 for latency in self.latencies]
+        return {
+            "ticks": self.ticks,
+            "opportunities": self.opportunities,
+            "orders": self.orders,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.opportunities if self.opportunities else 0,
+            "pnl_usdt": pnl,
+            "inventory_change": inventory_change,
+            "recorded_fills": self.recorded_fills,
+            "detection_to_order_ms": {
+                "count": len(latencies_ms),
+                "p50": percentile(latencies_ms, 0.5),
+                "p90": percentile(latencies_ms, 0.9),
+                "p99": percentile(latencies_ms, 0.99),
+                "max": max(latencies_ms) if latencies_ms else None
+            }
+        }
+
+def make_synthetic_recording(path, ticks=200, mispricing_every=20, seed=0, balances=None):
+    # A small BTC/ETH/USDT market with recorded books on every venue and a
+    # leg-3 mispricing injected every `mispricing_every` ticks.
+    rng = random.Random(seed)
+    mapping = {
+        "BTC-USDT": {"Kucoin": "BTC-USDT", "Binance": "BTCUSDT", "OKX": "BTC-USDT-SWAP"},
+        "ETH-USDT": {"Kucoin": "ETH-USDT", "Binance": "ETHUSDT", "OKX": "ETH-USDT-SWAP"},
+        "ETH-BTC": {"Kucoin": "ETH-BTC", "Binance": "ETHBTC", "OKX": "ETH-BTC-SWAP"}
+    }
+    balances = balances or {venue: {"USDT": 10000.0, "BTC": 1.0, "ETH": 10.0} for venue in ("Kucoin", "Binance", "OKX")}
+    recorder = MarketRecorder(path)
+    started_at = 1_700_000_000.0
+    recorder.record("meta", None, None, {"symbol_mapping": mapping, "balances": balances}, at=started_at)
+    btc, eth = 60000.0, 3000.0
+    for tick in range(ticks):
+        at = started_at + tick * 0.1
+        btc *= math.exp(rng.gauss(0, 0.0005))
+        eth *= math.exp(rng.gauss(0, 0.0005))
+        mids = {"BTC-USDT": btc, "ETH-USDT": eth, "ETH-BTC": eth / btc}
+        if mispricing_every and tick % mispricing_every == mispricing_every - 1:
+            mids["ETH-BTC"] *= 0.99
+        for pair, mid in mids.items():
+            levels = make_synthetic_orderbook(mid, 20, tick=mid * 0.0001, seed=rng.randrange(1 << 30))
+            for venue, symbol in mapping[pair].items():
+                recorder.record("book", venue, symbol, dict(levels, sequence=tick), at=at)
+        recorder.record("ticker", "Kucoin", None, {"data": {"ticker": [
+            {"symbol": pair, "buy": repr(mid * (1 - 0.0001)), "sell": repr(mid * (1 + 0.0001))}
+            for pair, mid in mids.items()]}}, at=at)
+    recorder.flush()
+    return path
+
+def make_synthetic_orderbook(mid, levels, tick=0.01, seed=0):
+    rng = random.Random(seed)
+    return {
+        "bids": [[f"{mid - tick * (i + 1):.8f}", f"{rng.uniform(0.01, 5):.8f}"] for i in range(levels)],
+        "asks": [[f"{mid + tick * (i + 1):.8f}", f"{rng.uniform(0.01, 5):.8f}"] for i in range(levels)]
+    }
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "replay":
+        event_log.start()
+        try:
+            print(asyncio.run(MarketReplay(sys.argv[2], speed=float(sys.argv[3]) if len(sys.argv) > 3 else None).run()))
+        finally:
+            event_log.close()
+    elif len(sys.argv) > 2 and sys.argv[1] == "record-symbols":
+        record_symbol_list_fixture(sys.argv[2])
+    else:
+        initialize()
+        event_log.start()
+        try:
+            asyncio.run(find_arbitrage_opportunities())
+        finally:
+            if market_recorder is not None:
+                market_recorder.flush()
+            event_log.close()
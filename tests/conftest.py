@@ -0,0 +1,51 @@
+import importlib
+import importlib.util
+import json
+import pathlib
+import sys
+
+import pytest
+import websockets
+
+script_path = pathlib.Path(__file__).resolve().parents[1] / "crossplatform-arbot.py"
+
+
+def load_arbot():
+    # The bot is a single script with a dash in its name, so it is loaded by path.
+    if "arbot" in sys.modules:
+        return sys.modules["arbot"]
+    spec = importlib.util.spec_from_file_location("arbot", script_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["arbot"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="session")
+def arbot():
+    return load_arbot()
+
+
+@pytest.fixture(scope="session")
+def benchmarks(arbot):
+    # benchmarks/ sits next to the script rather than on the test path.
+    if str(script_path.parent) not in sys.path:
+        sys.path.insert(0, str(script_path.parent))
+    return importlib.import_module("benchmarks")
+
+
+async def serve_ws_replay(messages):
+    # Local websocket server that sends `messages` to each client, then idles.
+    async def replay(ws, *_):
+        for message in messages:
+            await ws.send(json.dumps(message))
+        await ws.wait_closed()
+
+    server = await websockets.serve(replay, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    return server, f"ws://127.0.0.1:{port}"
+
+
+@pytest.fixture
+def ws_replay():
+    return serve_ws_replay
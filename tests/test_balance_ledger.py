@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+
+class BalanceGateway:
+    # balances() answers with `snapshot`, running `during` while the request is in flight.
+    def __init__(self, snapshot, during=None):
+        self.snapshot = snapshot
+        self.during = during
+        self.calls = 0
+
+    async def balances(self):
+        self.calls += 1
+        if self.during is not None:
+            self.during()
+        await asyncio.sleep(0)
+        return dict(self.snapshot)
+
+
+@pytest.fixture
+def ledger(arbot, monkeypatch):
+    monkeypatch.setattr(arbot, "venue_fee_rates", dict(arbot.venue_fee_rates, Kucoin=0.001))
+    return arbot.BalanceLedger({"Kucoin": {"BTC": 1.0, "USDT": 1000.0}})
+
+
+def test_fills_move_both_assets_net_of_fees(ledger):
+    ledger.apply_fill("Kucoin", "BTC-USDT", "buy", 0.1, 60000.0)
+    ledger.apply_fill("Kucoin", "BTC-USDT", "sell", 0.5, 60000.0)
+
+    assert ledger.available("Kucoin", "BTC") == pytest.approx(1.0 + 0.1 * 0.999 - 0.5)
+    assert ledger.available("Kucoin", "USDT") == pytest.approx(1000.0 - 6000.0 + 30000.0 * 0.999)
+    assert ledger.available("Kucoin", "ETH") == 0
+    ledger.apply_fill("Kucoin", "BTC-USDT", "buy", 0.0, 60000.0)
+    assert ledger.generation["Kucoin"] == 4
+
+
+def test_reconcile_waits_for_open_orders(arbot, ledger, monkeypatch):
+    gateway = BalanceGateway({"BTC": 2.0})
+    monkeypatch.setitem(arbot.gateways, "Kucoin", gateway)
+
+    ledger.reserve("Kucoin")
+    assert asyncio.run(ledger.reconcile("Kucoin")) is False
+    assert gateway.calls == 0
+    ledger.release("Kucoin")
+
+    assert asyncio.run(ledger.reconcile("Kucoin")) is True
+    assert ledger.snapshot() == {"Kucoin": {"BTC": 2.0, "USDT": 0}}
+
+
+def test_snapshot_is_dropped_when_an_order_opens_while_it_is_in_flight(arbot, ledger, monkeypatch):
+    monkeypatch.setitem(arbot.gateways, "Kucoin", BalanceGateway({"BTC": 2.0}, during=lambda: ledger.reserve("Kucoin")))
+
+    assert asyncio.run(ledger.reconcile("Kucoin")) is False
+    assert ledger.available("Kucoin", "BTC") == 1.0
+
+
+def test_snapshot_is_dropped_when_a_fill_lands_while_it_is_in_flight(arbot, ledger, monkeypatch):
+    # The venue read predates the fill, so applying it would undo the fill.
+    def fill():
+        ledger.apply_fill("Kucoin", "BTC-USDT", "sell", 0.5, 60000.0)
+
+    monkeypatch.setitem(arbot.gateways, "Kucoin", BalanceGateway({"BTC": 1.0, "USDT": 1000.0}, during=fill))
+
+    assert asyncio.run(ledger.reconcile("Kucoin")) is False
+    assert ledger.available("Kucoin", "BTC") == pytest.approx(0.5)
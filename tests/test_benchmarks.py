@@ -0,0 +1,41 @@
+import json
+
+import pytest
+
+# Smallest sizes that still exercise every code path; the numbers are not checked.
+small_arguments = {
+    "price_matrix": {"n_pairs": 20, "rounds": 2},
+    "cycle_detector": {"n_bases": 6},
+    "ticker_decoding": {"rounds": 1},
+    "sharded_detection": {"n_bases": 20, "workers_list": (1,), "ticks": 1},
+    "latency_metrics": {"spans": 100},
+    "event_log": {"records": 100},
+    "ticker_snapshot": {"n_bases": 10, "rounds": 1},
+    "structure_triangular_pairs": {"n_pairs": 60, "nested_pairs": 20},
+    "trade_size_solver": {"levels_list": (10,), "books": 2},
+    "sorted_orderbook": {"levels_list": (10,), "queries": 20},
+    "event_loop_lag": {"calls": 2, "call_seconds": 0.005},
+    "order_quantization": {"orders": 100},
+    "incremental_surface": {"n_bases": 30, "ticks": 2},
+    "surface_engine": {"n_bases": 30, "rounds": 1},
+}
+
+
+def test_every_micro_benchmark_has_small_arguments(benchmarks):
+    from benchmarks.micro import micro_benchmarks
+    assert set(micro_benchmarks) == set(small_arguments)
+
+
+@pytest.mark.parametrize("name", sorted(small_arguments))
+def test_micro_benchmark_runs(benchmarks, name):
+    from benchmarks.micro import micro_benchmarks
+    json.dumps(micro_benchmarks[name](**small_arguments[name]))
+
+
+def test_suite_results_compare_against_themselves(benchmarks, tmp_path):
+    from benchmarks.suite import compare_benchmark_results, run_benchmark_suite, write_benchmark_results
+    results = run_benchmark_suite(n_currencies=10, n_pairs=20, depth=5, ticks=2, fill_queries=10)
+    path = write_benchmark_results(results, str(tmp_path / "bench.json"))
+
+    assert results["triangles"] > 0
+    assert compare_benchmark_results(path, path) == {"regressions": [], "improvements": []}
@@ -0,0 +1,36 @@
+import asyncio
+
+
+def test_one_put_wakes_exactly_one_of_two_consumers(arbot):
+    async def scenario():
+        queue = arbot.CoalescingQueue("executions", 4)
+        got = []
+
+        async def consume(name):
+            got.append((name, await queue.get()))
+
+        consumers = [asyncio.create_task(consume(name)) for name in ("a", "b")]
+        await asyncio.sleep(0)
+        queue.put("BTC-ETH-USDT", "arb")
+        await asyncio.sleep(0.05)
+        assert [item for name, item in got] == ["arb"]
+
+        # The losing consumer is still waiting and takes the next item.
+        queue.put("BTC-SOL-USDT", "next")
+        await asyncio.wait_for(asyncio.gather(*consumers), 1)
+        return sorted(item for name, item in got), queue
+
+    items, queue = asyncio.run(scenario())
+    assert items == ["arb", "next"]
+    assert len(queue) == 0
+
+
+def test_put_for_a_waiting_key_replaces_it(arbot):
+    async def scenario():
+        queue = arbot.CoalescingQueue("candidates", 4)
+        queue.put("BTC-ETH-USDT", 1)
+        queue.put("BTC-ETH-USDT", 2)
+        queue.put("BTC-SOL-USDT", 3)
+        return await queue.get_batch()
+
+    assert asyncio.run(scenario()) == [2, 3]
@@ -0,0 +1,58 @@
+import math
+import random
+
+import pytest
+
+
+def test_finds_a_mispriced_triangle_with_its_legs(arbot, monkeypatch):
+    monkeypatch.setattr(arbot, "venue_fee_rates", dict(arbot.venue_fee_rates, Kucoin=0.001))
+    detector = arbot.LogRateCycleDetector(max_length=3, mapping={})
+    touched = []
+    detector.update_pair("Kucoin", "BTC-USDT", 60000, 60010, touched)
+    detector.update_pair("Kucoin", "ETH-USDT", 2999, 3000, touched)
+    detector.update_pair("Kucoin", "ETH-BTC", 0.0505, 0.0506, touched)
+
+    cycles = detector.detect(touched)
+
+    assert len(cycles) == 1
+    cycle = cycles[0]
+    expected = 60000 * 0.999 / 3000 * 0.999 * 0.0505 * 0.999
+    assert cycle["profit_loss"] == pytest.approx(expected - 1)
+    legs = {(cycle[f"contract_{leg}"], cycle[f"direction_trade_{leg}"]) for leg in (1, 2, 3)}
+    assert legs == {("BTC-USDT", "base_to_quote"), ("ETH-USDT", "quote_to_base"), ("ETH-BTC", "base_to_quote")}
+    assert detector.detect(touched, min_rate=0.01) == []
+
+
+def test_detect_matches_exhaustive_search(arbot, benchmarks):
+    from benchmarks.synthetic import make_synthetic_market
+    prices, _ = make_synthetic_market(8, seed=3)
+    rng = random.Random(3)
+    detector = arbot.LogRateCycleDetector(max_length=4, mapping={})
+    rows = [(x['symbol'], float(x['buy']), float(x['sell'])) for x in prices['data']['ticker']]
+    for venue in ("Kucoin", "OKX"):
+        for pair, bid, ask in rows:
+            jitter = rng.uniform(0.995, 1.005)
+            detector.update_pair(venue, pair, bid * jitter, ask * jitter, [])
+
+    exhaustive = arbot.enumerate_log_rate_cycles(detector)
+    detected = detector.detect()
+
+    assert exhaustive
+    assert detected[0]["profit_loss"] == pytest.approx(math.exp(-exhaustive[0][0]) - 1, abs=1e-12)
+    # Every reported cycle is a real one, at the rate the exhaustive search gives it.
+    exhaustive_rates = sorted(math.exp(-weight) - 1 for weight, cycle in exhaustive)
+    for opportunity in detected:
+        assert min(abs(rate - opportunity["profit_loss"]) for rate in exhaustive_rates) < 1e-12
+
+
+def test_touched_edges_find_the_cycles_through_them(arbot, monkeypatch):
+    detector = arbot.LogRateCycleDetector(max_length=3, mapping={})
+    detector.update_pair("Kucoin", "BTC-USDT", 60000, 60010, [])
+    detector.update_pair("Kucoin", "ETH-USDT", 2999, 3000, [])
+    detector.update_pair("Kucoin", "ETH-BTC", 0.0499, 0.05, [])
+    assert detector.detect() == []
+
+    touched = []
+    detector.update_pair("Kucoin", "ETH-BTC", 0.0505, 0.0506, touched)
+
+    assert [cycle["cycle_length"] for cycle in detector.detect(touched)] == [3]
@@ -0,0 +1,79 @@
+import json
+import threading
+
+
+def test_writer_encodes_records_from_every_thread(arbot, tmp_path):
+    path = tmp_path / "events.jsonl"
+    log = arbot.EventLog(path=str(path), capacity=100000, flush_seconds=0.01, backups=0, echo=False).start()
+
+    def produce(venue):
+        for i in range(2000):
+            log.log("info", "execute", "order_placed", venue=venue, order_id=i, size=0.01)
+
+    threads = [threading.Thread(target=produce, args=(venue,)) for venue in ("Kucoin", "Binance", "OKX", "Gateway")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    log.close()
+
+    entries = [json.loads(line) for line in path.read_text().splitlines()]
+    assert log.dropped == 0
+    assert log.written == len(entries) == 8000
+    assert entries[0].keys() == {"ts_ns", "level", "stage", "event", "venue", "order_id", "size"}
+    assert sorted(entry["order_id"] for entry in entries if entry["venue"] == "OKX") == list(range(2000))
+
+
+def test_records_past_capacity_are_dropped(arbot):
+    log = arbot.EventLog(path=None, capacity=3, echo=False)
+
+    assert [log.log("info", "feed", "tick", n=i) for i in range(5)] == [True, True, True, False, False]
+    assert log.dropped == 2
+    assert [record[-1] for record in log.drain()] == [{"n": 0}, {"n": 1}, {"n": 2}]
+    assert len(log) == 0
+
+
+def test_drops_are_counted_exactly_across_threads(arbot):
+    log = arbot.EventLog(path=None, capacity=1000, echo=False)
+    accepted = []
+
+    def produce():
+        accepted.append(sum(log.log("info", "feed", "tick", n=i) for i in range(5000)))
+
+    threads = [threading.Thread(target=produce) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(accepted) == len(log) == 1000
+    assert log.dropped == 4 * 5000 - 1000
+
+
+def test_log_without_backups_starts_over_past_max_bytes(arbot, tmp_path):
+    path = tmp_path / "events.jsonl"
+    log = arbot.EventLog(path=str(path), max_bytes=2000, backups=0, echo=False)
+
+    for batch in range(20):
+        for i in range(10):
+            log.log("info", "feed", "tick", batch=batch, n=i)
+        log.flush()
+    log.close()
+
+    assert list(tmp_path.iterdir()) == [path]
+    assert path.stat().st_size <= 2000 + 10 * 200
+    assert log.written == 200
+
+
+def test_log_rotates_into_backups(arbot, tmp_path):
+    path = tmp_path / "events.jsonl"
+    log = arbot.EventLog(path=str(path), max_bytes=2000, backups=2, echo=False)
+
+    for batch in range(20):
+        for i in range(10):
+            log.log("info", "feed", "tick", batch=batch, n=i)
+        log.flush()
+    log.close()
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["events.jsonl", "events.jsonl.1", "events.jsonl.2"]
+    assert json.loads(path.read_text().splitlines()[-1])["batch"] == 19
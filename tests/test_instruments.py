@@ -0,0 +1,70 @@
+import random
+from decimal import Decimal, ROUND_CEILING, ROUND_FLOOR
+
+
+def quantizer_failures(arbot, trials, seed):
+    # Property check of Instrument.order_fields against Decimal arithmetic on
+    # random grids: fields land on the grid, round in the safe direction by
+    # less than a step, leave on-grid values unchanged and reject exactly the
+    # orders under the minimums.
+    rng = random.Random(seed)
+    failures = []
+    for _ in range(trials):
+        tick = f"{rng.choice((1, 5, 25))}e-{rng.randint(0, 8)}"
+        lot = f"{rng.choice((1, 5))}e-{rng.randint(0, 8)}"
+        contract_value = rng.choice((None, "0.01", "0.1", "10"))
+        min_size = rng.choice((0, Decimal(lot) * rng.randint(1, 10)))
+        min_notional = rng.choice((0, 1, 10))
+        instrument = arbot.Instrument("Test", "T", tick, lot, min_size, min_notional, contract_value)
+        tick_d, lot_d = Decimal(tick), Decimal(lot)
+        multiplier = Decimal(contract_value) if contract_value else Decimal(1)
+        side = rng.choice(('buy', 'sell'))
+        on_grid = rng.random() < 0.5
+        if on_grid:
+            price = float(tick_d * rng.randint(1, 10 ** 6))
+            size = float(lot_d * rng.randint(1, 10 ** 6) * multiplier)
+        else:
+            price = rng.uniform(0.5, 2) * 10 ** rng.uniform(-4, 5)
+            size = rng.uniform(0.5, 2) * 10 ** rng.uniform(-4, 4)
+        case = (tick, lot, contract_value, min_size, min_notional, side, size, price)
+
+        requested_size = Decimal(repr(size)) / multiplier
+        requested_price = Decimal(repr(price))
+        size_d = (requested_size / lot_d).quantize(Decimal(1), rounding=ROUND_FLOOR) * lot_d
+        price_d = (requested_price / tick_d).quantize(
+            Decimal(1), rounding=ROUND_CEILING if side == 'sell' else ROUND_FLOOR) * tick_d
+        # Within float noise of the next grid point the quantizer may take it instead.
+        near = Decimal("1e-9") * max(requested_size, requested_price, 1)
+        ambiguous = size_d + lot_d - requested_size <= near or \
+            (price_d - requested_price if side == 'buy' else requested_price - price_d) + tick_d <= near
+        notional = size_d * multiplier * price_d
+        accept = size_d > 0 and price_d > 0 and size_d >= min_size and notional >= min_notional
+        if abs(notional - min_notional) <= near * notional:
+            ambiguous = True
+
+        fields = instrument.order_fields(side, size, price)
+        if fields is None:
+            if accept and not ambiguous:
+                failures.append(("rejected", case))
+            continue
+        size_f, price_f = Decimal(fields[0]), Decimal(fields[1])
+        if size_f % lot_d or price_f % tick_d:
+            failures.append(("off grid", case, fields))
+        elif on_grid and (size_f != requested_size or price_f != requested_price):
+            failures.append(("on grid moved", case, fields))
+        elif not ambiguous and (size_f != size_d or price_f != price_d or not accept):
+            failures.append(("mismatch", case, fields))
+        elif ambiguous and (abs(size_f - size_d) > lot_d or abs(price_f - price_d) > tick_d):
+            failures.append(("mismatch", case, fields))
+    return failures
+
+
+def test_order_fields_match_decimal_rounding(arbot):
+    assert quantizer_failures(arbot, trials=20000, seed=0) == []
+
+
+def test_orders_under_minimums_are_rejected(arbot):
+    instrument = arbot.Instrument("Test", "T", "0.01", "0.001", "0.01", 10)
+    assert instrument.order_fields("buy", 0.005, 30000.0) is None
+    assert instrument.order_fields("buy", 0.0003, 30000.0) is None
+    assert instrument.order_fields("sell", 0.0119, 30000.004) == ("0.011", "30000.01")
@@ -0,0 +1,38 @@
+def ticker(symbol, bid, ask):
+    return {"symbol": symbol, "buy": str(bid), "sell": str(ask)}
+
+
+def test_prometheus_exports_surface_evaluations(arbot):
+    structured_pairs = [arbot.make_t_pair("BTC-USDT", "ETH-USDT", "ETH-BTC")]
+    snapshot = arbot.TickerSnapshot(["BTC-USDT", "ETH-USDT", "ETH-BTC"])
+    arbot.index_triangular_pairs(structured_pairs, snapshot)
+    prices = {"data": {"ticker": [ticker("BTC-USDT", 60000, 60010), ticker("ETH-USDT", 2999, 3000),
+                                  ticker("ETH-BTC", 0.0505, 0.0506)]}}
+    snapshot.update(prices)
+    engine = arbot.SurfaceRateEngine(structured_pairs, snapshot)
+    metrics = arbot.LatencyMetrics()
+    metrics.surface_engine = engine
+
+    engine.top_k(snapshot)
+    engine.top_k(snapshot)
+    text = metrics.prometheus()
+
+    assert "arbot_surface_triangles_evaluated 0\n" in text
+    assert "arbot_surface_triangles_evaluated_total 1\n" in text
+    assert "arbot_surface_ticks_total 2\n" in text
+
+
+def test_summary_goes_to_the_event_log(arbot, capsys):
+    metrics = arbot.LatencyMetrics(enabled=True)
+    metrics.observe("fetch", arbot.time.perf_counter_ns())
+    metrics.reject("score", "stale_quote", 3)
+    metrics.sample_queue("ticks", 4)
+    arbot.event_log.drain()
+
+    metrics.log_summary_once()
+    summary = [record[7] for record in arbot.event_log.drain() if record[2:4] == ("metrics", "summary")]
+
+    assert capsys.readouterr().out == ""
+    assert [values.get("latency") for values in summary if "latency" in values] == ["fetch"]
+    assert {"rejected_at": "score", "reason": "stale_quote", "count": 3} in summary
+    assert {"queue": "ticks", "depth": 4, "max": 4} in summary
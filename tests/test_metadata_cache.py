@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+
+def test_cache_round_trips_and_leaves_no_temp_file(arbot, tmp_path):
+    path = str(tmp_path / "metadata.json")
+    cache = arbot.load_metadata_cache(path)
+    arbot.set_cache_section(cache, "kucoin_symbols", {"BTC-USDT": {"baseIncrement": "0.00000001"}}, now=1000.0)
+    arbot.save_metadata_cache(cache, path)
+
+    loaded = arbot.load_metadata_cache(path)
+    assert loaded == cache
+    assert [p.name for p in tmp_path.iterdir()] == ["metadata.json"]
+
+
+def test_sections_expire_after_their_ttl(arbot):
+    cache = {"version": arbot.metadata_cache_version, "sections": {}}
+    arbot.set_cache_section(cache, "triangles", {"coin_list": [], "cycles": []}, now=1000.0)
+    ttl = arbot.metadata_cache_ttl["triangles"]
+
+    assert arbot.get_cache_section(cache, "triangles", now=1000.0 + ttl) is not None
+    assert arbot.get_cache_section(cache, "triangles", now=1000.0 + ttl + 1) is None
+
+
+@pytest.mark.parametrize("content", [{"version": 1, "sections": {"triangles": {}}}, ["not", "a", "cache"], "{broken"])
+def test_old_or_broken_caches_start_empty(arbot, tmp_path, content):
+    path = tmp_path / "metadata.json"
+    path.write_text(content if isinstance(content, str) else json.dumps(content))
+
+    assert arbot.load_metadata_cache(str(path)) == {"version": arbot.metadata_cache_version, "sections": {}}
+
+
+def test_failed_save_keeps_the_previous_file(arbot, tmp_path):
+    path = str(tmp_path / "metadata.json")
+    good = {"version": arbot.metadata_cache_version, "sections": {}}
+    arbot.save_metadata_cache(good, path)
+
+    arbot.save_metadata_cache({"version": arbot.metadata_cache_version, "sections": {"bad": object()}}, path)
+
+    assert arbot.load_metadata_cache(path) == good
+    assert [p.name for p in tmp_path.iterdir()] == ["metadata.json"]
+
+
+def test_symbol_list_fixture_feeds_the_cache_offline(arbot, tmp_path):
+    fixture = tmp_path / "symbols.json"
+    fixture.write_text(json.dumps([{"symbol": "ETH-BTC", "baseIncrement": "0.0001", "priceIncrement": "0.000001",
+                                    "baseMinSize": "0.001", "extra": "dropped"}]))
+    cache = {"version": arbot.metadata_cache_version, "sections": {}}
+
+    symbols = arbot.load_kucoin_symbols(cache, arbot.load_symbol_list_fixture(str(fixture)), now=1000.0)
+
+    assert symbols["ETH-BTC"]["baseIncrement"] == "0.0001"
+    assert "extra" not in symbols["ETH-BTC"]
+    assert arbot.get_cache_section(cache, "kucoin_symbols", now=1000.0) == symbols
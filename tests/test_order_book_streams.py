@@ -0,0 +1,90 @@
+import asyncio
+
+
+async def run_stream(ws_replay, streams, venue, messages, done, timeout=5):
+    server, url = await ws_replay(messages)
+    streams.urls[venue] = url
+    stream = {"Binance": streams.stream_binance, "OKX": streams.stream_okx}[venue]
+    task = asyncio.create_task(stream())
+    try:
+        deadline = asyncio.get_running_loop().time() + timeout
+        while not done():
+            assert asyncio.get_running_loop().time() < deadline, "stream did not reach the expected state"
+            await asyncio.sleep(0.01)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        server.close()
+        await server.wait_closed()
+
+
+def binance_diff(first, last, bids=(), asks=()):
+    return {"data": {"e": "depthUpdate", "E": 1700000000000 + last, "s": "BTCUSDT",
+                     "U": first, "u": last, "b": list(bids), "a": list(asks)}}
+
+
+def binance_snapshots(*snapshots):
+    calls = []
+
+    async def snapshot(symbol):
+        calls.append(symbol)
+        return snapshots[min(len(calls), len(snapshots)) - 1]
+
+    return snapshot, calls
+
+
+def test_binance_buffers_diffs_until_snapshot(arbot, ws_replay):
+    snapshot, calls = binance_snapshots(([["99", "1"]], [["101", "1"]], 100))
+    streams = arbot.OrderBookStreams({"Binance": ["BTCUSDT"]}, snapshot_sources={"Binance": snapshot})
+    book = streams.books[("Binance", "BTCUSDT")]
+    messages = [
+        binance_diff(95, 100, bids=[["98", "5"]]),
+        binance_diff(101, 102, bids=[["99", "2"]]),
+        binance_diff(103, 104, asks=[["101", "0"], ["102", "3"]]),
+    ]
+
+    asyncio.run(run_stream(ws_replay, streams, "Binance", messages,
+                           lambda: book.synced and book.sequence == 104))
+
+    assert calls == ["BTCUSDT"]
+    assert streams.resyncs["Binance"] == 0
+    assert book.bids.levels() == [[99.0, 2.0]]
+    assert book.asks.levels() == [[102.0, 3.0]]
+    assert streams.get_orderbook("Binance", "BTCUSDT") is book
+
+
+def test_binance_gap_resyncs_from_a_new_snapshot(arbot, ws_replay):
+    snapshot, calls = binance_snapshots(([["99", "1"]], [["101", "1"]], 100),
+                                        ([["97", "4"]], [["103", "4"]], 110))
+    streams = arbot.OrderBookStreams({"Binance": ["BTCUSDT"]}, snapshot_sources={"Binance": snapshot})
+    book = streams.books[("Binance", "BTCUSDT")]
+    messages = [
+        binance_diff(101, 102, bids=[["99", "2"]]),
+        binance_diff(110, 111, bids=[["96", "1"]]),
+    ]
+
+    asyncio.run(run_stream(ws_replay, streams, "Binance", messages,
+                           lambda: streams.resyncs["Binance"] == 1 and book.synced and book.sequence == 111))
+
+    assert len(calls) == 2
+    assert book.bids.levels() == [[97.0, 4.0], [96.0, 1.0]]
+    assert book.asks.levels() == [[103.0, 4.0]]
+
+
+def test_okx_gap_drops_book_until_resubscribed(arbot, ws_replay):
+    streams = arbot.OrderBookStreams({"OKX": ["BTC-USDT-SWAP"]})
+    book = streams.books[("OKX", "BTC-USDT-SWAP")]
+    arg = {"channel": "books", "instId": "BTC-USDT-SWAP"}
+    messages = [
+        {"arg": arg, "action": "snapshot",
+         "data": [{"bids": [["99", "1", "0", "1"]], "asks": [["101", "1", "0", "1"]], "seqId": 10, "ts": "1"}]},
+        {"arg": arg, "action": "update",
+         "data": [{"bids": [["99", "2", "0", "1"]], "asks": [], "prevSeqId": 10, "seqId": 11, "ts": "2"}]},
+        {"arg": arg, "action": "update",
+         "data": [{"bids": [], "asks": [["100", "1", "0", "1"]], "prevSeqId": 15, "seqId": 16, "ts": "3"}]},
+    ]
+
+    asyncio.run(run_stream(ws_replay, streams, "OKX", messages, lambda: streams.resyncs["OKX"] == 1))
+
+    assert not book.synced
+    assert streams.get_orderbook("OKX", "BTC-USDT-SWAP") is None
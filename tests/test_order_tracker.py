@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+
+
+def make_user_stream_fixture(exchange, symbol, order_id, size, fills, cancel=False):
+    # Stream messages for one order: open, then one event per partial fill,
+    # ending filled (or canceled when cancel=True).
+    messages = []
+    filled = 0.0
+    steps = [("open", 0.0)] + [("partially_filled", quantity) for quantity in fills]
+    for i, (state, quantity) in enumerate(steps):
+        filled += quantity
+        if i == len(steps) - 1 and (cancel or filled >= size):
+            state = "canceled" if cancel else "filled"
+        if exchange == "Kucoin":
+            event_type = {"open": "open", "partially_filled": "match", "filled": "filled", "canceled": "canceled"}[state]
+            messages.append({"type": "message", "topic": "/spotMarket/tradeOrdersV2", "data": {
+                "symbol": symbol, "orderId": order_id, "type": event_type,
+                "filledSize": str(filled), "size": str(size)}})
+        elif exchange == "OKX":
+            if i == 0:
+                messages.append({"event": "login", "code": "0"})
+            state_name = "live" if state == "open" else state
+            messages.append({"arg": {"channel": "orders", "instType": "ANY"}, "data": [{
+                "instId": symbol, "ordId": order_id, "state": state_name,
+                "accFillSz": str(filled), "sz": str(size)}]})
+    return messages
+
+
+async def stream_until_done(arbot, ws_replay, venue, messages, order_id, symbol):
+    tracker = arbot.OrderTracker()
+    order = tracker.track(venue, symbol, order_id)
+    server, url = await ws_replay(messages)
+    streams = arbot.UserDataStreams(tracker, venues=(venue,), urls={venue: url})
+    task = asyncio.create_task(streams.run_venue(venue))
+    try:
+        state = await asyncio.wait_for(tracker.wait_done(order), 5)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        server.close()
+        await server.wait_closed()
+    return state, order, streams
+
+
+@pytest.mark.parametrize("venue, symbol", [("Kucoin", "BTC-USDT"), ("OKX", "BTC-USDT")])
+def test_partial_fills_end_filled(arbot, ws_replay, monkeypatch, venue, symbol):
+    monkeypatch.setattr(arbot, "api_secret_okx", "secret")
+    messages = make_user_stream_fixture(venue, symbol, "42", 1.0, [0.25, 0.25, 0.5])
+
+    state, order, streams = asyncio.run(stream_until_done(arbot, ws_replay, venue, messages, "42", symbol))
+
+    assert state == "filled"
+    assert order.filled_size == 1.0
+    assert streams.messages[venue] == 4
+
+
+def test_cancel_after_partial_fill(arbot, ws_replay):
+    messages = make_user_stream_fixture("Kucoin", "BTC-USDT", "7", 1.0, [0.4], cancel=True)
+
+    state, order, streams = asyncio.run(stream_until_done(arbot, ws_replay, "Kucoin", messages, "7", "BTC-USDT"))
+
+    assert state == "canceled"
+    assert order.filled_size == 0.4
+
+
+def test_done_orders_ignore_later_events(arbot):
+    tracker = arbot.OrderTracker()
+    order = tracker.track("Kucoin", "BTC-USDT", "1")
+    tracker.update("Kucoin", "1", "filled", 1.0)
+    tracker.update("Kucoin", "1", "partially_filled", 0.5)
+    assert (order.state, order.filled_size) == ("filled", 1.0)
+
+
+def test_early_update_is_claimed_by_track(arbot):
+    tracker = arbot.OrderTracker()
+    tracker.update("Binance", 9, "filled", 2.0, "BTCUSDT")
+
+    order = tracker.track("Binance", "BTCUSDT", 9)
+
+    assert (order.state, order.filled_size) == ("filled", 2.0)
+    assert not tracker.unclaimed
+
+
+def test_unknown_ids_are_bounded(arbot):
+    tracker = arbot.OrderTracker(max_unclaimed=8)
+    tracker.track("OKX", "BTC-USDT-SWAP", "mine")
+    tracker.forget("OKX", "mine")
+    for i in range(100):
+        tracker.update("OKX", f"stop-{i}", "open", 0.0, "BTC-USDT-SWAP")
+    tracker.update("OKX", "mine", "filled", 1.0, "BTC-USDT-SWAP")
+
+    assert not tracker.orders
+    assert len(tracker.unclaimed) == 8
+    assert ("OKX", "stop-0") not in tracker.unclaimed
+    assert ("OKX", "mine") in tracker.unclaimed
+
+
+class TimingOutGateway:
+    # Partially filled at 0.4 until canceled; 0.3 more fills before the cancel lands.
+    def __init__(self):
+        self.canceled = False
+
+    async def cancel_order(self, symbol, order_id):
+        self.canceled = True
+
+    async def order_status(self, symbol, order_id):
+        if self.canceled:
+            return {"state": "canceled", "filled_size": 0.7}
+        return {"state": "partially_filled", "filled_size": 0.4}
+
+
+def test_timeout_applies_fills_that_landed_before_the_cancel(arbot, monkeypatch):
+    monkeypatch.setattr(arbot, "order_tracker", arbot.OrderTracker())
+    monkeypatch.setattr(arbot, "order_timeout_seconds", 0.3)
+    monkeypatch.setattr(arbot, "order_poll_min_seconds", 0.01)
+    monkeypatch.setitem(arbot.gateways, "Kucoin", TimingOutGateway())
+    monkeypatch.setattr(arbot, "balance_ledger", arbot.BalanceLedger({"Kucoin": {"BTC": 1.0, "USDT": 0.0}}))
+    monkeypatch.setattr(arbot, "market_recorder", None)
+
+    filled, filled_size = asyncio.run(arbot.settle_order("Kucoin", "BTC-USDT", "sell", 60000.0, "9"))
+
+    assert (filled, filled_size) == (False, 0.7)
+    assert arbot.balance_ledger.available("Kucoin", "BTC") == pytest.approx(0.3)
+    assert not arbot.order_tracker.orders
@@ -0,0 +1,50 @@
+import pytest
+
+mapping = {
+    "BTC-USDT": {"Kucoin": "BTC-USDT", "Binance": "BTCUSDT", "OKX": "BTC-USDT-SWAP"},
+    "ETH-USDT": {"Kucoin": "ETH-USDT", "Binance": "ETHUSDT", "OKX": "ETH-USDT-SWAP"},
+}
+
+
+@pytest.fixture
+def price_matrix(arbot, monkeypatch):
+    monkeypatch.setattr(arbot, "venue_fee_rates", {"Kucoin": 0.001, "Binance": 0.001, "OKX": 0.0005})
+    matrix = arbot.PriceMatrix(mapping, mapping=mapping)
+    matrix.update("Kucoin", {"code": "200000", "data": {"ticker": [
+        {"symbol": "BTC-USDT", "buy": "59990", "sell": "60000"},
+        {"symbol": "ETH-USDT", "buy": "2999", "sell": "3000"},
+        {"symbol": "DOGE-USDT", "buy": "0.1", "sell": "0.11"}]}})
+    matrix.update("Binance", [{"symbol": "BTCUSDT", "bidPrice": "60300", "askPrice": "60310"},
+                              {"symbol": "ETHUSDT", "bidPrice": "3001", "askPrice": None}])
+    matrix.update("OKX", {"code": "0", "data": [{"instId": "ETH-USDT-SWAP", "bidPx": "3030", "askPx": "3031"}]})
+    return matrix
+
+
+def test_edges_net_both_venue_fees(price_matrix):
+    edges = price_matrix.edges()
+    kucoin, binance, okx = 0, 1, 2
+    btc, eth = 0, 1
+
+    assert edges[kucoin, binance, btc] == pytest.approx(60300 / 60000 * 0.999 * 0.999 - 1)
+    assert edges[kucoin, okx, eth] == pytest.approx(3030 / 3000 * 0.999 * 0.9995 - 1)
+    # Same venue, a missing ask and an unlisted pair are never edges.
+    assert edges[kucoin, kucoin, btc] == -float("inf")
+    assert edges[binance, okx, eth] == -float("inf")
+    assert edges[okx, kucoin, btc] == -float("inf")
+
+
+def test_top_k_ranks_edges_above_the_minimum(price_matrix):
+    opportunities = price_matrix.top_k(k=5, min_edge=0.001)
+
+    assert [(o["pair"], o["buy_venue"], o["sell_venue"]) for o in opportunities] == [
+        ("ETH-USDT", "Kucoin", "OKX"), ("BTC-USDT", "Kucoin", "Binance")]
+    assert opportunities[0]["buy_price"] == 3000.0
+    assert opportunities[0]["sell_symbol"] == "ETH-USDT-SWAP"
+    assert price_matrix.top_k(k=1, min_edge=0.001) == opportunities[:1]
+    assert price_matrix.top_k(min_edge=0.02) == []
+
+
+def test_update_clears_symbols_missing_from_the_new_payload(price_matrix):
+    price_matrix.update("OKX", {"code": "0", "data": []})
+
+    assert [o["sell_venue"] for o in price_matrix.top_k(min_edge=0.001)] == ["Binance"]
@@ -0,0 +1,68 @@
+import asyncio
+import heapq
+
+
+class FakeClock:
+    # Virtual clock for TokenBucket. Each sleeper yields to the loop once per
+    # turn; when the sleeper with the earliest wake-up gets its turn, time
+    # jumps to that wake-up. Sleepers never wait in real time.
+    def __init__(self, start=0.0):
+        self.now = start
+        self.sleepers = []
+
+    def time(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        wake_at = self.now + max(seconds, 0)
+        heapq.heappush(self.sleepers, wake_at)
+        try:
+            while self.now < wake_at:
+                await asyncio.sleep(0)
+                if self.sleepers[0] == wake_at:
+                    self.now = wake_at
+        finally:
+            self.sleepers.remove(wake_at)
+            heapq.heapify(self.sleepers)
+
+
+def make_bucket(arbot, capacity=10, window=10):
+    clock = FakeClock()
+    return arbot.TokenBucket(capacity, window, clock=clock.time, sleep=clock.sleep), clock
+
+
+def test_orders_are_granted_before_queued_market_data(arbot):
+    bucket, clock = make_bucket(arbot)
+    granted = []
+
+    async def acquire(name, weight, priority):
+        await bucket.acquire(weight, priority)
+        granted.append((name, clock.time()))
+
+    async def scenario():
+        await bucket.acquire(10, arbot.PRIORITY_ORDER)
+        await asyncio.gather(acquire("market", 1, arbot.PRIORITY_MARKET_DATA),
+                             acquire("order", 2, arbot.PRIORITY_ORDER))
+
+    asyncio.run(scenario())
+
+    # The order waits 2s for its tokens; market data then also has to leave
+    # its 30% reserve (3 tokens) untouched, so it goes 4s later.
+    assert granted == [("order", 2.0), ("market", 6.0)]
+
+
+def test_retry_after_blocks_every_priority(arbot):
+    bucket, clock = make_bucket(arbot)
+    bucket.observe_headers({"Retry-After": "5"})
+
+    waited = asyncio.run(bucket.acquire(1, arbot.PRIORITY_ORDER))
+
+    assert clock.time() >= 5
+    assert waited >= 5
+
+
+def test_binance_used_weight_header_clamps_tokens(arbot):
+    bucket, clock = make_bucket(arbot, capacity=1200, window=60)
+    bucket.observe_headers({"X-MBX-USED-WEIGHT-1M": "1190"})
+    assert bucket.tokens == 10
+    assert arbot.endpoint_weight("Binance", "tickers") == 4
@@ -0,0 +1,97 @@
+import pytest
+
+
+@pytest.fixture
+def btc_eth_market(arbot, monkeypatch):
+    # BTC/USDT and ETH/USDT at 60000 and 3000, ETH/BTC bid at 0.0505: selling
+    # BTC for USDT, buying ETH and selling it back for BTC returns about 1%.
+    monkeypatch.setitem(arbot.symbol_mapping, "ETH-BTC",
+                        {"Kucoin": "ETH-BTC", "Binance": "ETHBTC", "OKX": "ETH-BTC-SWAP"})
+    monkeypatch.setattr(arbot, "max_trade_sizes", {})
+    monkeypatch.setattr(arbot, "balance_ledger", arbot.BalanceLedger({
+        "Kucoin": {"BTC": 0.5, "USDT": 50000.0, "ETH": 10.0},
+        "Binance": {"BTC": 0.5, "USDT": 50000.0, "ETH": 10.0},
+        "OKX": {}
+    }))
+    book = arbot.SortedOrderBook.from_levels
+    return {
+        ("Kucoin", "BTC-USDT"): book({"bids": [[60000, 1], [59990, 5]], "asks": [[60010, 1], [60020, 5]]}),
+        ("Binance", "ETHUSDT"): book({"bids": [[2999, 50]], "asks": [[3000, 5], [3001, 50]]}),
+        ("Binance", "ETHBTC"): book({"bids": [[0.0505, 8], [0.0501, 50]], "asks": [[0.0506, 50]]}),
+    }
+
+
+def surface_arb(swap_1, swap_2, swap_3, direction_trades):
+    arb = {"swap_1": swap_1, "swap_2": swap_2, "swap_3": swap_3,
+           "contract_1": "BTC-USDT", "contract_2": "ETH-USDT", "contract_3": "ETH-BTC"}
+    arb.update({f"direction_trade_{leg}": trade for leg, trade in enumerate(direction_trades, 1)})
+    return arb
+
+
+def test_leg_path_follows_held_asset(arbot):
+    forward = surface_arb("BTC", "USDT", "ETH", ("base_to_quote", "quote_to_base", "quote_to_base"))
+    assert arbot.surface_leg_path(forward) == [("sell", "BTC", "USDT"), ("buy", "USDT", "ETH"),
+                                               ("sell", "ETH", "BTC")]
+    reverse = surface_arb("USDT", "BTC", "ETH", ("quote_to_base", "base_to_quote", "base_to_quote"))
+    reverse["contract_2"], reverse["contract_3"] = "ETH-BTC", "ETH-USDT"
+    assert arbot.surface_leg_path(reverse) == [("buy", "USDT", "BTC"), ("buy", "BTC", "ETH"),
+                                               ("sell", "ETH", "USDT")]
+    broken = surface_arb("ETH", "USDT", "BTC", ("base_to_quote",) * 3)
+    assert arbot.surface_leg_path(broken) is None
+
+
+def test_real_rate_walks_the_held_asset_path(arbot, btc_eth_market):
+    # The surface labels say leg 1 is "base_to_quote", which used to be read
+    # as a buy; holding BTC, the only tradable leg 1 is a sell.
+    arb = surface_arb("BTC", "USDT", "ETH", ("base_to_quote", "quote_to_base", "quote_to_base"))
+    real = arbot.calculate_real_rate(arb, btc_eth_market)
+
+    assert real is not None
+    assert [real[f"contract_{leg}_direction"] for leg in (1, 2, 3)] == ["sell", "buy", "sell"]
+    assert real["real_rate_perc"] > 0.5
+    # Sized by depth rather than dust: the 8 ETH at the best ETH/BTC bid bind;
+    # below it the cycle no longer pays its fees.
+    assert real["size_3"] == pytest.approx(8, rel=1e-6)
+    assert real["trade_amount"] == pytest.approx(real["size_1"])
+    assert real["real_acquired_coin_t3"] > real["trade_amount"]
+
+
+def test_surface_rate_prices_the_held_asset_path(arbot):
+    # With ETH/BTC bid rich, only BTC -> USDT -> ETH -> BTC pays, and the
+    # surface rate has to be that path's top-of-book product.
+    t_pair = arbot.make_t_pair("BTC-USDT", "ETH-USDT", "ETH-BTC")
+    prices = {"pair_a_bid": 60000.0, "pair_a_ask": 60010.0, "pair_b_bid": 2999.0, "pair_b_ask": 3000.0,
+              "pair_c_bid": 0.0505, "pair_c_ask": 0.0506}
+    surface = arbot.cal_triangular_arb_surface_rate(t_pair, prices)
+
+    keep = 1 - arbot.kucoin_fee_rate
+    expected = 60000.0 * keep / 3000.0 * keep * 0.0505 * keep
+    assert surface["swap_1"] == "BTC"
+    assert [direction for direction, spent, received in arbot.surface_leg_path(surface)] == ["sell", "buy", "sell"]
+    assert surface["acquired_coin_t3"] == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("mode", ["sequential", "simultaneous"])
+def test_leg_sizes_stay_within_spent_asset_balances(arbot, btc_eth_market, monkeypatch, mode):
+    # Binance holds only 6000 USDT, so leg 2 (USDT -> ETH) binds well before depth does.
+    monkeypatch.setattr(arbot, "execution_mode", mode)
+    monkeypatch.setattr(arbot, "balance_ledger", arbot.BalanceLedger({
+        "Kucoin": {"BTC": 0.5}, "Binance": {"USDT": 6000.0, "ETH": 10.0, "BTC": 0.0}, "OKX": {}
+    }))
+    arb = surface_arb("BTC", "USDT", "ETH", ("base_to_quote", "quote_to_base", "quote_to_base"))
+    real = arbot.calculate_real_rate(arb, btc_eth_market)
+
+    assert real is not None
+    for leg, (direction, spent, received) in enumerate(arbot.surface_leg_path(arb), 1):
+        size = real[f"size_{leg}"]
+        amount = size * real[f"expected_price_{leg}"] if direction == "buy" else size
+        assert amount <= arbot.balance_ledger.available(real[f"exchange_{leg}"], spent) * (1 + 1e-9)
+    assert real["size_2"] == pytest.approx(2, rel=1e-6)
+
+
+def test_max_trade_sizes_cap_every_spent_asset(arbot, btc_eth_market, monkeypatch):
+    monkeypatch.setattr(arbot, "max_trade_sizes", {"ETH": 1.0})
+    arb = surface_arb("BTC", "USDT", "ETH", ("base_to_quote", "quote_to_base", "quote_to_base"))
+    real = arbot.calculate_real_rate(arb, btc_eth_market)
+
+    assert real["size_3"] == pytest.approx(1, rel=1e-6)
@@ -0,0 +1,41 @@
+import json
+
+
+def allticker_payload(time_ms=None):
+    rows = [("BTC-USDT", 60000, 60010), ("ETH-USDT", 2999, 3000), ("ETH-BTC", 0.0505, 0.0506)]
+    return json.dumps({"code": "200000", "data": {"time": time_ms, "ticker": [
+        {"symbol": symbol, "buy": str(bid), "sell": str(ask)} for symbol, bid, ask in rows]}}).encode()
+
+
+def make_engine(arbot):
+    structured_pairs = [arbot.make_t_pair("BTC-USDT", "ETH-USDT", "ETH-BTC")]
+    snapshot = arbot.TickerSnapshot(["BTC-USDT", "ETH-USDT", "ETH-BTC"])
+    arbot.index_triangular_pairs(structured_pairs, snapshot)
+    return snapshot, arbot.SurfaceRateEngine(structured_pairs, snapshot)
+
+
+def test_fetch_records_arrival_time(arbot, monkeypatch):
+    class Response:
+        content = allticker_payload()
+        headers = {}
+
+    monkeypatch.setattr(arbot, "quote_clock", lambda: 1000.0)
+    monkeypatch.setattr(arbot.requests, "get", lambda url: Response)
+
+    assert arbot.fetch_ticker_payload("https://example.invalid") == (Response.content, 1000.0)
+
+
+def test_queued_tick_is_aged_from_arrival(arbot, monkeypatch):
+    monkeypatch.setattr(arbot, "quote_clock", lambda: 1000.0)
+    monkeypatch.setattr(arbot, "latency_metrics", arbot.LatencyMetrics())
+    snapshot, engine = make_engine(arbot)
+
+    fresh = arbot.score_tick(allticker_payload(), snapshot, engine, received_at=1000.0)
+    assert [arb["swap_1"] for arb in fresh] == ["BTC"]
+    assert snapshot.received_at == 1000.0
+
+    # Same quotes, but the body sat in the tick queue past the freshness limit.
+    queued_at = 1000.0 - 2 * arbot.ticker_max_age_seconds
+    assert arbot.score_tick(allticker_payload(), snapshot, engine, received_at=queued_at) == []
+    assert snapshot.received_at == queued_at
+    assert arbot.latency_metrics.rejections == {("surface", "ticker_stale"): 1}
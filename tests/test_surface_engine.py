@@ -0,0 +1,87 @@
+import random
+
+import pytest
+
+
+@pytest.fixture
+def synthetic_market(benchmarks):
+    from benchmarks.synthetic import make_synthetic_market
+    # Wide mid noise against a thin spread, so both directions pay somewhere,
+    # and a few zero asks that the scalar path prices as a dead leg.
+    prices, structured_pairs = make_synthetic_market(200, spread=0.0005, seed=7)
+    rng = random.Random(7)
+    for x in rng.sample(prices['data']['ticker'], 20):
+        x['sell'] = "0"
+    return prices, structured_pairs
+
+
+def test_engine_matches_scalar_surface_rate(arbot, benchmarks, synthetic_market):
+    from benchmarks.micro import compare_surface_engine
+    prices, structured_pairs = synthetic_market
+
+    assert compare_surface_engine(structured_pairs, prices) == []
+
+
+def test_comparison_covers_both_directions_and_zero_asks(arbot, synthetic_market):
+    prices, structured_pairs = synthetic_market
+    zero_ask = {x['symbol'] for x in prices['data']['ticker'] if x['sell'] == "0"}
+    hits = [arbot.cal_triangular_arb_surface_rate(t_pair, arbot.get_price_for_t_pair(t_pair, prices))
+            for t_pair in structured_pairs]
+
+    assert {hit['direction'] for hit in hits if hit} == {"forward", "reverse"}
+    assert any(zero_ask & {t_pair['pair_a'], t_pair['pair_b'], t_pair['pair_c']} for t_pair in structured_pairs)
+
+
+def test_incremental_refresh_matches_full_pass(arbot, synthetic_market):
+    import numpy as np
+    prices, structured_pairs = synthetic_market
+    snapshot = arbot.TickerSnapshot(x['symbol'] for x in prices['data']['ticker'])
+    arbot.index_triangular_pairs(structured_pairs, snapshot)
+    snapshot.update(prices)
+    engine = arbot.SurfaceRateEngine(structured_pairs, snapshot)
+    engine.top_k(snapshot, min_rate=0)
+    rng = random.Random(11)
+    tickers = prices['data']['ticker']
+    partial = 0
+
+    # Mostly a handful of moves, which stay incremental, with the odd broad
+    # move that trips the full-pass fallback.
+    for tick in range(30):
+        for x in rng.sample(tickers, len(tickers) // 2 if tick % 10 == 9 else 3):
+            move = rng.uniform(0.99, 1.01)
+            x['buy'] = repr(float(x['buy']) * move)
+            if x['sell'] != "0":
+                x['sell'] = repr(float(x['sell']) * move)
+        snapshot.update(prices)
+        top = engine.top_k(snapshot, k=20, min_rate=0)
+        if engine.evaluated < len(structured_pairs):
+            partial += 1
+        full = arbot.SurfaceRateEngine(structured_pairs, snapshot)
+
+        assert top == full.top_k(snapshot, k=20, min_rate=0)
+        np.testing.assert_array_equal(engine.profit_loss_perc, full.profit_loss_perc)
+
+    assert 0 < partial < 30
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_sharded_detector_matches_in_process_engine(arbot, synthetic_market, workers):
+    prices, structured_pairs = synthetic_market
+    snapshot = arbot.TickerSnapshot(x['symbol'] for x in prices['data']['ticker'])
+    arbot.index_triangular_pairs(structured_pairs, snapshot)
+    rng = random.Random(workers)
+    detector = arbot.ShardedSurfaceDetector(structured_pairs, snapshot, workers=workers, k=20, min_rate=0)
+    try:
+        for _ in range(5):
+            for x in rng.sample(prices['data']['ticker'], 10):
+                x['buy'] = repr(float(x['buy']) * rng.uniform(0.99, 1.01))
+            snapshot.update(prices)
+            engine = arbot.SurfaceRateEngine(structured_pairs, snapshot)
+
+            top = detector.top_k(snapshot)
+
+            assert len(top) == 20
+            assert top == engine.top_k(snapshot, k=20, min_rate=0)
+            assert detector.evaluated == len(structured_pairs)
+    finally:
+        detector.close()
@@ -0,0 +1,40 @@
+import json
+
+import numpy as np
+import pytest
+
+# Kucoin allTickers rows in the shapes the byte scanner has to survive: extra
+# fields, a null and a missing side, escaped symbols and an unwatched row.
+payload = b''.join([
+    b'{"code":"200000","data":{"time":1700000000123,"ticker":[',
+    b'{"symbol":"BTC-USDT","symbolName":"BTC-USDT","buy":"60000.1","bestBidSize":"0.5","sell":"60000.2"},',
+    b'{"symbol":"ETH-USDT","symbolName":"ETH-USDT","buy":null,"sell":"3000"},',
+    b'{"symbol":"ETH-BTC","symbolName":"ETH-BTC","buy":"0.0505"},',
+    b'{"symbol":"XRP\\u002DUSDT","symbolName":"XRP-USDT","buy":"0.5","sell":"0.51"},',
+    b'{"symbol":"SOL\\/USDT","symbolName":"SOL/USDT","buy":"150","sell":"150.1"},',
+    b'{"symbol":"DOGE-USDT","symbolName":"DOGE-USDT","buy":"0.1","sell":"0.11"}',
+    b']}}',
+])
+watched = ["BTC-USDT", "ETH-USDT", "ETH-BTC", "XRP-USDT", "SOL/USDT", "ADA-USDT"]
+
+
+@pytest.mark.parametrize("decoder", ["json", "orjson", "msgspec", "scan"])
+def test_decoders_match_the_dict_path(arbot, decoder):
+    if decoder in ("orjson", "msgspec") and getattr(arbot, decoder) is None:
+        pytest.skip(f"{decoder} is not installed")
+    expected = arbot.TickerSnapshot(watched).update(json.loads(payload), received_at=0.0)
+    decoded = arbot.TickerSnapshot(watched).load_payload(payload, decoder, received_at=0.0)
+
+    np.testing.assert_array_equal(np.array(decoded.bids), np.array(expected.bids))
+    np.testing.assert_array_equal(np.array(decoded.asks), np.array(expected.asks))
+    assert decoded.exchange_time == expected.exchange_time == 1700000000.123
+
+
+def test_dict_path_reads_every_row_shape(arbot):
+    snapshot = arbot.TickerSnapshot(watched).update(json.loads(payload), received_at=0.0)
+    bids = dict(zip(watched, snapshot.bids))
+    asks = dict(zip(watched, snapshot.asks))
+
+    assert (bids["BTC-USDT"], asks["BTC-USDT"]) == (60000.1, 60000.2)
+    assert (bids["XRP-USDT"], bids["SOL/USDT"]) == (0.5, 150.0)
+    assert all(np.isnan(price) for price in (bids["ETH-USDT"], asks["ETH-BTC"], bids["ADA-USDT"]))